@@ -4,7 +4,19 @@ RT DICOM Toolkit - 放射線治療用DICOM匿名化・検証ツールキット
 
 __version__ = '1.0.0'
 
-from .anonymizer import RTDicomAnonymizer
-from .validator import RTDicomValidator
-
 __all__ = ['RTDicomAnonymizer', 'RTDicomValidator']
+
+
+def __getattr__(name):
+    """
+    公開クラスを初回参照時にインポート（PEP 562）
+
+    匿名化ツールのみを使う場合に、検証ツールの依存モジュールを読み込まないようにする。
+    """
+    if name == 'RTDicomAnonymizer':
+        from .anonymizer import RTDicomAnonymizer
+        return RTDicomAnonymizer
+    if name == 'RTDicomValidator':
+        from .validator import RTDicomValidator
+        return RTDicomValidator
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
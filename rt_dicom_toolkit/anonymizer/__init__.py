@@ -2,6 +2,19 @@
 DICOM匿名化機能を提供するモジュール
 """
 
-from .core import RTDicomAnonymizer
+__all__ = ['RTDicomAnonymizer', 'InMemoryAnonymizer']
 
-__all__ = ['RTDicomAnonymizer']
+
+def __getattr__(name):
+    """
+    公開クラスを初回参照時にインポート（PEP 562）
+
+    デーモンへのジョブ投入など、サブモジュールのみを使う場合にpydicomを読み込まないようにする。
+    """
+    if name == 'RTDicomAnonymizer':
+        from .core import RTDicomAnonymizer
+        return RTDicomAnonymizer
+    if name == 'InMemoryAnonymizer':
+        from .memory import InMemoryAnonymizer
+        return InMemoryAnonymizer
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
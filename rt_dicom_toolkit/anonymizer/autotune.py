@@ -0,0 +1,117 @@
+"""
+並列匿名化のワーカー数を自動調整するモジュール（--workers auto）
+
+適切な並列数はストレージ（ローカルSSD・NAS）やCPU数によって大きく異なる。
+少ないワーカー数から始めて一定時間ごとに処理速度とCPU使用率を計測し、処理速度が
+向上する間はワーカー数を倍に増やす。処理速度が頭打ちになった場合、またはCPUを
+使い切った場合は、最も速かったワーカー数に決定する（増やして遅くなった場合は減らす）。
+
+処理速度はバイト/秒で比較する（ジョブは大きいものから投入するため、ファイル/秒は
+処理が進むほど見かけ上速くなる）。ファイルサイズが分からない場合はファイル/秒で比較する。
+"""
+
+import os
+import time
+
+from ..config import DEFAULT_AUTOTUNE_START_WORKERS, DEFAULT_AUTOTUNE_WINDOW_SECONDS, DEFAULT_AUTOTUNE_MIN_GAIN
+
+# CPU使用率（全CPUに対する割合）がこれ以上であればワーカー数を増やさない
+CPU_SATURATION = 0.9
+
+
+class WorkerAutotuner:
+    """完了したジョブの処理速度とCPU使用率から並列数を調整するクラス"""
+
+    def __init__(self, max_workers, start_workers=None, window_seconds=None, min_gain=None):
+        """
+        初期化
+
+        Args:
+            max_workers: ワーカー数の上限（スレッドプールの大きさ）
+            start_workers: 計測を始めるワーカー数（省略時は設定値）
+            window_seconds: 1つのワーカー数で計測する最短の時間（秒、省略時は設定値）
+            min_gain: 頭打ちとみなす処理速度の向上率（省略時は設定値）
+        """
+        self.max_workers = max(1, max_workers)
+        self.target = min(self.max_workers, start_workers or DEFAULT_AUTOTUNE_START_WORKERS)
+        self.window_seconds = DEFAULT_AUTOTUNE_WINDOW_SECONDS if window_seconds is None else window_seconds
+        self.min_gain = DEFAULT_AUTOTUNE_MIN_GAIN if min_gain is None else min_gain
+        self.cpu_count = os.cpu_count() or 1
+        # 調整が終わったか
+        self.settled = False
+        # ワーカー数ごとの計測結果
+        self.history = []
+        # 最も速かった (ワーカー数, 処理速度)
+        self._best = None
+        self._start_window()
+
+    def _start_window(self):
+        """計測区間を開始"""
+        self._window_start = time.perf_counter()
+        self._window_cpu = time.process_time()
+        self._jobs = 0
+        self._files = 0
+        self._bytes = 0
+
+    def resume(self):
+        """計測区間をやり直す（作業キューのバッチなど、間を空けて処理を再開する場合）"""
+        if not self.settled:
+            self._start_window()
+
+    def observe(self, files, size=0):
+        """
+        ジョブの完了を記録し、計測区間が終わった場合はワーカー数を見直す
+
+        Args:
+            files: ジョブで処理したファイル数
+            size: ジョブで処理したファイルの合計サイズ（バイト、不明な場合は0）
+
+        Returns:
+            現在のワーカー数
+        """
+        if self.settled:
+            return self.target
+        self._jobs += 1
+        self._files += files
+        self._bytes += size
+
+        elapsed = time.perf_counter() - self._window_start
+        # 各ワーカーが平均1ジョブ以上を終えるまでは計測を続ける
+        if elapsed < self.window_seconds or self._jobs < self.target:
+            return self.target
+
+        cpu = (time.process_time() - self._window_cpu) / elapsed / self.cpu_count
+        rate = self._bytes / elapsed if self._bytes else self._files / elapsed
+        self.history.append({
+            "ワーカー数": self.target,
+            "ファイル/秒": round(self._files / elapsed, 2),
+            "MB/秒": round(self._bytes / elapsed / 1024 / 1024, 2),
+            "CPU使用率": round(cpu, 3),
+        })
+
+        if self._best is None or rate > self._best[1] * (1 + self.min_gain):
+            self._best = (self.target, rate)
+            if self.target >= self.max_workers or cpu >= CPU_SATURATION:
+                self.settled = True
+            else:
+                self.target = min(self.max_workers, self.target * 2)
+        else:
+            # 頭打ち（または低下）のため最も速かったワーカー数に戻す
+            self.target = self._best[0]
+            self.settled = True
+        self._start_window()
+        return self.target
+
+    def summary(self):
+        """
+        処理サマリーに記録する調整結果を作成
+
+        Returns:
+            決定したワーカー数・調整が終わったか・ワーカー数ごとの計測結果の辞書
+        """
+        return {
+            "ワーカー数": self.target,
+            "上限": self.max_workers,
+            "調整完了": self.settled,
+            "計測": list(self.history),
+        }
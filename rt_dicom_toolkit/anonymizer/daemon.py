@@ -0,0 +1,306 @@
+"""
+常駐型の匿名化デーモンを提供するモジュール
+
+RTDicomAnonymizerとスレッドプールを起動したまま保持し、Unixドメインソケット経由で
+匿名化ジョブ（入力ディレクトリ・出力ディレクトリ・設定）を受け付ける。患者IDの対応表と
+UIDの生成に使う秘密値はジョブをまたいで保持されるため、同じ検査が複数回に分けて届いても
+一貫した匿名化結果になる（UIDの対応表はジョブごとに破棄し、常駐中に大きくならないようにする）。
+resetコマンドで患者IDの対応表とUIDの秘密値を初期化し、新しい対応付けを始められる。進捗は1行1イベントのJSONとしてクライアントに逐次返す。
+入出力の帯域制限（throttleコマンド）は、ジョブの実行中も別の接続から変更できる。
+
+クライアント側の関数（submit_job・send_command）はpydicomを読み込まないため、
+ジョブの投入は軽量なプロセスから行える。
+"""
+
+import os
+import json
+import time
+import socket
+import threading
+import traceback
+import socketserver
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from ..config import DEFAULT_DAEMON_SOCKET, DEFAULT_DAEMON_WORKERS
+
+# ジョブで指定できる匿名化設定（リクエストのキーとRTDicomAnonymizerの属性名）
+JOB_OPTIONS = {
+    "level": "anonymization_level",
+    "private": "private_tags",
+    "keep_structure": "keep_structure",
+    "phi_bloom": "emit_phi_bloom"
+}
+
+
+class _JobRequestHandler(socketserver.StreamRequestHandler):
+    """1接続につき1つのリクエスト（JSON 1行）を処理するハンドラー"""
+
+    def handle(self):
+        daemon = self.server.anonymization_daemon
+        connected = [True]
+
+        def send(event):
+            # クライアントが切断してもジョブは最後まで処理する
+            if not connected[0]:
+                return
+            try:
+                self.wfile.write((json.dumps(event, ensure_ascii=False) + "\n").encode('utf-8'))
+                self.wfile.flush()
+            except OSError:
+                connected[0] = False
+
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+        except ValueError as e:
+            send({"event": "error", "message": f"リクエストを解析できません: {e}"})
+            return
+        daemon.handle_request(request, send)
+
+
+class AnonymizationDaemon:
+    """匿名化ジョブを受け付ける常駐プロセス"""
+
+    def __init__(self, socket_path=None, workers=None, log_func=print):
+        """
+        初期化（匿名化ツールを読み込み、ワーカーを起動できる状態にする）
+
+        Args:
+            socket_path: 待ち受けるUnixドメインソケットのパス（省略時は設定値）
+            workers: ファイルを並列に匿名化するスレッド数（省略時は設定値）
+            log_func: ログ出力関数
+        """
+        from .core import RTDicomAnonymizer
+
+        self.socket_path = Path(socket_path or DEFAULT_DAEMON_SOCKET)
+        self.workers = workers or DEFAULT_DAEMON_WORKERS
+        self.log_func = log_func
+
+        self.anonymizer = RTDicomAnonymizer()
+        self.anonymizer.persist_mappings = True
+        # ジョブの割り当ての計画に使うワーカー数（スレッドプールはデーモンで共有）
+        self.anonymizer.workers = self.workers
+        # ジョブで省略された設定に使う初期値
+        self.defaults = {attribute: getattr(self.anonymizer, attribute) for attribute in JOB_OPTIONS.values()}
+
+        self.executor = None
+        self.server = None
+        self.jobs_done = 0
+        # 設定と対応表を共有するため、ジョブは1つずつ実行する（ジョブ内のファイルは並列）
+        self._job_lock = threading.Lock()
+
+    def handle_request(self, request, send):
+        """
+        リクエストを処理
+
+        Args:
+            request: リクエストの辞書（command: anonymize / ping / throttle / reset / shutdown）
+            send: イベントの辞書をクライアントに送る関数
+        """
+        command = request.get("command", "anonymize")
+        if command == "ping":
+            send({"event": "pong", "pid": os.getpid(), "workers": self.workers, "jobs_done": self.jobs_done,
+                  "limits": self.anonymizer.io_throttle.limits,
+                  "patients": len(self.anonymizer.patient_id_map)})
+        elif command == "reset":
+            # 実行中のジョブの途中で対応が変わらないよう、ジョブの完了を待ってから初期化する
+            with self._job_lock:
+                patients = len(self.anonymizer.patient_id_map)
+                self.anonymizer.clear_patient_id_map()
+                self.anonymizer.clear_uid_map()
+            self.log_func(f"対応表を初期化: 患者 {patients}件")
+            send({"event": "reset", "patients": patients})
+        elif command == "throttle":
+            # 実行中のジョブにもすぐに反映される（ジョブのロックは取らない）
+            throttle = self.anonymizer.io_throttle
+            try:
+                throttle.set_limits(**request.get("limits", {}))
+            except (TypeError, ValueError) as e:
+                send({"event": "error", "message": str(e)})
+                return
+            self.log_func(f"帯域制限を変更: {throttle.describe()}")
+            send({"event": "throttle", "limits": throttle.limits})
+        elif command == "shutdown":
+            send({"event": "shutdown"})
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+        elif command == "anonymize":
+            try:
+                self.run_job(request, send)
+            except Exception as e:
+                self.anonymizer.logger.error(traceback.format_exc())
+                send({"event": "error", "message": str(e)})
+        else:
+            send({"event": "error", "message": f"不明なコマンドです: {command}"})
+
+    def run_job(self, request, send):
+        """
+        匿名化ジョブを実行し、進捗をイベントとして送信
+
+        Args:
+            request: input_dir・output_dir（必須）、log_dir・JOB_OPTIONSのキー（任意）を含む辞書
+            send: イベントの辞書をクライアントに送る関数
+        """
+        from ..utils.file_utils import scan_dicom_files
+        from .scheduling import study_key
+
+        input_dir = Path(request["input_dir"])
+        output_dir = Path(request["output_dir"])
+        log_dir = Path(request.get("log_dir") or self.anonymizer.log_dir)
+        if not input_dir.exists():
+            send({"event": "error", "message": f"入力ディレクトリが存在しません: {input_dir}"})
+            return
+
+        with self._job_lock:
+            start_time = time.perf_counter()
+            for key, attribute in JOB_OPTIONS.items():
+                setattr(self.anonymizer, attribute, request.get(key, self.defaults[attribute]))
+
+            records = scan_dicom_files(input_dir)
+            files = [record["path"] for record in records]
+            send({"event": "start", "input_dir": str(input_dir), "files": len(files)})
+            if not files:
+                send({"event": "done", "成功": 0, "スキップ": 0, "エラー": 0,
+                      "elapsed": time.perf_counter() - start_time})
+                return
+
+            output_dir.mkdir(parents=True, exist_ok=True)
+            run = self.anonymizer.start_run(log_dir, run_id=datetime.now().strftime("%Y%m%d_%H%M%S_%f"))
+
+            def progress(done, total, file_path, detail):
+                send({"event": "progress", "done": done, "total": total,
+                      "file": str(file_path), "status": detail["状態"]})
+
+            try:
+                self.anonymizer.anonymize_files(files, input_dir, output_dir, run,
+                                                executor=self.executor, progress_callback=progress,
+                                                sizes=[record["size"] for record in records],
+                                                studies=[study_key(record) for record in records],
+                                                inodes=[record["inode"] for record in records])
+            finally:
+                summary = self.anonymizer.finish_run(run)
+                # UIDは秘密値から決まるため、対応表のキャッシュはジョブごとに破棄する
+                self.anonymizer.clear_uid_map(rotate_secret=False)
+            self.jobs_done += 1
+
+            elapsed = time.perf_counter() - start_time
+            self.log_func(f"ジョブ完了: {input_dir} ({len(files)}ファイル, {elapsed:.2f}秒)")
+            send({
+                "event": "done",
+                "成功": summary["成功"],
+                "スキップ": summary["スキップ"],
+                "エラー": summary["エラー"],
+                "summary_path": str(run["summary_path"]),
+                "elapsed": elapsed
+            })
+
+    def serve_forever(self):
+        """ソケットで待ち受けを開始（shutdownコマンドまたは割り込みで終了）"""
+        if self.socket_path.exists():
+            if _is_alive(self.socket_path):
+                raise RuntimeError(f"デーモンは既に起動しています: {self.socket_path}")
+            # 前回の異常終了で残ったソケットファイルを削除
+            self.socket_path.unlink()
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            # 待ち受けを始める前から所有者以外が接続できないよう、ソケットは0600で作成する
+            old_umask = os.umask(0o077)
+            try:
+                server = socketserver.ThreadingUnixStreamServer(str(self.socket_path), _JobRequestHandler)
+            finally:
+                os.umask(old_umask)
+            with server:
+                server.daemon_threads = True
+                server.anonymization_daemon = self
+                self.server = server
+                self.log_func(f"匿名化デーモン起動: {self.socket_path} (ワーカー数: {self.workers})")
+                try:
+                    server.serve_forever()
+                except KeyboardInterrupt:
+                    pass
+        finally:
+            self.executor.shutdown()
+            if self.socket_path.exists():
+                self.socket_path.unlink()
+            self.log_func("匿名化デーモン停止")
+
+
+def _is_alive(socket_path):
+    """ソケットの先でデーモンが応答するか確認"""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(str(socket_path))
+        return True
+    except OSError:
+        return False
+
+
+def _request(request, socket_path=None):
+    """
+    デーモンにリクエストを送り、応答イベントを逐次返す
+
+    Args:
+        request: リクエストの辞書
+        socket_path: デーモンのソケットのパス（省略時は設定値）
+
+    Yields:
+        イベントの辞書
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(str(socket_path or DEFAULT_DAEMON_SOCKET))
+        sock.sendall((json.dumps(request, ensure_ascii=False) + "\n").encode('utf-8'))
+        with sock.makefile('r', encoding='utf-8') as stream:
+            for line in stream:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def submit_job(input_dir, output_dir, socket_path=None, **options):
+    """
+    デーモンに匿名化ジョブを投入し、進捗イベントを逐次返す
+
+    Args:
+        input_dir: 入力ディレクトリ
+        output_dir: 出力ディレクトリ
+        socket_path: デーモンのソケットのパス（省略時は設定値）
+        **options: log_dir、およびJOB_OPTIONSのキー（level, private, keep_structure, phi_bloom）
+
+    Yields:
+        イベントの辞書（start / progress / done / error）
+    """
+    request = {"command": "anonymize", "input_dir": str(Path(input_dir).absolute()),
+               "output_dir": str(Path(output_dir).absolute())}
+    for key, value in options.items():
+        if value is not None:
+            request[key] = str(Path(value).absolute()) if key == "log_dir" else value
+    yield from _request(request, socket_path)
+
+
+def set_throttle(socket_path=None, **limits):
+    """
+    デーモンの入出力の帯域制限を変更する（実行中のジョブにも反映）
+
+    Args:
+        socket_path: デーモンのソケットのパス（省略時は設定値）
+        **limits: read_mbps, read_iops, write_mbps, write_iops（省略したものは変更しない、0は無制限）
+
+    Returns:
+        応答イベントのリスト（throttle / error）
+    """
+    return list(_request({"command": "throttle", "limits": limits}, socket_path))
+
+
+def send_command(command, socket_path=None):
+    """
+    デーモンに制御コマンド（ping / reset / shutdown）を送る
+
+    Args:
+        command: コマンド名
+        socket_path: デーモンのソケットのパス（省略時は設定値）
+
+    Returns:
+        応答イベントのリスト
+    """
+    return list(_request({"command": command}, socket_path))
@@ -0,0 +1,124 @@
+"""
+メモリ上のDICOMデータを匿名化するAPIを提供するモジュール
+
+入力のbytes（またはファイルライクオブジェクト）を匿名化し、匿名化後のbytesと
+簡潔な変更記録を返す。ファイルの読み書き・ログファイル・処理サマリーを使用せず、
+匿名化プロファイルは作成時に1回だけ準備するため、サービスへの組み込みや
+大量データの連続処理に向く。複数のスレッドから同時に呼び出すことができる。
+
+UIDの置換値は秘密値と元のUIDから決まるため、UIDの対応表は保持しない（常駐するサービスでも
+メモリ使用量が増えず、元のUIDがメモリに残らない）。匿名化後の患者IDは連番のため、
+患者IDの対応表だけは呼び出しをまたいで保持する。区切りのよいところでreset()を呼び出す。
+"""
+
+import io
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pydicom
+from pydicom.errors import InvalidDicomError
+
+from ..config import DEFAULT_DAEMON_WORKERS
+from ..utils.file_utils import looks_like_dicom
+
+
+class InMemoryAnonymizer:
+    """メモリ上のDICOMデータをbytesからbytesへ匿名化するクラス"""
+
+    def __init__(self, anonymizer=None):
+        """
+        初期化（匿名化の設定はRTDicomAnonymizerの属性を使用）
+
+        Args:
+            anonymizer: 設定済みのRTDicomAnonymizerインスタンス（省略時は既定の設定で作成）
+        """
+        if anonymizer is None:
+            from .core import RTDicomAnonymizer
+            anonymizer = RTDicomAnonymizer()
+        self.anonymizer = anonymizer
+        self.profile = anonymizer.get_modified_anonymization_profile()
+        self.remove_private_tags = anonymizer.private_tags == "remove"
+
+    def anonymize(self, data):
+        """
+        DICOMデータを匿名化
+
+        Args:
+            data: DICOMファイルの内容（bytes）またはファイルライクオブジェクト
+
+        Returns:
+            (匿名化後のbytes, 変更記録の辞書) のタプル
+
+        Raises:
+            pydicom.errors.InvalidDicomError: DICOMとして読み込めない場合
+        """
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = io.BytesIO(data)
+        dcm = pydicom.dcmread(data, force=True)
+        if dcm.preamble is None and not looks_like_dicom(dcm):
+            raise InvalidDicomError("DICOMデータではありません")
+
+        # UIDの対応は呼び出しの間だけ保持する（同じ元のUIDは呼び出しをまたいでも同じUIDになる）
+        with self.anonymizer.mapping_scope(persist=False):
+            changes = self.anonymizer.anonymize_dicom(dcm, self.profile, self.remove_private_tags, log=False)
+        self.anonymizer.prepare_for_save(dcm)
+
+        buffer = io.BytesIO()
+        dcm.save_as(buffer)
+        output = buffer.getvalue()
+
+        record = {
+            "modality": str(dcm.get("Modality", "")),
+            "patient_id": str(dcm.get("PatientID", "")),
+            "study_uid": str(dcm.get("StudyInstanceUID", "")),
+            "series_uid": str(dcm.get("SeriesInstanceUID", "")),
+            "sop_instance_uid": str(dcm.get("SOPInstanceUID", "")),
+            "changed_tags": sorted(changes),
+            "size": len(output)
+        }
+        return output, record
+
+    def reset(self):
+        """
+        患者IDの対応表を初期化する
+
+        対応表は匿名化した患者の数だけ大きくなり、元の患者IDを保持する。常駐するサービスでは
+        バッチや日付の区切りなど、同じ患者のデータが続けて届かない時点で呼び出す。
+        初期化後に届いた同じ患者のデータには新しい患者IDが割り当てられる。
+        UIDの置換値は初期化の影響を受けない。
+        """
+        self.anonymizer.clear_patient_id_map()
+
+    def _anonymize_item(self, key, data):
+        """1件を匿名化し、失敗した場合はエラーの記録を返す"""
+        try:
+            output, record = self.anonymize(data)
+            record["status"] = "success"
+        except Exception as e:
+            output, record = None, {"status": "error", "error": str(e)}
+        return key, output, record
+
+    def anonymize_many(self, items, workers=None):
+        """
+        複数のDICOMデータを並列に匿名化し、入力順に結果を返す
+
+        処理待ちの件数をワーカー数の2倍までに抑えるため、大きな入力でもメモリ使用量は一定。
+
+        Args:
+            items: DICOMデータ、または (キー, DICOMデータ) のタプルを返すイテラブル
+            workers: 並列に処理するスレッド数（省略時は設定値）
+
+        Yields:
+            (キー, 匿名化後のbytes, 変更記録の辞書) のタプル。キーを指定しない場合は入力順の番号。
+            失敗した場合は匿名化後のbytesがNoneで、変更記録のstatusが'error'になる
+        """
+        workers = workers or DEFAULT_DAEMON_WORKERS
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for index, item in enumerate(items):
+                key, data = item if isinstance(item, tuple) else (index, item)
+                pending.append(executor.submit(self._anonymize_item, key, data))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
@@ -0,0 +1,56 @@
+"""
+匿名化処理のメトリクスの定義
+
+処理ファイル数・読み書きしたバイト数（モダリティ別）・段階ごとの処理時間・
+処理待ちのファイル数・対応表の大きさと参照のヒット率を、Prometheus形式の
+カウンター・ゲージとして公開する。集計と出力はutils.metrics_utilsを使用する。
+"""
+
+import time
+
+# カウンターの名前と説明
+COUNTERS = {
+    "rt_anonymizer_files_total": "処理したファイル数（status: success/skipped/error）",
+    "rt_anonymizer_modality_files_total": "匿名化に成功したファイル数（モダリティ別）",
+    "rt_anonymizer_bytes_read_total": "匿名化に成功したファイルの入力バイト数（モダリティ別）",
+    "rt_anonymizer_bytes_written_total": "書き出した匿名化ファイルのバイト数（モダリティ別）",
+    "rt_anonymizer_stage_seconds_total": "段階ごとの処理時間の合計（秒）",
+    "rt_anonymizer_files_submitted_total": "ワーカーに投入したファイル数",
+    "rt_anonymizer_files_finished_total": "ワーカーでの処理が終わったファイル数",
+    "rt_anonymizer_throttle_wait_seconds_total": "帯域制限で待った時間の合計（秒、direction: read/write）",
+    "rt_anonymizer_uid_map_lookups_total": "UID対応表の参照回数（result: hit/miss）",
+    "rt_anonymizer_patient_id_lookups_total": "患者ID対応表の参照回数（result: hit/miss）",
+}
+
+# 処理結果とstatusラベルの対応
+STATUS_LABELS = {"成功": "success", "スキップ": "skipped", "エラー": "error"}
+
+
+def attach_metrics(anonymizer, registry=None):
+    """
+    匿名化ツールにメトリクスの記録を設定
+
+    Args:
+        anonymizer: RTDicomAnonymizerインスタンス
+        registry: 記録先のMetricsRegistry（省略時は作成）
+
+    Returns:
+        MetricsRegistryインスタンス
+    """
+    from ..utils.metrics_utils import MetricsRegistry
+
+    registry = registry or MetricsRegistry()
+    for name, help_text in COUNTERS.items():
+        registry.describe(name, "counter", help_text)
+
+    started = time.time()
+    registry.gauge("rt_anonymizer_start_time_seconds", lambda: started, "処理を開始した時刻（UNIX時間）")
+    registry.gauge(
+        "rt_anonymizer_files_in_flight",
+        lambda: registry.value("rt_anonymizer_files_submitted_total") - registry.value("rt_anonymizer_files_finished_total"),
+        "ワーカーに投入して処理が終わっていないファイル数（処理待ちを含む）")
+    registry.gauge("rt_anonymizer_uid_map_entries", lambda: len(anonymizer.uid_map), "UID対応表の件数")
+    registry.gauge("rt_anonymizer_patient_id_map_entries", lambda: len(anonymizer.patient_id_map), "患者ID対応表の件数")
+
+    anonymizer.metrics = registry
+    return registry
@@ -0,0 +1,138 @@
+"""
+並列匿名化のジョブの割り当てを計画するモジュール
+
+RT検査のファイルサイズはCTスライス（数百KB）からRTDOSE・RTIMAGE（数百MB）まで大きく異なる。
+検索順のまま投入すると、最後に大きなファイルが1つのワーカーに残って処理全体の時間が延びるため、
+大きいファイルから先に投入する（LPT: Longest Processing Time first）。
+小さいファイルは数件ずつ1つのジョブにまとめ、ジョブの投入・完了通知のオーバーヘッドを減らす。
+終盤にワーカー間の偏りが出ないよう、まとめる量は1ワーカーあたりの処理量に対して小さく抑える。
+
+検査の情報がある場合は、同じ検査（患者ID・StudyInstanceUID）のファイルをディレクトリと
+iノード番号の順（iノード番号がない場合はパスの順）に1つのジョブにまとめる（plan_study_jobs）。
+ディスク上で近いファイルを続けて読み込み（ジョブ内では後続のファイルを先読みする）、
+UID・患者IDの対応もジョブ内でまとめて求められる。
+"""
+
+import os
+from pathlib import Path
+
+from ..config import DEFAULT_SCHEDULE_SMALL_FILE_BYTES, DEFAULT_SCHEDULE_BATCH_FILES
+
+# まとめたジョブのサイズの上限を、1ワーカーあたりの処理量の何分の1にするか
+TAIL_DIVISOR = 8
+
+# 検査ごとのジョブで、1ワーカーあたりの処理量の何分の1を超える検査を分割するか
+# （検査数がワーカー数で割り切れない場合に、最後の検査を1つのワーカーだけが処理するのを避ける）
+STUDY_SPLIT_DIVISOR = 2
+
+
+def _file_size(file_path):
+    """ファイルサイズを取得（取得できない場合は0）"""
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+
+def plan_jobs(file_paths, sizes=None, workers=1, small_file_bytes=None, batch_files=None):
+    """
+    ファイルをジョブに分け、投入する順に並べる
+
+    Args:
+        file_paths: 入力ファイルのパスのリスト
+        sizes: file_pathsと同じ順序のファイルサイズのリスト（省略時はファイルから取得）
+        workers: ワーカー数
+        small_file_bytes: このサイズ未満のファイルをまとめる（省略時は設定値）
+        batch_files: 1つのジョブにまとめる最大ファイル数（省略時は設定値）
+
+    Returns:
+        ジョブ（ファイルパスのリスト）のリスト（サイズの大きい順）
+    """
+    small_file_bytes = DEFAULT_SCHEDULE_SMALL_FILE_BYTES if small_file_bytes is None else small_file_bytes
+    batch_files = max(1, batch_files or DEFAULT_SCHEDULE_BATCH_FILES)
+    if sizes is None:
+        sizes = [_file_size(file_path) for file_path in file_paths]
+
+    # 同じサイズのファイルは元の順序（ディレクトリ順）を保つ
+    items = sorted(zip(file_paths, sizes), key=lambda item: item[1], reverse=True)
+    total = sum(size for _, size in items)
+    batch_bytes = min(small_file_bytes * batch_files, max(small_file_bytes, total // (max(1, workers) * TAIL_DIVISOR)))
+
+    # (合計サイズ, ファイルパスのリスト) のリスト
+    jobs = []
+    batch, batch_size = [], 0
+    for file_path, size in items:
+        if size >= small_file_bytes:
+            jobs.append((size, [file_path]))
+            continue
+        if batch and (len(batch) >= batch_files or batch_size + size > batch_bytes):
+            jobs.append((batch_size, batch))
+            batch, batch_size = [], 0
+        batch.append(file_path)
+        batch_size += size
+    if batch:
+        jobs.append((batch_size, batch))
+
+    jobs.sort(key=lambda job: job[0], reverse=True)
+    return [paths for _, paths in jobs]
+
+
+def study_key(record):
+    """
+    検索時の索引情報から検査のキーを作成
+
+    Args:
+        record: scan_dicom_filesが返す索引情報
+
+    Returns:
+        (患者ID, StudyInstanceUID) のタプル（StudyInstanceUIDがない場合はディレクトリ）
+    """
+    return record["patient_id"], record["study_uid"] or str(Path(record["path"]).parent)
+
+
+def plan_study_jobs(file_paths, studies, sizes=None, workers=1, inodes=None):
+    """
+    ファイルを検査ごとのジョブに分け、投入する順に並べる
+
+    同じ検査のファイルはディレクトリとiノード番号の順（iノード番号がない場合はパスの順）に
+    1つのジョブにまとめる。1ワーカーあたりの処理量に対して大きい検査は、その順のまま
+    複数のジョブに分割する。
+
+    Args:
+        file_paths: 入力ファイルのパスのリスト
+        studies: file_pathsと同じ順序の検査のキー（study_keyの値）のリスト
+        sizes: file_pathsと同じ順序のファイルサイズのリスト（省略時はファイルから取得）
+        workers: ワーカー数
+        inodes: file_pathsと同じ順序のiノード番号のリスト（検索時の値、省略可）
+
+    Returns:
+        ジョブ（ファイルパスのリスト）のリスト（サイズの大きい順）
+    """
+    if sizes is None:
+        sizes = [_file_size(file_path) for file_path in file_paths]
+
+    groups = {}
+    for index, (file_path, study, size) in enumerate(zip(file_paths, studies, sizes)):
+        if inodes is not None:
+            order = (str(Path(file_path).parent), inodes[index])
+        else:
+            order = (str(file_path),)
+        groups.setdefault(study, []).append((order, file_path, size))
+    total = sum(sizes)
+    limit = max(1, total // (max(1, workers) * STUDY_SPLIT_DIVISOR))
+
+    # (合計サイズ, ファイルパスのリスト) のリスト
+    jobs = []
+    for items in groups.values():
+        items.sort(key=lambda item: item[0])
+        chunk, chunk_size = [], 0
+        for _, file_path, size in items:
+            if chunk and chunk_size + size > limit:
+                jobs.append((chunk_size, chunk))
+                chunk, chunk_size = [], 0
+            chunk.append(file_path)
+            chunk_size += size
+        jobs.append((chunk_size, chunk))
+
+    jobs.sort(key=lambda job: job[0], reverse=True)
+    return [paths for _, paths in jobs]
@@ -0,0 +1,215 @@
+"""
+DICOM通信（C-STORE）で受信したデータを匿名化して保存するモジュール
+
+受信したデータセットをメモリ上でそのまま匿名化し、匿名化後のデータだけを
+出力ディレクトリに書き込む。PHIを含む原本はディスクに保存されない。
+アソシエーションはpynetdicomが1つずつスレッドで処理し、同時に受け付ける数を
+ワーカー数として制限する。処理サマリーとPHIフィルタはアソシエーション単位で作成する。
+
+pynetdicomが必要（pip install pynetdicom）。
+"""
+
+import threading
+from pathlib import Path
+from datetime import datetime
+
+from ..config import DEFAULT_SCP_AE_TITLE, DEFAULT_SCP_PORT, DEFAULT_SCP_MAX_ASSOCIATIONS
+
+# 匿名化に失敗した場合に返すC-STOREの状態（Error: Cannot understand）
+STATUS_CANNOT_UNDERSTAND = 0xC000
+
+# 保存前に失敗した場合に返すC-STOREの状態（Out of Resources）
+STATUS_OUT_OF_RESOURCES = 0xA700
+
+
+def _import_pynetdicom():
+    """pynetdicomを読み込む（未インストールの場合は導入方法を示す）"""
+    try:
+        import pynetdicom
+    except ImportError as e:
+        raise ImportError("DICOM受信にはpynetdicomが必要です: pip install pynetdicom") from e
+    return pynetdicom
+
+
+def anonymized_output_path(output_dir):
+    """
+    匿名化後の患者IDとSOPインスタンスUIDから出力先を決める関数を作成
+
+    受信データには元のファイル名がなく、原本のUIDをファイル名に使うと識別情報が残るため、
+    匿名化後の値だけを使用する。
+
+    Args:
+        output_dir: 出力ディレクトリ
+
+    Returns:
+        匿名化後のデータセットを受け取り出力先のパスを返す関数
+    """
+    output_dir = Path(output_dir)
+
+    def output_path(dcm):
+        patient_id = str(dcm.get("PatientID", "") or "UNKNOWN")
+        modality = str(dcm.get("Modality", "") or "OT")
+        return output_dir / patient_id / f"{modality}_{dcm.SOPInstanceUID}.dcm"
+
+    return output_path
+
+
+class AnonymizingStorageSCP:
+    """受信したDICOMデータを匿名化して保存するC-STORE SCP"""
+
+    def __init__(self, anonymizer, output_dir=None, log_dir=None, ae_title=None, port=None,
+                 host="", max_associations=None):
+        """
+        初期化
+
+        Args:
+            anonymizer: 設定済みのRTDicomAnonymizerインスタンス
+            output_dir: 出力ディレクトリ（省略時はanonymizer.output_dir）
+            log_dir: ログディレクトリ（省略時はanonymizer.log_dir）
+            ae_title: 受信側のAEタイトル（省略時は設定値）
+            port: 待ち受けポート（省略時は設定値）
+            host: 待ち受けアドレス（省略時はすべてのアドレス）
+            max_associations: 同時に受け付けるアソシエーション数（省略時は設定値）
+        """
+        self.anonymizer = anonymizer
+        self.output_dir = Path(output_dir or anonymizer.output_dir)
+        self.log_dir = Path(log_dir or anonymizer.log_dir)
+        self.ae_title = ae_title or DEFAULT_SCP_AE_TITLE
+        self.port = DEFAULT_SCP_PORT if port is None else port
+        self.host = host
+        self.max_associations = max_associations or DEFAULT_SCP_MAX_ASSOCIATIONS
+
+        # 受信したすべてのアソシエーションで患者ID・UIDの対応を共有
+        self.anonymizer.persist_mappings = True
+        self.output_path = anonymized_output_path(self.output_dir)
+
+        self.server = None
+        self._log_handler = None
+        self._lock = threading.Lock()
+        # アソシエーションごとの実行コンテキスト
+        self._runs = {}
+
+    def _run_for(self, assoc):
+        """アソシエーションの実行コンテキストを取得（なければ作成）"""
+        with self._lock:
+            run = self._runs.get(assoc)
+            if run is None:
+                run_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+                run = self.anonymizer.start_run(self.log_dir, run_id=run_id, log_handler=self._log_handler)
+                self._runs[assoc] = run
+            return run
+
+    def _finish(self, assoc):
+        """アソシエーション終了時にサマリーを書き出す"""
+        with self._lock:
+            run = self._runs.pop(assoc, None)
+        if run is None:
+            return
+        summary = self.anonymizer.finish_run(run)
+        self.anonymizer.log_message(
+            f"受信完了: {assoc.requestor.ae_title} ({summary['処理ファイル数']}件, 成功 {summary['成功']}, "
+            f"エラー {summary['エラー']})")
+
+    def handle_established(self, event):
+        """アソシエーション確立時の処理"""
+        self._run_for(event.assoc)
+        self.anonymizer.log_message(
+            f"アソシエーション確立: {event.assoc.requestor.ae_title} ({event.assoc.requestor.address})")
+
+    def handle_closed(self, event):
+        """アソシエーション解放・中断時の処理"""
+        self._finish(event.assoc)
+
+    def handle_store(self, event):
+        """
+        C-STOREで受信したデータセットを匿名化して保存
+
+        Args:
+            event: pynetdicomのEVT_C_STOREイベント
+
+        Returns:
+            C-STOREの状態コード
+        """
+        try:
+            dcm = event.dataset
+            dcm.file_meta = event.file_meta
+            # 受信データにはプリアンブルがないため、ファイル形式で保存できるよう付与する
+            dcm.preamble = b"\x00" * 128
+        except Exception as e:
+            self.anonymizer.log_message(f"受信データを解析できません: {e}")
+            return STATUS_CANNOT_UNDERSTAND
+
+        run = self._run_for(event.assoc)
+        name = f"{event.assoc.requestor.ae_title}#{event.request.MessageID}"
+        try:
+            detail = self.anonymizer.anonymize_dataset(dcm, name, self.output_path, run)
+        except Exception as e:
+            self.anonymizer.log_message(f"受信データの保存に失敗しました: {e}")
+            return STATUS_OUT_OF_RESOURCES
+        return 0x0000 if detail["状態"] == "成功" else STATUS_CANNOT_UNDERSTAND
+
+    def start(self, block=True):
+        """
+        受信を開始
+
+        Args:
+            block: Trueの場合は停止（割り込み）まで戻らない。Falseの場合はバックグラウンドで受信する
+
+        Returns:
+            ブロックしない場合はpynetdicomのサーバー
+        """
+        pynetdicom = _import_pynetdicom()
+        from pynetdicom import AE, evt, AllStoragePresentationContexts
+        from pynetdicom.sop_class import Verification
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        if self.anonymizer.metrics is not None:
+            self.anonymizer.metrics.gauge("rt_anonymizer_scp_associations", lambda: len(self._runs),
+                                          "受信中のアソシエーション数")
+        session_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self._log_handler = self.anonymizer.create_log_handler(self.log_dir / f"rt_anonymization_log_{session_id}.txt")
+
+        ae = AE(ae_title=self.ae_title)
+        ae.maximum_associations = self.max_associations
+        ae.supported_contexts = AllStoragePresentationContexts
+        ae.add_supported_context(Verification)
+
+        handlers = [
+            (evt.EVT_ESTABLISHED, self.handle_established),
+            (evt.EVT_C_STORE, self.handle_store),
+            (evt.EVT_RELEASED, self.handle_closed),
+            (evt.EVT_ABORTED, self.handle_closed),
+        ]
+        self.anonymizer.log_message(
+            f"DICOM受信開始: {self.ae_title}@{self.host or '*'}:{self.port} → {self.output_dir} "
+            f"(同時アソシエーション数: {self.max_associations}, pynetdicom {pynetdicom.__version__})")
+
+        if not block:
+            self.server = ae.start_server((self.host, self.port), block=False, evt_handlers=handlers)
+            return self.server
+        try:
+            ae.start_server((self.host, self.port), block=True, evt_handlers=handlers)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._close()
+
+    def stop(self):
+        """バックグラウンドで開始した受信を停止"""
+        if self.server is not None:
+            self.server.shutdown()
+            self.server = None
+        self._close()
+
+    def _close(self):
+        """未終了のアソシエーションのサマリーを書き出し、ログを閉じる"""
+        with self._lock:
+            pending = list(self._runs)
+        for assoc in pending:
+            self._finish(assoc)
+        if self._log_handler is not None:
+            self.anonymizer.log_message("DICOM受信終了")
+            self.anonymizer.logger.removeHandler(self._log_handler)
+            self._log_handler.close()
+            self._log_handler = None
@@ -0,0 +1,202 @@
+"""
+匿名化したデータセットをアーカイブに直接書き込む出力先を提供するモジュール
+
+匿名化後のデータセットをメモリ上でファイル形式に変換し、zip（無圧縮）またはtarの
+メンバーとして書き込む。ファイルとして出力してから別途まとめる場合と比べ、納品用の
+アーカイブ作成にかかる書き込みが1回で済む。tarは標準出力にも書き込めるため、
+パイプで転送先に直接送ることができる。
+
+メンバーは匿名化後の患者ID（または患者ID/検査UID）ごとのディレクトリにまとめ、
+最後に全メンバーの索引（index.json）を追加する。
+"""
+
+import io
+import sys
+import json
+import time
+import tarfile
+import zipfile
+import threading
+from pathlib import Path
+from datetime import datetime
+
+# 出力形式
+OUTPUT_FORMATS = ('directory', 'zip', 'tar', 'stdout')
+
+# アーカイブ内のディレクトリのまとめ方
+GROUP_BY_OPTIONS = ('patient', 'study')
+
+# 索引のメンバー名
+INDEX_NAME = "index.json"
+
+
+class ArchiveSink:
+    """匿名化したデータセットをアーカイブのメンバーとして書き込む出力先の基底クラス"""
+
+    def __init__(self, group_by='patient'):
+        """
+        初期化
+
+        Args:
+            group_by: メンバーのまとめ方（'patient' または 'study'）
+        """
+        if group_by not in GROUP_BY_OPTIONS:
+            raise ValueError(f"未対応のまとめ方です: {group_by}")
+        self.group_by = group_by
+        self.entries = []
+        self.location = None
+        self._names = set()
+        self._lock = threading.Lock()
+
+    def _member_name(self, dcm):
+        """匿名化後の値からメンバー名を決める（原本の識別情報を含めない）"""
+        parts = [str(dcm.get("PatientID", "") or "UNKNOWN")]
+        if self.group_by == 'study':
+            parts.append(str(dcm.get("StudyInstanceUID", "") or "UNKNOWN"))
+        modality = str(dcm.get("Modality", "") or "OT")
+        parts.append(f"{modality}_{dcm.get('SOPInstanceUID', '') or len(self.entries)}.dcm")
+        return "/".join(parts)
+
+    def write(self, dcm):
+        """
+        データセットをメンバーとして追加（スレッドから並列に呼び出し可能）
+
+        Args:
+            dcm: 匿名化後のpydicomのデータセット
+
+        Returns:
+            追加したメンバーの情報（name, size, patient_id など）の辞書
+        """
+        buffer = io.BytesIO()
+        dcm.save_as(buffer)
+        data = buffer.getvalue()
+
+        with self._lock:
+            name = self._member_name(dcm)
+            # 同じSOPインスタンスが重複した場合は連番を付けて区別する
+            if name in self._names:
+                stem = name[:-len(".dcm")]
+                counter = 1
+                while f"{stem}_{counter}.dcm" in self._names:
+                    counter += 1
+                name = f"{stem}_{counter}.dcm"
+            self._names.add(name)
+            self._add(name, data)
+            entry = {
+                "name": name,
+                "size": len(data),
+                "patient_id": str(dcm.get("PatientID", "")),
+                "study_uid": str(dcm.get("StudyInstanceUID", "")),
+                "series_uid": str(dcm.get("SeriesInstanceUID", "")),
+                "modality": str(dcm.get("Modality", ""))
+            }
+            self.entries.append(entry)
+        return entry
+
+    def _index(self):
+        """患者・検査ごとにまとめた索引を作成"""
+        groups = {}
+        for entry in self.entries:
+            patient = groups.setdefault(entry["patient_id"], {})
+            patient.setdefault(entry["study_uid"], []).append(entry)
+        return {
+            "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "group_by": self.group_by,
+            "file_count": len(self.entries),
+            "total_size": sum(entry["size"] for entry in self.entries),
+            "patients": {
+                patient_id: {study_uid: [entry["name"] for entry in entries] for study_uid, entries in studies.items()}
+                for patient_id, studies in groups.items()
+            },
+            "files": self.entries
+        }
+
+    def close(self):
+        """
+        索引を追加してアーカイブを閉じる
+
+        Returns:
+            アーカイブの出力先
+        """
+        with self._lock:
+            self._add(INDEX_NAME, json.dumps(self._index(), ensure_ascii=False, indent=2).encode('utf-8'))
+            self._close()
+        return self.location
+
+    def _add(self, name, data):
+        raise NotImplementedError
+
+    def _close(self):
+        raise NotImplementedError
+
+
+class ZipSink(ArchiveSink):
+    """無圧縮のzipに書き込む出力先（画素データは既に圧縮されていることが多いため再圧縮しない）"""
+
+    def __init__(self, path, group_by='patient'):
+        super().__init__(group_by)
+        self.location = Path(path)
+        self.location.parent.mkdir(parents=True, exist_ok=True)
+        self._archive = zipfile.ZipFile(self.location, 'w', compression=zipfile.ZIP_STORED, allowZip64=True)
+
+    def _add(self, name, data):
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_STORED
+        self._archive.writestr(info, data)
+
+    def _close(self):
+        self._archive.close()
+
+
+class TarSink(ArchiveSink):
+    """tarに書き込む出力先（ファイルまたはパイプなどのストリーム）"""
+
+    def __init__(self, path=None, fileobj=None, group_by='patient'):
+        super().__init__(group_by)
+        if fileobj is None:
+            self.location = Path(path)
+            self.location.parent.mkdir(parents=True, exist_ok=True)
+            self._archive = tarfile.open(self.location, mode='w')
+        else:
+            self.location = "標準出力"
+            # シークできないストリームにも書き込めるようストリームモードで開く
+            self._archive = tarfile.open(fileobj=fileobj, mode='w|')
+        self._fileobj = fileobj
+
+    def _add(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = time.time()
+        info.mode = 0o644
+        self._archive.addfile(info, io.BytesIO(data))
+
+    def _close(self):
+        self._archive.close()
+        if self._fileobj is not None:
+            self._fileobj.flush()
+
+
+def open_sink(output_format, output, group_by='patient', stream=None):
+    """
+    出力形式に応じたアーカイブの出力先を作成
+
+    Args:
+        output_format: 'zip'・'tar'・'stdout' のいずれか
+        output: アーカイブのパス（拡張子がない場合はそのディレクトリ内に日時付きの名前で作成）
+        group_by: メンバーのまとめ方（'patient' または 'study'）
+        stream: 'stdout'の場合に書き込むバイナリストリーム（省略時は標準出力）
+
+    Returns:
+        ArchiveSinkインスタンス
+    """
+    if output_format == 'stdout':
+        return TarSink(fileobj=stream or sys.stdout.buffer, group_by=group_by)
+
+    path = Path(output)
+    if path.suffix.lower() != f".{output_format}":
+        path = path / f"rt_anonymized_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{output_format}"
+    if output_format == 'zip':
+        return ZipSink(path, group_by=group_by)
+    if output_format == 'tar':
+        return TarSink(path, group_by=group_by)
+    raise ValueError(f"未対応の出力形式です: {output_format}")
@@ -0,0 +1,175 @@
+"""
+匿名化の段階ごとの処理時間を集計するモジュール
+
+ファイルごとに読み込み・匿名化・UID修正・保存の各段階の時間（time.perf_counterによる
+単調時計）を記録し、段階別・モダリティ別の合計とパーセンタイル（p50/p95/p99）、
+処理時間の長いファイルの一覧を作成する。記録はファイルごとに1回ロックを取るだけで、
+計測自体のオーバーヘッドは時計の読み取りのみ。
+"""
+
+import heapq
+import threading
+
+from ..config import DEFAULT_TIMING_SLOWEST_FILES
+
+# ファイルごとに計測する段階（表示順）。UID修正はprepare_for_save（VRの長さ調整を含む）の時間
+FILE_STAGES = ("読み込み", "匿名化", "UID修正", "保存")
+
+# トレース（Chromeのトレースイベント形式）に記録する段階名
+TRACE_STAGE_NAMES = {
+    "検索": "scan",
+    "読み込み": "read",
+    "匿名化": "anonymize",
+    "UID修正": "fix_uids",
+    "保存": "write",
+}
+
+# サマリーに記録するパーセンタイル
+PERCENTILES = (50, 95, 99)
+
+
+def _percentile(sorted_values, percent):
+    """昇順に並べた値のパーセンタイルを取得（最近接順位法）"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def _distribution(values):
+    """処理時間のリストから合計・パーセンタイル・最大値を集計"""
+    values = sorted(values)
+    result = {"合計": round(sum(values), 6)}
+    for percent in PERCENTILES:
+        result[f"p{percent}"] = round(_percentile(values, percent), 6)
+    result["最大"] = round(values[-1], 6) if values else 0.0
+    return result
+
+
+class StageTimings:
+    """段階ごとの処理時間をファイル単位で集計するクラス（スレッドから並列に記録可能）"""
+
+    def __init__(self, slowest_files=None):
+        """
+        初期化
+
+        Args:
+            slowest_files: 記録する処理時間の長いファイル数（省略時は設定値）
+        """
+        self.slowest_files = DEFAULT_TIMING_SLOWEST_FILES if slowest_files is None else slowest_files
+        # 段階名 → ファイルごとの時間のリスト
+        self.stages = {stage: [] for stage in FILE_STAGES}
+        # モダリティ → 段階名 → ファイルごとの時間のリスト
+        self.modalities = {}
+        # ファイル単位ではない段階（ファイル検索など）の時間
+        self.run_stages = {}
+        # 処理時間の長いファイル（最小ヒープ）
+        self._slowest = []
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def is_slow(self, seconds):
+        """処理時間の長いファイルの一覧に入るか（要素数の計算など追加の計測をするかの判定用）"""
+        if self.slowest_files <= 0:
+            return False
+        with self._lock:
+            return len(self._slowest) < self.slowest_files or seconds > self._slowest[0][0]
+
+    def add_run_stage(self, stage, seconds):
+        """
+        ファイル単位ではない段階の時間を記録
+
+        Args:
+            stage: 段階名（例: 検索）
+            seconds: 処理時間（秒）
+        """
+        with self._lock:
+            self.run_stages[stage] = self.run_stages.get(stage, 0.0) + seconds
+
+    def record(self, name, modality, times, size=None, elements=None):
+        """
+        1ファイルの段階ごとの時間を記録
+
+        Args:
+            name: ファイル名
+            modality: モダリティ
+            times: 段階名 → 処理時間（秒）の辞書（実行しなかった段階は含めない）
+            size: 入力ファイルのサイズ（バイト）
+            elements: データセットの要素数（シーケンス内を含む）
+        """
+        total = sum(times.values())
+        with self._lock:
+            by_modality = self.modalities.setdefault(modality, {stage: [] for stage in FILE_STAGES})
+            for stage, seconds in times.items():
+                self.stages[stage].append(seconds)
+                by_modality[stage].append(seconds)
+
+            if self.slowest_files > 0:
+                self._sequence += 1
+                entry = (total, self._sequence, {
+                    "ファイル名": name,
+                    "モダリティ": modality,
+                    "秒": round(total, 6),
+                    "サイズ": size,
+                    "要素数": elements,
+                    "段階別": {stage: round(seconds, 6) for stage, seconds in times.items()}
+                })
+                if len(self._slowest) < self.slowest_files:
+                    heapq.heappush(self._slowest, entry)
+                elif total > self._slowest[0][0]:
+                    heapq.heapreplace(self._slowest, entry)
+
+    def summary(self, wall_seconds=None):
+        """
+        処理サマリーに追加する集計結果を作成
+
+        Args:
+            wall_seconds: 実行単位全体の経過時間（秒）
+
+        Returns:
+            段階別・モダリティ別の集計と処理時間の長いファイルの一覧の辞書
+        """
+        with self._lock:
+            result = {}
+            if wall_seconds is not None:
+                result["経過時間"] = round(wall_seconds, 3)
+            result["全体の段階"] = {stage: round(seconds, 6) for stage, seconds in self.run_stages.items()}
+            result["段階別"] = {
+                stage: {"ファイル数": len(values), **_distribution(values)}
+                for stage, values in self.stages.items() if values
+            }
+            result["モダリティ別"] = {
+                modality: {
+                    "ファイル数": max(len(values) for values in stages.values()),
+                    **{stage: _distribution(values) for stage, values in stages.items() if values}
+                }
+                for modality, stages in sorted(self.modalities.items())
+            }
+            result["低速ファイル"] = [entry for _, _, entry in sorted(self._slowest, reverse=True)]
+        return result
+
+    def report_lines(self, summary=None):
+        """
+        ログに出力する集計結果の行を作成
+
+        Args:
+            summary: summary()の結果（省略時は作成）
+
+        Returns:
+            表示用の文字列のリスト
+        """
+        summary = summary or self.summary()
+        lines = ["段階別の処理時間（秒）:"]
+        for stage, seconds in summary["全体の段階"].items():
+            lines.append(f"  {stage}: {seconds:.3f}")
+        for stage, stats in summary["段階別"].items():
+            lines.append(f"  {stage}: 合計 {stats['合計']:.3f}, p50 {stats['p50']:.4f}, p95 {stats['p95']:.4f}, "
+                         f"p99 {stats['p99']:.4f}, 最大 {stats['最大']:.4f} ({stats['ファイル数']}ファイル)")
+        slowest = summary["低速ファイル"][:5]
+        if slowest:
+            lines.append(f"処理時間の長いファイル（上位{len(slowest)}件）:")
+            for entry in slowest:
+                size = f"{entry['サイズ'] / 1024:.0f} KB" if entry["サイズ"] is not None else "-"
+                lines.append(f"  {entry['秒']:.3f}秒 {entry['ファイル名']} ({entry['モダリティ']}, {size}, "
+                             f"{entry['要素数']}要素)")
+        return lines
@@ -0,0 +1,361 @@
+"""
+監視フォルダに届いたファイルを逐次匿名化するモジュール
+
+入力ディレクトリをinotify（Linux）またはポーリングで監視し、サイズと更新時刻が
+一定時間変化しなくなった（書き込みが完了した）ファイルをすぐに匿名化する。
+処理サマリーとPHIフィルタはシリーズ単位で作成し、シリーズへの新規ファイルが
+一定時間途絶えた時点で書き出す。患者ID・UIDの対応は監視中のすべてのシリーズで共有する。
+監視元は追加・変更されたファイルに加えて削除・移動されたパスも報告し、処理済みの
+ファイルの記録から取り除く（長期間の監視でも記録が増え続けないようにする）。
+"""
+
+import os
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from ..config import (
+    DEFAULT_WATCH_STABLE_SECONDS, DEFAULT_WATCH_POLL_INTERVAL, DEFAULT_WATCH_FLUSH_SECONDS,
+    DEFAULT_DAEMON_WORKERS
+)
+from ..utils.file_utils import _probe_dicom_file
+
+# 書き込み途中の一時ファイルとして無視する拡張子
+IGNORED_SUFFIXES = ('.part', '.tmp', '.partial')
+
+# シリーズUIDを取得できないファイルをまとめるキー
+UNKNOWN_SERIES = "不明"
+
+
+def _is_candidate(path):
+    """監視対象のファイル名か判定（隠しファイルと一時ファイルは除外）"""
+    name = os.path.basename(path)
+    return not name.startswith('.') and not name.lower().endswith(IGNORED_SUFFIXES)
+
+
+class _PollingSource:
+    """ディレクトリを定期的に走査して変更を検出する監視元"""
+
+    name = "ポーリング"
+
+    def __init__(self, root, interval):
+        self.root = str(root)
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        stack = [self.root]
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file() and _is_candidate(entry.name):
+                        stat = entry.stat()
+                        snapshot[entry.path] = (stat.st_size, stat.st_mtime_ns)
+                except OSError:
+                    continue
+        return snapshot
+
+    def initial_files(self):
+        return list(self.snapshot)
+
+    def changes(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        snapshot = self._scan()
+        changed = [path for path, signature in snapshot.items() if self.snapshot.get(path) != signature]
+        # 削除されたファイル
+        changed.extend(path for path in self.snapshot if path not in snapshot)
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+class _InotifySource:
+    """Linuxのinotifyで変更を検出する監視元（サブディレクトリも再帰的に監視）"""
+
+    name = "inotify"
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_ISDIR = 0x40000000
+    WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self, root):
+        libc_name = ctypes.util.find_library("c")
+        if not libc_name:
+            raise OSError("libcが見つかりません")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.root = str(root)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotifyを初期化できません")
+        self.watches = {}
+        self._initial = self._add_tree(self.root)
+
+    def _add_tree(self, root):
+        """ディレクトリ以下を監視対象に追加し、既に存在するファイルを返す"""
+        files = []
+        for dirpath, _, filenames in os.walk(root):
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(dirpath), self.WATCH_MASK)
+            if wd >= 0:
+                self.watches[wd] = dirpath
+            files.extend(os.path.join(dirpath, name) for name in filenames if _is_candidate(name))
+        return files
+
+    def initial_files(self):
+        return self._initial
+
+    def changes(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        changed = []
+        while True:
+            try:
+                buffer = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, _, length = self.EVENT_HEADER.unpack_from(buffer, offset)
+                offset += self.EVENT_HEADER.size
+                name = buffer[offset:offset + length].rstrip(b"\0")
+                offset += length
+                if mask & self.IN_Q_OVERFLOW:
+                    # イベントが溢れた場合は全体を走査し直す
+                    changed.extend(self._add_tree(self.root))
+                    continue
+                directory = self.watches.get(wd)
+                if directory is None or not name:
+                    continue
+                path = os.path.join(directory, os.fsdecode(name))
+                if mask & self.IN_ISDIR:
+                    # 監視を追加する前に作成されたファイルも拾う
+                    if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                        changed.extend(self._add_tree(path))
+                    elif mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                        # 移動されたディレクトリ内のファイルは個別に報告されないため、ディレクトリを報告する
+                        changed.append(path)
+                elif _is_candidate(path):
+                    changed.append(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """入力ディレクトリを監視し、届いたファイルを逐次匿名化するクラス"""
+
+    def __init__(self, anonymizer, input_dir=None, output_dir=None, log_dir=None, workers=None,
+                 stable_seconds=None, flush_seconds=None, poll_interval=None, use_polling=False):
+        """
+        初期化
+
+        Args:
+            anonymizer: 設定済みのRTDicomAnonymizerインスタンス
+            input_dir: 監視する入力ディレクトリ（省略時はanonymizer.input_dir）
+            output_dir: 出力ディレクトリ（省略時はanonymizer.output_dir）
+            log_dir: ログディレクトリ（省略時はanonymizer.log_dir）
+            workers: 並列に匿名化するスレッド数（省略時は設定値）
+            stable_seconds: 書き込み完了とみなすまでの無変化時間（秒）
+            flush_seconds: シリーズのサマリーを書き出すまでの無入力時間（秒）
+            poll_interval: ポーリング間隔（秒）
+            use_polling: Trueの場合はinotifyを使わずポーリングで監視
+        """
+        self.anonymizer = anonymizer
+        self.input_dir = Path(input_dir or anonymizer.input_dir)
+        self.output_dir = Path(output_dir or anonymizer.output_dir)
+        self.log_dir = Path(log_dir or anonymizer.log_dir)
+        self.workers = workers or DEFAULT_DAEMON_WORKERS
+        self.stable_seconds = DEFAULT_WATCH_STABLE_SECONDS if stable_seconds is None else stable_seconds
+        self.flush_seconds = DEFAULT_WATCH_FLUSH_SECONDS if flush_seconds is None else flush_seconds
+        self.poll_interval = poll_interval or DEFAULT_WATCH_POLL_INTERVAL
+        self.use_polling = use_polling
+
+        # 監視中のシリーズ間で患者ID・UIDの対応を共有
+        self.anonymizer.persist_mappings = True
+
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        # 書き込み完了待ちのファイル: パス -> (サイズと更新時刻, 最後に変化を検出した時刻)
+        self._pending = {}
+        # 匿名化を開始したファイルのサイズと更新時刻（再エクスポートの検出用、削除されたら取り除く）
+        self._processed = {}
+        # 処理中のシリーズ: シリーズキー -> {run, pending, last_activity}
+        self._series = {}
+        self._excluded = [path.resolve() for path in (self.output_dir, self.log_dir)]
+
+    def stop(self):
+        """監視を停止（処理中のファイルとサマリーの書き出しを待ってrunから戻る）"""
+        self._stop_event.set()
+
+    def _create_source(self):
+        """inotifyを優先し、使えない場合はポーリングの監視元を作成"""
+        if not self.use_polling:
+            try:
+                return _InotifySource(self.input_dir)
+            except (OSError, AttributeError) as e:
+                self.anonymizer.log_message(f"inotifyを使用できないためポーリングで監視します: {e}")
+        return _PollingSource(self.input_dir, self.poll_interval)
+
+    def _is_excluded(self, path):
+        """入力ディレクトリ内に出力先・ログディレクトリがある場合はその中を無視"""
+        resolved = Path(path).resolve()
+        return any(resolved == excluded or excluded in resolved.parents for excluded in self._excluded)
+
+    def _touch(self, path, now):
+        """変更を検出したファイルを書き込み完了待ちに登録"""
+        if self._is_excluded(path):
+            return
+        try:
+            stat = os.stat(path)
+        except OSError:
+            # 削除・移動されたファイル（またはディレクトリ）
+            self._forget(path)
+            return
+        signature = (stat.st_size, stat.st_mtime_ns)
+        if self._processed.get(path) == signature:
+            return
+        previous = self._pending.get(path)
+        if previous is None or previous[0] != signature:
+            self._pending[path] = (signature, now)
+
+    def _forget(self, path):
+        """削除・移動されたパス（ディレクトリの場合はその中のファイルも）の記録を取り除く"""
+        self._pending.pop(path, None)
+        if self._processed.pop(path, None) is not None:
+            return
+        prefix = os.path.join(path, "")
+        for records in (self._pending, self._processed):
+            for stale in [key for key in records if key.startswith(prefix)]:
+                del records[stale]
+
+    def _collect_stable(self, now):
+        """サイズと更新時刻が一定時間変化していないファイルを取り出す"""
+        ready = []
+        for path, (signature, since) in list(self._pending.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self._pending[path]
+                continue
+            current = (stat.st_size, stat.st_mtime_ns)
+            if current != signature:
+                self._pending[path] = (current, now)
+            elif now - since >= self.stable_seconds:
+                del self._pending[path]
+                self._processed[path] = signature
+                ready.append(Path(path))
+        return ready
+
+    def _submit(self, executor, file_path, log_handler):
+        """ファイルをシリーズの実行単位に割り当てて匿名化を開始"""
+        record = _probe_dicom_file(file_path)
+        if record is None:
+            self.anonymizer.log_message(f'DICOMファイルではないためスキップ: {file_path.name}')
+            return
+        series_key = record["series_uid"] or UNKNOWN_SERIES
+
+        with self._lock:
+            series = self._series.get(series_key)
+            if series is None:
+                run_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+                run = self.anonymizer.start_run(self.log_dir, run_id=run_id, log_handler=log_handler)
+                series = {"run": run, "pending": 0, "files": 0, "last_activity": time.monotonic()}
+                self._series[series_key] = series
+            series["pending"] += 1
+            series["files"] += 1
+            series["last_activity"] = time.monotonic()
+
+        metrics = self.anonymizer.metrics
+
+        def finished(_):
+            with self._lock:
+                series["pending"] -= 1
+                series["last_activity"] = time.monotonic()
+            if metrics is not None:
+                metrics.inc("rt_anonymizer_files_finished_total")
+
+        if metrics is not None:
+            metrics.inc("rt_anonymizer_files_submitted_total")
+        future = executor.submit(self.anonymizer.anonymize_file, file_path, self.input_dir, self.output_dir,
+                                 series["run"])
+        future.add_done_callback(finished)
+
+    def _flush_series(self, force=False):
+        """新規ファイルが途絶えたシリーズのサマリーを書き出す"""
+        now = time.monotonic()
+        with self._lock:
+            quiet = [key for key, series in self._series.items()
+                     if series["pending"] == 0 and (force or now - series["last_activity"] >= self.flush_seconds)]
+            flushed = [(key, self._series.pop(key)) for key in quiet]
+        for key, series in flushed:
+            summary = self.anonymizer.finish_run(series["run"])
+            self.anonymizer.log_message(
+                f"シリーズ完了: ...{key[-12:]} ({series['files']}ファイル, 成功 {summary['成功']}, "
+                f"スキップ {summary['スキップ']}, エラー {summary['エラー']})")
+
+    def run(self):
+        """監視を開始（stopが呼ばれるか割り込みがあるまで処理を続ける）"""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        session_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+        log_handler = self.anonymizer.create_log_handler(self.log_dir / f"rt_anonymization_log_{session_id}.txt")
+
+        source = self._create_source()
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        if self.anonymizer.metrics is not None:
+            self.anonymizer.metrics.gauge("rt_anonymizer_watch_pending_files", lambda: len(self._pending),
+                                          "書き込み完了待ちのファイル数")
+            self.anonymizer.metrics.gauge("rt_anonymizer_watch_open_series", lambda: len(self._series),
+                                          "サマリー未出力のシリーズ数")
+        self.anonymizer.log_message(
+            f"監視開始 ({source.name}): {self.input_dir} → {self.output_dir} (ワーカー数: {self.workers})")
+        try:
+            now = time.monotonic()
+            for path in source.initial_files():
+                self._touch(path, now)
+
+            while not self._stop_event.is_set():
+                # 書き込み完了待ちのファイルがあれば短い間隔で確認する
+                timeout = min(self.stable_seconds / 2, self.poll_interval) if self._pending else self.poll_interval
+                changed = source.changes(max(timeout, 0.05))
+                now = time.monotonic()
+                for path in changed:
+                    self._touch(path, now)
+                for file_path in self._collect_stable(now):
+                    self._submit(executor, file_path, log_handler)
+                self._flush_series()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            executor.shutdown(wait=True)
+            self._flush_series(force=True)
+            source.close()
+            self.anonymizer.log_message("監視終了")
+            self.anonymizer.logger.removeHandler(log_handler)
+            log_handler.close()
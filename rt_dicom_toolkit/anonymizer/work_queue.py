@@ -0,0 +1,450 @@
+"""
+共有ストレージ上の複数ホストで匿名化を分担するための作業キューを提供するモジュール
+
+入力ディレクトリのスキャン索引を検査（StudyInstanceUID）単位のバッチに分けて
+SQLiteデータベースに登録し、各ホストは期限付きのリース（貸し出し）でバッチを取得する。
+処理中は定期的にリースを延長し、完了したバッチは完了として記録する。
+ホストが異常終了してリースが期限切れになったバッチは、他のホストが再取得する。
+
+同じ検査のファイルは1つのホストがまとめて処理する。UIDの置換値はデータベースに保存した
+共有の秘密値から決めるため、複数の検査で共有されるUID（CTシミュレーションと治療計画の
+検査で共通のFrameOfReferenceUIDなど）も、バッチ・ホストをまたいで同じ値に置き換わる。
+匿名化後の患者IDはデータベース上の共有の対応表から払い出すため、ホスト間で重複しない
+（対応表には元の患者IDではなく、ソルト付きハッシュのみを保存する）。
+
+SQLiteのロックはネットワークファイルシステムの実装に依存するため、データベースは
+ロックが正しく機能する共有ストレージ（NFSv4、SMBなど）に置くこと。
+"""
+
+import os
+import json
+import time
+import socket
+import sqlite3
+import hashlib
+import secrets
+import threading
+from pathlib import Path, PurePosixPath
+from datetime import datetime
+from contextlib import contextmanager
+
+from ..config import (
+    DEFAULT_QUEUE_LEASE_SECONDS, DEFAULT_QUEUE_MAX_ATTEMPTS, DEFAULT_QUEUE_POLL_SECONDS,
+    DEFAULT_SCAN_WORKERS
+)
+
+# 匿名化後の患者IDの開始番号（RTDicomAnonymizerの連番と同じ）
+FIRST_PATIENT_ID = 9000001
+
+# 検査UIDを取得できないファイルのバッチキーの接頭辞（親ディレクトリ単位でまとめる）
+UNKNOWN_STUDY_PREFIX = "dir:"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS batches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    group_key TEXT NOT NULL UNIQUE,
+    file_count INTEGER NOT NULL DEFAULT 0,
+    total_size INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    completed_at REAL,
+    result TEXT
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    batch_id INTEGER NOT NULL REFERENCES batches(id),
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_batch ON files(batch_id);
+CREATE TABLE IF NOT EXISTS patients (
+    patient_key TEXT PRIMARY KEY,
+    anonymous_id TEXT NOT NULL UNIQUE
+);
+"""
+
+
+def default_owner():
+    """このプロセスを識別する名前（ホスト名:プロセスID）"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    """SQLiteに保存するリース方式の作業キュー"""
+
+    def __init__(self, db_path, lease_seconds=None, max_attempts=None):
+        """
+        初期化（データベースがなければ作成）
+
+        Args:
+            db_path: SQLiteデータベースのパス（すべてのホストから同じファイルを参照する）
+            lease_seconds: リースの有効期間（秒）
+            max_attempts: 1つのバッチを処理する最大回数（超えた場合は失敗として扱う）
+        """
+        self.db_path = Path(db_path)
+        self.lease_seconds = lease_seconds or DEFAULT_QUEUE_LEASE_SECONDS
+        self.max_attempts = max_attempts or DEFAULT_QUEUE_MAX_ATTEMPTS
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # executescriptは実行前にトランザクションを確定するため、スキーマは単独で作成する
+        db = sqlite3.connect(str(self.db_path), timeout=60)
+        try:
+            db.executescript(SCHEMA)
+        finally:
+            db.close()
+        with self._transaction() as db:
+            db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('salt', ?)", (secrets.token_hex(16),))
+            db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('uid_secret', ?)", (secrets.token_hex(16),))
+
+    @contextmanager
+    def _transaction(self):
+        """書き込みロックを取得したトランザクション（スレッド・プロセスごとに接続を開く）"""
+        db = sqlite3.connect(str(self.db_path), timeout=60, isolation_level=None)
+        try:
+            # ネットワークファイルシステムではWALを使用できないため、既定のジャーナルを使用
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        finally:
+            db.close()
+
+    def _meta(self, db, key):
+        row = db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def populate(self, input_dir, workers=None, log_func=print):
+        """
+        入力ディレクトリをスキャンし、未登録のファイルを検査単位のバッチとして登録
+
+        複数のホストが同時に呼び出した場合は、1つのホストだけがスキャンし、
+        他のホストは登録の完了を待つ。
+
+        Args:
+            input_dir: 入力ディレクトリ（ファイルは入力ディレクトリからの相対パスで登録）
+            workers: ヘッダーを並列に読み込むスレッド数
+            log_func: ログ出力関数
+
+        Returns:
+            新たに登録したファイル数
+        """
+        from ..utils.file_utils import scan_dicom_files
+
+        owner = default_owner()
+        with self._transaction() as db:
+            scanner = self._meta(db, "scan_owner")
+            expires = float(self._meta(db, "scan_expires") or 0)
+            scanning = scanner is not None and scanner != owner and expires > time.time()
+            if not scanning:
+                db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('scan_owner', ?)", (owner,))
+                db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('scan_expires', ?)",
+                           (str(time.time() + self.lease_seconds),))
+
+        if scanning:
+            log_func(f"他のホストがスキャン中のため待機します: {scanner}")
+            while True:
+                time.sleep(DEFAULT_QUEUE_POLL_SECONDS)
+                with self._transaction() as db:
+                    if self._meta(db, "scan_owner") is None:
+                        return 0
+                    if float(self._meta(db, "scan_expires") or 0) <= time.time():
+                        # スキャンしていたホストが異常終了した場合は自分でスキャンする
+                        return self.populate(input_dir, workers, log_func)
+
+        try:
+            input_dir = Path(input_dir)
+            records = scan_dicom_files(input_dir, workers=workers or DEFAULT_SCAN_WORKERS)
+            groups = {}
+            for record in records:
+                relative = PurePosixPath(Path(record["path"]).relative_to(input_dir).as_posix())
+                key = record["study_uid"] or f"{UNKNOWN_STUDY_PREFIX}{relative.parent}"
+                groups.setdefault(key, []).append((str(relative), record["size"]))
+
+            added = 0
+            with self._transaction() as db:
+                for key, files in groups.items():
+                    db.execute("INSERT OR IGNORE INTO batches (group_key) VALUES (?)", (key,))
+                    batch_id = db.execute("SELECT id FROM batches WHERE group_key = ?", (key,)).fetchone()[0]
+                    before = db.total_changes
+                    db.executemany("INSERT OR IGNORE INTO files (path, batch_id, size) VALUES (?, ?, ?)",
+                                   [(path, batch_id, size) for path, size in files])
+                    new_files = db.total_changes - before
+                    if new_files:
+                        added += new_files
+                        # 完了済みの検査にファイルが追加された場合は再処理する
+                        db.execute(
+                            "UPDATE batches SET file_count = (SELECT COUNT(*) FROM files WHERE batch_id = ?), "
+                            "total_size = (SELECT COALESCE(SUM(size), 0) FROM files WHERE batch_id = ?), "
+                            "state = CASE WHEN state = 'leased' THEN state ELSE 'pending' END, attempts = 0 "
+                            "WHERE id = ?", (batch_id, batch_id, batch_id))
+                db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('input_dir', ?)", (str(input_dir),))
+            log_func(f"作業キュー登録: {len(records)}ファイル中 {added}ファイルを追加 ({len(groups)}検査)")
+            return added
+        finally:
+            with self._transaction() as db:
+                db.execute("DELETE FROM meta WHERE key IN ('scan_owner', 'scan_expires')")
+
+    def claim(self, owner):
+        """
+        未処理、またはリースが期限切れのバッチを1つ取得
+
+        Args:
+            owner: 取得するプロセスの名前
+
+        Returns:
+            バッチの辞書（id, group_key, files, sizes, attempts）、取得できるバッチがない場合はNone
+        """
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute(
+                "SELECT id, group_key, attempts, state, owner FROM batches "
+                "WHERE (state = 'pending' OR (state = 'leased' AND lease_expires < ?)) AND attempts < ? "
+                "ORDER BY id LIMIT 1", (now, self.max_attempts)).fetchone()
+            if row is None:
+                # 再試行回数を使い切ったまま期限切れになったバッチは失敗として確定
+                db.execute("UPDATE batches SET state = 'failed' WHERE state = 'leased' AND lease_expires < ? "
+                           "AND attempts >= ?", (now, self.max_attempts))
+                return None
+            batch_id, group_key, attempts, state, previous_owner = row
+            db.execute("UPDATE batches SET state = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1 "
+                       "WHERE id = ?", (owner, now + self.lease_seconds, batch_id))
+            rows = db.execute("SELECT path, size FROM files WHERE batch_id = ? ORDER BY path", (batch_id,)).fetchall()
+        return {
+            "id": batch_id,
+            "group_key": group_key,
+            "files": [path for path, _ in rows],
+            # スキャン時のファイルサイズ（並列処理の割り当てに使う）
+            "sizes": [size for _, size in rows],
+            "attempts": attempts + 1,
+            # 期限切れのリースを引き継いだ場合の前の所有者
+            "reclaimed_from": previous_owner if state == 'leased' else None
+        }
+
+    def renew(self, batch_id, owner):
+        """
+        リースを延長
+
+        Args:
+            batch_id: バッチID
+            owner: リースを保持しているプロセスの名前
+
+        Returns:
+            延長できた場合はTrue（期限切れで他のプロセスに取得された場合はFalse）
+        """
+        with self._transaction() as db:
+            cursor = db.execute("UPDATE batches SET lease_expires = ? WHERE id = ? AND owner = ? AND state = 'leased'",
+                                (time.time() + self.lease_seconds, batch_id, owner))
+            return cursor.rowcount == 1
+
+    def complete(self, batch_id, owner, result):
+        """
+        バッチを完了として記録
+
+        Args:
+            batch_id: バッチID
+            owner: リースを保持しているプロセスの名前
+            result: 結果の辞書（件数・サマリーのパスなど）
+
+        Returns:
+            記録できた場合はTrue
+        """
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE batches SET state = 'done', completed_at = ?, result = ?, lease_expires = NULL "
+                "WHERE id = ? AND owner = ? AND state = 'leased'",
+                (time.time(), json.dumps(result, ensure_ascii=False), batch_id, owner))
+            return cursor.rowcount == 1
+
+    def release(self, batch_id, owner, error):
+        """
+        処理に失敗したバッチを返却（再試行回数が残っていれば他のプロセスが再取得する）
+
+        Args:
+            batch_id: バッチID
+            owner: リースを保持しているプロセスの名前
+            error: エラーの内容
+        """
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE batches SET state = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END, "
+                "lease_expires = NULL, result = ? WHERE id = ? AND owner = ? AND state = 'leased'",
+                (self.max_attempts, json.dumps({"エラー": str(error)}, ensure_ascii=False), batch_id, owner))
+
+    def uid_secret(self):
+        """
+        UIDの置換値の生成に使う共有の秘密値を取得
+
+        Returns:
+            秘密値の文字列（すべてのホストで同じ値）
+        """
+        with self._transaction() as db:
+            return self._meta(db, "uid_secret")
+
+    def allocate_patient_id(self, original_id):
+        """
+        元の患者IDに対応する匿名化後の患者IDを共有の対応表から取得（なければ払い出す）
+
+        Args:
+            original_id: 元の患者ID
+
+        Returns:
+            匿名化後の患者ID
+        """
+        with self._transaction() as db:
+            salt = self._meta(db, "salt")
+            key = hashlib.sha256((salt + str(original_id)).encode('utf-8')).hexdigest()
+            row = db.execute("SELECT anonymous_id FROM patients WHERE patient_key = ?", (key,)).fetchone()
+            if row:
+                return row[0]
+            count = db.execute("SELECT COUNT(*) FROM patients").fetchone()[0]
+            anonymous_id = str(FIRST_PATIENT_ID + count)
+            db.execute("INSERT INTO patients (patient_key, anonymous_id) VALUES (?, ?)", (key, anonymous_id))
+            return anonymous_id
+
+    def status(self):
+        """
+        バッチの状態ごとの件数を集計
+
+        Returns:
+            状態（pending / leased / done / failed）をキーとする {batches, files} の辞書
+        """
+        with self._transaction() as db:
+            rows = db.execute("SELECT state, COUNT(*), COALESCE(SUM(file_count), 0) FROM batches GROUP BY state")
+            return {state: {"batches": batches, "files": files} for state, batches, files in rows}
+
+    def is_empty(self):
+        """ファイルが1件も登録されていなければTrue"""
+        with self._transaction() as db:
+            return db.execute("SELECT COUNT(*) FROM files").fetchone()[0] == 0
+
+    def remaining(self):
+        """未完了（未処理・処理中）のバッチ数"""
+        counts = self.status()
+        return sum(counts.get(state, {}).get("batches", 0) for state in ("pending", "leased"))
+
+
+class QueueWorker:
+    """作業キューからバッチを取得して匿名化するワーカー"""
+
+    def __init__(self, anonymizer, queue, input_dir=None, output_dir=None, log_dir=None, owner=None):
+        """
+        初期化
+
+        Args:
+            anonymizer: 設定済みのRTDicomAnonymizerインスタンス
+            queue: WorkQueueインスタンス
+            input_dir: 入力ディレクトリ（ホストごとのマウント位置、省略時はanonymizer.input_dir）
+            output_dir: 出力ディレクトリ（省略時はanonymizer.output_dir）
+            log_dir: ログディレクトリ（省略時はanonymizer.log_dir）
+            owner: このワーカーの名前（省略時はホスト名:プロセスID）
+        """
+        self.anonymizer = anonymizer
+        self.queue = queue
+        self.input_dir = Path(input_dir or anonymizer.input_dir)
+        self.output_dir = Path(output_dir or anonymizer.output_dir)
+        self.log_dir = Path(log_dir or anonymizer.log_dir)
+        self.owner = owner or default_owner()
+
+        # 患者IDはキューの共有対応表から払い出す。UIDはキューの共有の秘密値から決める
+        self.anonymizer.persist_mappings = True
+        self.anonymizer.patient_id_allocator = queue.allocate_patient_id
+        self.anonymizer.set_uid_secret(queue.uid_secret())
+
+    def _heartbeat(self, batch_id, stop_event, lost_event):
+        """処理中にリースを定期的に延長"""
+        interval = max(self.queue.lease_seconds / 3, 1)
+        while not stop_event.wait(interval):
+            if not self.queue.renew(batch_id, self.owner):
+                lost_event.set()
+                return
+
+    def process_batch(self, batch):
+        """
+        1つのバッチを匿名化して完了を記録
+
+        Args:
+            batch: WorkQueue.claimが返したバッチ
+
+        Returns:
+            処理サマリーの辞書
+        """
+        # 対応表のキャッシュだけを破棄する（秘密値は共有のため、置換値はバッチをまたいで変わらない）
+        self.anonymizer.clear_uid_map(rotate_secret=False)
+
+        file_paths = [self.input_dir / PurePosixPath(path) for path in batch["files"]]
+        run_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_batch{batch['id']}"
+        run = self.anonymizer.start_run(self.log_dir, run_id=run_id)
+
+        stop_event = threading.Event()
+        lost_event = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(batch["id"], stop_event, lost_event), daemon=True)
+        heartbeat.start()
+        try:
+            self.anonymizer.anonymize_files(file_paths, self.input_dir, self.output_dir, run, sizes=batch["sizes"])
+        finally:
+            stop_event.set()
+            heartbeat.join()
+            summary = self.anonymizer.finish_run(run)
+
+        if lost_event.is_set():
+            self.anonymizer.log_message(f"リースが失効したため完了を記録しません: バッチ {batch['id']}")
+            return summary
+        result = {"成功": summary["成功"], "スキップ": summary["スキップ"], "エラー": summary["エラー"],
+                  "owner": self.owner, "summary_path": str(run["summary_path"])}
+        self.queue.complete(batch["id"], self.owner, result)
+        return summary
+
+    def run(self, wait_for_others=True):
+        """
+        取得できるバッチがなくなるまで処理を続ける
+
+        Args:
+            wait_for_others: Trueの場合、他のホストが処理中のバッチが残っている間は待機し、
+                リースが期限切れになれば引き継ぐ
+
+        Returns:
+            処理したバッチ数
+        """
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        if self.anonymizer.metrics is not None:
+            self.anonymizer.metrics.gauge(
+                "rt_anonymizer_work_queue_batches",
+                lambda: [((("state", state),), counts["batches"]) for state, counts in self.queue.status().items()],
+                "作業キューの状態ごとのバッチ数（全ホスト）")
+        processed = 0
+        while True:
+            batch = self.queue.claim(self.owner)
+            if batch is None:
+                if wait_for_others and self.queue.remaining() > 0:
+                    time.sleep(DEFAULT_QUEUE_POLL_SECONDS)
+                    continue
+                break
+
+            if batch["reclaimed_from"]:
+                self.anonymizer.log_message(
+                    f"期限切れのリースを引き継ぎ: バッチ {batch['id']} (前の所有者: {batch['reclaimed_from']})")
+            self.anonymizer.log_message(
+                f"バッチ取得: {batch['id']} ({len(batch['files'])}ファイル, {batch['attempts']}回目)")
+            try:
+                summary = self.process_batch(batch)
+            except Exception as e:
+                self.queue.release(batch["id"], self.owner, e)
+                self.anonymizer.log_message(f"バッチ処理エラー: {batch['id']}: {e}")
+                continue
+            processed += 1
+            self.anonymizer.log_message(
+                f"バッチ完了: {batch['id']} (成功 {summary['成功']}, スキップ {summary['スキップ']}, "
+                f"エラー {summary['エラー']})")
+
+        counts = self.queue.status()
+        self.anonymizer.log_message(
+            f"作業キュー終了: このワーカーで{processed}バッチを処理 "
+            f"(完了 {counts.get('done', {}).get('batches', 0)}, 失敗 {counts.get('failed', {}).get('batches', 0)})")
+        return processed
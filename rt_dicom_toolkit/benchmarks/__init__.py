@@ -0,0 +1,3 @@
+"""
+RT DICOM Toolkit の性能計測ツール
+"""
@@ -0,0 +1,113 @@
+"""
+CLIの起動時間（モジュールのインポート時間）を計測するベンチマーク
+
+各モジュールを新しいPythonプロセスで `-X importtime` 付きでインポートし、
+累積インポート時間の中央値と、読み込まれてはいけない重いモジュールの有無を確認する。
+スケジューラーが検査ごとにCLIを起動するため、起動時間の劣化を防ぐ目的で使用する。
+
+使用例:
+    python -m rt_dicom_toolkit.benchmarks.import_time
+    python -m rt_dicom_toolkit.benchmarks.import_time --runs 10 --budget-ms 800
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+# 計測するモジュールと、インポート時に読み込まれてはいけないモジュール
+IMPORT_TARGETS = {
+    "rt_dicom_toolkit": ["pydicom", "numpy", "pandas", "matplotlib", "rt_dicom_toolkit.validator.core"],
+    "rt_dicom_toolkit.cli": ["pydicom", "numpy", "pandas", "matplotlib", "rt_dicom_toolkit.validator.core"],
+    "rt_dicom_toolkit.anonymizer": ["pandas", "matplotlib", "rt_dicom_toolkit.validator.core"],
+    "rt_dicom_toolkit.validator.core": ["pandas", "matplotlib"],
+}
+
+
+def _run_import(module):
+    """
+    新しいプロセスでモジュールをインポートし、累積インポート時間と読み込まれたモジュールを取得
+
+    Args:
+        module: インポートするモジュール名
+
+    Returns:
+        (累積インポート時間[マイクロ秒], 読み込まれたモジュール名の集合) のタプル
+    """
+    code = f"import sys, {module}; print('\\n'.join(sys.modules))"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            capture_output=True, text=True, check=True)
+
+    # -X importtime の出力（"import time: self | cumulative | name"）から対象モジュールの累積時間を取得
+    cumulative = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            cumulative = int(fields[1])
+    return cumulative, set(result.stdout.split())
+
+
+def measure_import_time(module, runs=5):
+    """
+    モジュールのインポート時間を複数回計測
+
+    Args:
+        module: インポートするモジュール名
+        runs: 計測回数
+
+    Returns:
+        {median_ms, min_ms, loaded} の辞書（loadedは読み込まれたモジュール名の集合）
+    """
+    timings = []
+    loaded = set()
+    for _ in range(runs):
+        cumulative, loaded = _run_import(module)
+        timings.append(cumulative / 1000)
+    return {
+        "median_ms": statistics.median(timings),
+        "min_ms": min(timings),
+        "loaded": loaded
+    }
+
+
+def run_benchmark(runs=5, budget_ms=None, targets=None):
+    """
+    全対象モジュールのインポート時間を計測し、結果を表示
+
+    Args:
+        runs: モジュールごとの計測回数
+        budget_ms: CLI（rt_dicom_toolkit.cli）の許容インポート時間[ミリ秒]（省略時は確認しない）
+        targets: 計測するモジュールと禁止モジュールの辞書（省略時はIMPORT_TARGETS）
+
+    Returns:
+        問題がなければTrue
+    """
+    ok = True
+    for module, forbidden in (targets or IMPORT_TARGETS).items():
+        result = measure_import_time(module, runs)
+        unexpected = [name for name in forbidden if name in result["loaded"]]
+        status = "✅" if not unexpected else "❌"
+        print(f"{status} {module}: 中央値 {result['median_ms']:.1f} ms (最小 {result['min_ms']:.1f} ms)")
+        if unexpected:
+            print(f"  インポート時に読み込まれたモジュール: {', '.join(unexpected)}")
+            ok = False
+        if budget_ms is not None and module == "rt_dicom_toolkit.cli" and result["median_ms"] > budget_ms:
+            print(f"  ❌ 許容時間 {budget_ms:.1f} ms を超えています")
+            ok = False
+    return ok
+
+
+def main():
+    """ベンチマークのコマンドラインエントリーポイント"""
+    parser = argparse.ArgumentParser(description='RT DICOM Toolkit インポート時間ベンチマーク')
+    parser.add_argument('--runs', type=int, default=5, help='モジュールごとの計測回数')
+    parser.add_argument('--budget-ms', type=float, help='CLIモジュールの許容インポート時間[ミリ秒]')
+    args = parser.parse_args()
+
+    sys.exit(0 if run_benchmark(args.runs, args.budget_ms) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,524 @@
+"""
+性能計測用の合成RT検査データを生成するモジュール
+
+実データを使わずに、放射線治療の1検査分（CTシリーズ・RTSTRUCT・RTPLAN・RTDOSE）を
+患者数・スライス数・ROI数などを指定して生成する。患者名・生年月日・施設名などの
+識別情報とプライベートタグ（シーケンス内を含む）を含めるため、匿名化と検証の
+処理量は実データに近くなる。生成した内容は同じパラメータとシードで再現できる。
+
+使用例:
+    python -m rt_dicom_toolkit.benchmarks.synthetic --output /tmp/rt_synthetic --patients 3
+    python -m rt_dicom_toolkit.benchmarks.synthetic --output /tmp/rt_synthetic --ct-slices 200 --compression rle
+"""
+
+import json
+import argparse
+from pathlib import Path
+from datetime import date, timedelta
+
+import numpy as np
+import pydicom
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import generate_uid, ExplicitVRLittleEndian, DeflatedExplicitVRLittleEndian, RLELossless
+
+# 生成パラメータの既定値
+SYNTHETIC_DEFAULTS = {
+    "patients": 2,
+    "ct_slices": 100,
+    "ct_size": 512,
+    "compression": "none",
+    "rois": 20,
+    "contour_points": 200,
+    "dose_frames": 80,
+    "dose_size": 128,
+    "beams": 9,
+    "control_points": 10,
+    "private_tags": True,
+    "seed": 0,
+}
+
+# CTの圧縮方式と転送構文
+COMPRESSION_SYNTAXES = {
+    "none": ExplicitVRLittleEndian,
+    "deflate": DeflatedExplicitVRLittleEndian,
+    "rle": RLELossless,
+}
+
+# 生成内容の記録（同じパラメータで生成済みかの確認に使用）
+SYNTHETIC_INFO_NAME = "synthetic.json"
+
+# SOPクラスUID
+CT_IMAGE_STORAGE = "1.2.840.10008.5.1.4.1.1.2"
+RT_STRUCTURE_SET_STORAGE = "1.2.840.10008.5.1.4.1.1.481.3"
+RT_PLAN_STORAGE = "1.2.840.10008.5.1.4.1.1.481.5"
+RT_DOSE_STORAGE = "1.2.840.10008.5.1.4.1.1.481.2"
+
+# 合成データであることを示すプライベートブロックの作成者
+PRIVATE_CREATOR = "RT_DICOM_TOOLKIT SYNTHETIC"
+
+_LAST_NAMES = ["YAMADA", "SATO", "SUZUKI", "TAKAHASHI", "TANAKA", "WATANABE", "ITO", "NAKAMURA"]
+_FIRST_NAMES = ["TARO", "HANAKO", "ICHIRO", "YUKI", "KENJI", "AKIKO", "HIROSHI", "MEGUMI"]
+
+
+def _new_dataset(sop_class_uid, sop_instance_uid, transfer_syntax=ExplicitVRLittleEndian):
+    """ファイルメタ情報付きの空のデータセットを作成"""
+    file_meta = FileMetaDataset()
+    file_meta.MediaStorageSOPClassUID = sop_class_uid
+    file_meta.MediaStorageSOPInstanceUID = sop_instance_uid
+    file_meta.TransferSyntaxUID = transfer_syntax
+    file_meta.ImplementationClassUID = generate_uid()
+
+    ds = Dataset()
+    ds.file_meta = file_meta
+    ds.preamble = b"\x00" * 128
+    ds.SOPClassUID = sop_class_uid
+    ds.SOPInstanceUID = sop_instance_uid
+    if int(pydicom.__version__.split(".")[0]) < 3:
+        # pydicom 2系は保存時の符号化をデータセットの属性で指定する
+        ds.is_little_endian = True
+        ds.is_implicit_VR = False
+    return ds
+
+
+def _add_common(ds, study, modality, series_uid, series_number, description):
+    """患者・検査・シリーズ・機器の共通情報（識別情報を含む）を追加"""
+    ds.PatientName = study["patient_name"]
+    ds.PatientID = study["patient_id"]
+    ds.PatientBirthDate = study["birth_date"]
+    ds.PatientSex = study["sex"]
+    ds.OtherPatientIDs = f"MRN{study['patient_id']}"
+    ds.PatientAddress = "1-2-3 CHIYODA, TOKYO"
+
+    ds.StudyInstanceUID = study["study_uid"]
+    ds.StudyDate = study["study_date"]
+    ds.StudyTime = "093000"
+    ds.StudyID = study["study_id"]
+    ds.AccessionNumber = study["accession"]
+    ds.StudyDescription = "RT PLANNING"
+    ds.ReferringPhysicianName = "SUZUKI^ICHIRO"
+    ds.InstitutionName = "SYNTHETIC CANCER CENTER"
+    ds.InstitutionAddress = "4-5-6 CHUO, OSAKA"
+    ds.OperatorsName = "TANAKA^KENJI"
+    ds.StationName = "TPS01"
+    ds.Manufacturer = "RT DICOM TOOLKIT"
+
+    ds.Modality = modality
+    ds.SeriesInstanceUID = series_uid
+    ds.SeriesNumber = series_number
+    ds.SeriesDescription = description
+    ds.SeriesDate = study["study_date"]
+    ds.FrameOfReferenceUID = study["frame_uid"]
+    ds.PositionReferenceIndicator = ""
+
+
+def _add_private(ds, index, enabled):
+    """ベンダー固有の情報を模したプライベートタグを追加"""
+    if not enabled:
+        return
+    block = ds.private_block(0x0009, PRIVATE_CREATOR, create=True)
+    block.add_new(0x01, "LO", f"{ds.PatientName}")
+    block.add_new(0x02, "LO", f"WORKSTATION-{index:03d}")
+    block.add_new(0x03, "DS", "1.0")
+
+
+def _ct_phantom(size, rng):
+    """水等価の楕円ファントムのCT画像（HU値）を作成"""
+    y, x = np.ogrid[:size, :size]
+    center = size / 2
+    body = ((x - center) / (size * 0.42)) ** 2 + ((y - center) / (size * 0.32)) ** 2 <= 1
+    image = np.full((size, size), -1000, dtype=np.int16)
+    image[body] = 0
+    image += rng.integers(-20, 20, size=(size, size), dtype=np.int16)
+    return image
+
+
+def _write(ds, path):
+    """データセットをDICOMファイルとして保存"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    ds.save_as(str(path))
+
+
+def _generate_ct(study, directory, params, rng):
+    """CTシリーズを生成し、スライスの (SOPインスタンスUID, スライス位置) のリストを返す"""
+    size = params["ct_size"]
+    series_uid = generate_uid()
+    base = _ct_phantom(size, rng)
+    transfer_syntax = COMPRESSION_SYNTAXES[params["compression"]]
+    slices = []
+    for index in range(params["ct_slices"]):
+        sop_uid = generate_uid()
+        position = -params["ct_slices"] * 1.5 + index * 3.0
+        ds = _new_dataset(CT_IMAGE_STORAGE, sop_uid)
+        _add_common(ds, study, "CT", series_uid, 1, "PLANNING CT")
+        ds.ImageType = ["ORIGINAL", "PRIMARY", "AXIAL"]
+        ds.InstanceNumber = index + 1
+        ds.ImagePositionPatient = ["-250.0", "-250.0", f"{position:.1f}"]
+        ds.ImageOrientationPatient = ["1", "0", "0", "0", "1", "0"]
+        ds.SliceLocation = f"{position:.1f}"
+        ds.SliceThickness = "3.0"
+        ds.PixelSpacing = [f"{500 / size:.4f}", f"{500 / size:.4f}"]
+        ds.KVP = "120"
+        ds.SamplesPerPixel = 1
+        ds.PhotometricInterpretation = "MONOCHROME2"
+        ds.Rows = size
+        ds.Columns = size
+        ds.BitsAllocated = 16
+        ds.BitsStored = 16
+        ds.HighBit = 15
+        ds.PixelRepresentation = 1
+        ds.RescaleIntercept = "0"
+        ds.RescaleSlope = "1"
+        ds.WindowCenter = "40"
+        ds.WindowWidth = "400"
+        _add_private(ds, index, params["private_tags"])
+
+        pixels = np.roll(base, index % 7, axis=1)
+        if transfer_syntax == RLELossless:
+            ds.compress(RLELossless, pixels)
+        else:
+            ds.PixelData = pixels.tobytes()
+            ds.file_meta.TransferSyntaxUID = transfer_syntax
+        _write(ds, directory / "CT" / f"CT{index + 1:04d}.dcm")
+        slices.append((sop_uid, position))
+    return series_uid, slices
+
+
+def _generate_rtstruct(study, directory, params, ct_series_uid, slices, rng):
+    """CTの各スライスに輪郭を持つRTSTRUCTを生成し、SOPインスタンスUIDを返す"""
+    sop_uid = generate_uid()
+    ds = _new_dataset(RT_STRUCTURE_SET_STORAGE, sop_uid)
+    _add_common(ds, study, "RTSTRUCT", generate_uid(), 2, "STRUCTURES")
+    ds.StructureSetLabel = "RTSTRUCT"
+    ds.StructureSetName = f"{study['patient_name']} STRUCT"
+    ds.StructureSetDate = study["study_date"]
+    ds.StructureSetTime = "100000"
+
+    contour_images = []
+    for slice_uid, _ in slices:
+        item = Dataset()
+        item.ReferencedSOPClassUID = CT_IMAGE_STORAGE
+        item.ReferencedSOPInstanceUID = slice_uid
+        contour_images.append(item)
+    series = Dataset()
+    series.SeriesInstanceUID = ct_series_uid
+    series.ContourImageSequence = contour_images
+    referenced_study = Dataset()
+    referenced_study.ReferencedSOPClassUID = "1.2.840.10008.3.1.2.3.1"
+    referenced_study.ReferencedSOPInstanceUID = study["study_uid"]
+    referenced_study.RTReferencedSeriesSequence = [series]
+    frame = Dataset()
+    frame.FrameOfReferenceUID = study["frame_uid"]
+    frame.RTReferencedStudySequence = [referenced_study]
+    ds.ReferencedFrameOfReferenceSequence = [frame]
+
+    points = params["contour_points"]
+    angles = np.linspace(0, 2 * np.pi, points, endpoint=False)
+    rois, roi_contours, observations = [], [], []
+    for number in range(1, params["rois"] + 1):
+        roi = Dataset()
+        roi.ROINumber = number
+        roi.ReferencedFrameOfReferenceUID = study["frame_uid"]
+        roi.ROIName = f"ROI_{number:02d}"
+        roi.ROIGenerationAlgorithm = "MANUAL"
+        rois.append(roi)
+
+        radius = 10 + rng.random() * 60
+        offset_x, offset_y = rng.uniform(-80, 80, size=2)
+        contours = []
+        for slice_uid, position in slices:
+            image = Dataset()
+            image.ReferencedSOPClassUID = CT_IMAGE_STORAGE
+            image.ReferencedSOPInstanceUID = slice_uid
+            contour = Dataset()
+            contour.ContourImageSequence = [image]
+            contour.ContourGeometricType = "CLOSED_PLANAR"
+            contour.NumberOfContourPoints = points
+            xs = offset_x + radius * np.cos(angles)
+            ys = offset_y + radius * np.sin(angles)
+            contour.ContourData = [f"{value:.2f}" for xyz in zip(xs, ys, [position] * points) for value in xyz]
+            contours.append(contour)
+        roi_contour = Dataset()
+        roi_contour.ROIDisplayColor = [255, (number * 40) % 256, 0]
+        roi_contour.ReferencedROINumber = number
+        roi_contour.ContourSequence = contours
+        roi_contours.append(roi_contour)
+
+        observation = Dataset()
+        observation.ObservationNumber = number
+        observation.ReferencedROINumber = number
+        observation.RTROIInterpretedType = "PTV" if number == 1 else "ORGAN"
+        observation.ROIInterpreter = "SATO^HANAKO"
+        if params["private_tags"]:
+            block = observation.private_block(0x3007, PRIVATE_CREATOR, create=True)
+            block.add_new(0x01, "LO", f"REVIEWED BY {study['patient_name']}")
+        observations.append(observation)
+
+    ds.StructureSetROISequence = rois
+    ds.ROIContourSequence = roi_contours
+    ds.RTROIObservationsSequence = observations
+    _add_private(ds, 0, params["private_tags"])
+    _write(ds, directory / "RS.dcm")
+    return sop_uid
+
+
+def _generate_rtplan(study, directory, params, struct_uid):
+    """多数のビームと制御点（MLC位置を含む）を持つRTPLANを生成し、SOPインスタンスUIDを返す"""
+    sop_uid = generate_uid()
+    ds = _new_dataset(RT_PLAN_STORAGE, sop_uid)
+    _add_common(ds, study, "RTPLAN", generate_uid(), 3, "PLAN")
+    ds.RTPlanLabel = "VMAT_1"
+    ds.RTPlanName = f"{study['patient_name']} PLAN"
+    ds.RTPlanDate = study["study_date"]
+    ds.RTPlanTime = "110000"
+    ds.RTPlanGeometry = "PATIENT"
+    ds.ApprovalStatus = "APPROVED"
+    ds.ReviewerName = "WATANABE^AKIKO"
+    ds.ReviewDate = study["study_date"]
+
+    structure = Dataset()
+    structure.ReferencedSOPClassUID = RT_STRUCTURE_SET_STORAGE
+    structure.ReferencedSOPInstanceUID = struct_uid
+    ds.ReferencedStructureSetSequence = [structure]
+
+    dose_reference = Dataset()
+    dose_reference.DoseReferenceNumber = 1
+    dose_reference.DoseReferenceStructureType = "SITE"
+    dose_reference.DoseReferenceType = "TARGET"
+    dose_reference.TargetPrescriptionDose = "60.0"
+    ds.DoseReferenceSequence = [dose_reference]
+
+    setup = Dataset()
+    setup.PatientPosition = "HFS"
+    setup.PatientSetupNumber = 1
+    ds.PatientSetupSequence = [setup]
+
+    beams, referenced_beams = [], []
+    control_points = max(2, params["control_points"])
+    for number in range(1, params["beams"] + 1):
+        beam = Dataset()
+        beam.BeamNumber = number
+        beam.BeamName = f"ARC{number}"
+        beam.BeamType = "DYNAMIC"
+        beam.RadiationType = "PHOTON"
+        beam.TreatmentMachineName = "LINAC01"
+        beam.PrimaryDosimeterUnit = "MU"
+        beam.SourceAxisDistance = "1000.0"
+        beam.TreatmentDeliveryType = "TREATMENT"
+        beam.NumberOfWedges = 0
+        beam.NumberOfCompensators = 0
+        beam.NumberOfBoli = 0
+        beam.NumberOfBlocks = 0
+        beam.FinalCumulativeMetersetWeight = "1.0"
+        beam.NumberOfControlPoints = control_points
+        beam.ReferencedPatientSetupNumber = 1
+        mlc = Dataset()
+        mlc.RTBeamLimitingDeviceType = "MLCX"
+        mlc.NumberOfLeafJawPairs = 60
+        mlc.LeafPositionBoundaries = [f"{-200 + i * 400 / 60:.1f}" for i in range(61)]
+        beam.BeamLimitingDeviceSequence = [mlc]
+
+        points = []
+        for index in range(control_points):
+            point = Dataset()
+            point.ControlPointIndex = index
+            point.CumulativeMetersetWeight = f"{index / (control_points - 1):.4f}"
+            point.GantryAngle = f"{(181 + index * 358 / (control_points - 1)) % 360:.1f}"
+            leaves = Dataset()
+            leaves.RTBeamLimitingDeviceType = "MLCX"
+            opening = 5 + (index * 7 + number) % 30
+            leaves.LeafJawPositions = [f"{-opening:.1f}"] * 60 + [f"{opening:.1f}"] * 60
+            point.BeamLimitingDevicePositionSequence = [leaves]
+            if index == 0:
+                point.NominalBeamEnergy = "6"
+                point.BeamLimitingDeviceAngle = "30.0"
+                point.PatientSupportAngle = "0.0"
+                point.IsocenterPosition = ["0.0", "0.0", "0.0"]
+            points.append(point)
+        beam.ControlPointSequence = points
+        beams.append(beam)
+
+        referenced = Dataset()
+        referenced.ReferencedBeamNumber = number
+        referenced.BeamMeterset = "120.5"
+        referenced_beams.append(referenced)
+
+    ds.BeamSequence = beams
+    fraction = Dataset()
+    fraction.FractionGroupNumber = 1
+    fraction.NumberOfFractionsPlanned = 30
+    fraction.NumberOfBeams = params["beams"]
+    fraction.NumberOfBrachyApplicationSetups = 0
+    fraction.ReferencedBeamSequence = referenced_beams
+    ds.FractionGroupSequence = [fraction]
+    _add_private(ds, 0, params["private_tags"])
+    _write(ds, directory / "RP.dcm")
+    return sop_uid
+
+
+def _generate_rtdose(study, directory, params, plan_uid, rng):
+    """マルチフレームのRTDOSEを生成"""
+    size = params["dose_size"]
+    frames = params["dose_frames"]
+    ds = _new_dataset(RT_DOSE_STORAGE, generate_uid())
+    _add_common(ds, study, "RTDOSE", generate_uid(), 4, "DOSE")
+    ds.DoseUnits = "GY"
+    ds.DoseType = "PHYSICAL"
+    ds.DoseSummationType = "PLAN"
+    ds.DoseGridScaling = "1e-05"
+    ds.ImagePositionPatient = ["-200.0", "-200.0", f"{-frames * 1.5:.1f}"]
+    ds.ImageOrientationPatient = ["1", "0", "0", "0", "1", "0"]
+    ds.PixelSpacing = [f"{400 / size:.4f}", f"{400 / size:.4f}"]
+    ds.GridFrameOffsetVector = [f"{i * 3.0:.1f}" for i in range(frames)]
+    ds.FrameIncrementPointer = (0x3004, 0x000C)
+    ds.NumberOfFrames = frames
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.Rows = size
+    ds.Columns = size
+    ds.BitsAllocated = 32
+    ds.BitsStored = 32
+    ds.HighBit = 31
+    ds.PixelRepresentation = 0
+
+    plan = Dataset()
+    plan.ReferencedSOPClassUID = RT_PLAN_STORAGE
+    plan.ReferencedSOPInstanceUID = plan_uid
+    ds.ReferencedRTPlanSequence = [plan]
+
+    y, x = np.ogrid[:size, :size]
+    spot = np.exp(-(((x - size / 2) ** 2 + (y - size / 2) ** 2) / (2 * (size / 6) ** 2)))
+    profile = np.exp(-((np.arange(frames) - frames / 2) ** 2) / (2 * (frames / 4) ** 2))
+    dose = (spot[None, :, :] * profile[:, None, None] * 6e6).astype(np.uint32)
+    dose += rng.integers(0, 1000, size=dose.shape, dtype=np.uint32)
+    ds.PixelData = dose.tobytes()
+    _add_private(ds, 0, params["private_tags"])
+    _write(ds, directory / "RD.dcm")
+
+
+def generate_study(output_dir, patient_index, params=None, rng=None):
+    """
+    1患者分のRT検査（CT・RTSTRUCT・RTPLAN・RTDOSE）を生成
+
+    Args:
+        output_dir: 出力先ディレクトリ（患者IDのディレクトリが作成される）
+        patient_index: 患者の番号（患者ID・氏名の生成に使用）
+        params: 生成パラメータ（省略した項目はSYNTHETIC_DEFAULTS）
+        rng: numpyの乱数生成器（省略時はシードと患者番号から作成）
+
+    Returns:
+        患者のディレクトリのPathオブジェクト
+    """
+    params = {**SYNTHETIC_DEFAULTS, **(params or {})}
+    if params["compression"] not in COMPRESSION_SYNTAXES:
+        raise ValueError(f"未対応の圧縮方式です: {params['compression']}")
+    if rng is None:
+        rng = np.random.default_rng([params["seed"], patient_index])
+
+    patient_id = f"SYN{patient_index + 1:05d}"
+    study_date = date(2020, 1, 6) + timedelta(days=patient_index * 3)
+    study = {
+        "patient_id": patient_id,
+        "patient_name": f"{_LAST_NAMES[patient_index % len(_LAST_NAMES)]}^"
+                        f"{_FIRST_NAMES[(patient_index // len(_LAST_NAMES)) % len(_FIRST_NAMES)]}",
+        "birth_date": (date(1950, 4, 1) + timedelta(days=patient_index * 137)).strftime("%Y%m%d"),
+        "sex": "MF"[patient_index % 2],
+        "study_uid": generate_uid(),
+        "frame_uid": generate_uid(),
+        "study_date": study_date.strftime("%Y%m%d"),
+        "study_id": f"RT{patient_index + 1:04d}",
+        "accession": f"ACC{20200000 + patient_index}",
+    }
+    directory = Path(output_dir) / patient_id
+
+    ct_series_uid, slices = _generate_ct(study, directory, params, rng)
+    struct_uid = _generate_rtstruct(study, directory, params, ct_series_uid, slices, rng)
+    plan_uid = _generate_rtplan(study, directory, params, struct_uid)
+    _generate_rtdose(study, directory, params, plan_uid, rng)
+    return directory
+
+
+def generate_dataset(output_dir, log_func=print, **params):
+    """
+    複数患者分の合成RT検査を生成
+
+    出力先に同じパラメータで生成済みのデータがある場合は再利用する。
+
+    Args:
+        output_dir: 出力先ディレクトリ
+        log_func: ログ出力関数
+        **params: 生成パラメータ（SYNTHETIC_DEFAULTSのキー）
+
+    Returns:
+        生成内容の辞書（params, files, bytes）
+    """
+    unknown = set(params) - set(SYNTHETIC_DEFAULTS)
+    if unknown:
+        raise ValueError(f"未対応のパラメータです: {', '.join(sorted(unknown))}")
+    params = {**SYNTHETIC_DEFAULTS, **params}
+    output_dir = Path(output_dir)
+    info_path = output_dir / SYNTHETIC_INFO_NAME
+
+    if info_path.exists():
+        with open(info_path, 'r', encoding='utf-8') as f:
+            info = json.load(f)
+        if info.get("params") == params:
+            log_func(f"生成済みの合成データを使用: {output_dir} ({info['files']}ファイル)")
+            return info
+        raise ValueError(f"別のパラメータで生成済みの合成データがあります: {output_dir}")
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for patient_index in range(params["patients"]):
+        directory = generate_study(output_dir, patient_index, params)
+        log_func(f"合成データ生成: {directory.name} ({patient_index + 1}/{params['patients']})")
+
+    files = list(output_dir.rglob("*.dcm"))
+    info = {
+        "params": params,
+        "files": len(files),
+        "bytes": sum(path.stat().st_size for path in files),
+    }
+    with open(info_path, 'w', encoding='utf-8') as f:
+        json.dump(info, f, ensure_ascii=False, indent=2)
+    return info
+
+
+def add_arguments(parser):
+    """生成パラメータのコマンドライン引数を追加"""
+    parser.add_argument('--patients', type=int, default=SYNTHETIC_DEFAULTS["patients"], help='患者（検査）数')
+    parser.add_argument('--ct-slices', type=int, default=SYNTHETIC_DEFAULTS["ct_slices"], help='CTのスライス数')
+    parser.add_argument('--ct-size', type=int, default=SYNTHETIC_DEFAULTS["ct_size"], help='CT画像の縦横のピクセル数')
+    parser.add_argument('--compression', choices=sorted(COMPRESSION_SYNTAXES),
+                        default=SYNTHETIC_DEFAULTS["compression"], help='CTの圧縮方式')
+    parser.add_argument('--rois', type=int, default=SYNTHETIC_DEFAULTS["rois"], help='RTSTRUCTのROI数')
+    parser.add_argument('--contour-points', type=int, default=SYNTHETIC_DEFAULTS["contour_points"],
+                        help='輪郭1つあたりの点数')
+    parser.add_argument('--dose-frames', type=int, default=SYNTHETIC_DEFAULTS["dose_frames"], help='RTDOSEのフレーム数')
+    parser.add_argument('--dose-size', type=int, default=SYNTHETIC_DEFAULTS["dose_size"],
+                        help='RTDOSEの縦横のピクセル数')
+    parser.add_argument('--beams', type=int, default=SYNTHETIC_DEFAULTS["beams"], help='RTPLANのビーム数')
+    parser.add_argument('--control-points', type=int, default=SYNTHETIC_DEFAULTS["control_points"],
+                        help='ビームあたりの制御点数')
+    parser.add_argument('--no-private-tags', action='store_true', help='プライベートタグを含めない')
+    parser.add_argument('--seed', type=int, default=SYNTHETIC_DEFAULTS["seed"], help='乱数シード')
+
+
+def params_from_args(args):
+    """コマンドライン引数から生成パラメータを取得"""
+    params = {key: getattr(args, key) for key in SYNTHETIC_DEFAULTS if key != "private_tags"}
+    params["private_tags"] = not args.no_private_tags
+    return params
+
+
+def main():
+    """合成データ生成のコマンドラインエントリーポイント"""
+    parser = argparse.ArgumentParser(description='性能計測用の合成RT検査データを生成')
+    parser.add_argument('--output', required=True, help='出力先ディレクトリ')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    info = generate_dataset(args.output, **params_from_args(args))
+    print(f"{info['files']}ファイル ({info['bytes'] / 1024 / 1024:.1f} MB) を生成しました: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
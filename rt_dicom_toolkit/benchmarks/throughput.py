@@ -0,0 +1,247 @@
+"""
+匿名化・検証の処理速度を計測するベンチマーク
+
+合成RT検査データ（synthetic）に対して、ファイル検索・匿名化・ディレクトリ比較・検証の
+各段階を実行し、処理時間・ファイル/秒・MB/秒・ピークメモリ（RSS）を計測する。
+各段階は新しいプロセスで実行するため、ピークメモリは段階ごとの値になる。
+結果をJSONのベースラインとして保存し、次回以降の計測でベースラインより
+処理速度が許容範囲を超えて低下した段階があれば終了コード1で終了する。
+
+使用例:
+    python -m rt_dicom_toolkit.benchmarks.throughput --save-baseline benchmark_baseline.json
+    python -m rt_dicom_toolkit.benchmarks.throughput --baseline benchmark_baseline.json --tolerance 0.2
+    python -m rt_dicom_toolkit.benchmarks.throughput --patients 5 --ct-slices 200 --compression rle --repeat 3
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import platform
+import tempfile
+import contextlib
+import multiprocessing
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import pydicom
+
+from .synthetic import SYNTHETIC_DEFAULTS, generate_dataset, add_arguments, params_from_args
+
+# 計測する段階（実行順）
+STAGES = ("find_dicom_files", "process_directory", "compare_directory_structure", "validate_files")
+
+# ベースラインより処理速度（ファイル/秒）が何割低下したら劣化とみなすか
+DEFAULT_TOLERANCE = 0.2
+
+
+def _peak_rss_mb():
+    """現在のプロセスのピークメモリ使用量[MB]を取得（取得できない環境ではNone）"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # LinuxはKB単位、macOSはバイト単位
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def _run_stage(stage, input_dir, output_dir, work_dir):
+    """
+    1つの段階を実行して計測（新しいプロセスで呼び出される）
+
+    Args:
+        stage: 段階名（STAGESのいずれか）
+        input_dir: 合成データのディレクトリ
+        output_dir: 匿名化の出力ディレクトリ
+        work_dir: ログ・レポートの出力先
+
+    Returns:
+        {seconds, peak_rss_mb} の辞書
+    """
+    input_dir, output_dir, work_dir = Path(input_dir), Path(output_dir), Path(work_dir)
+    # 各段階のファイル単位のログは計測の対象外とし、表示しない
+    with contextlib.redirect_stdout(io.StringIO()):
+        if stage == "find_dicom_files":
+            from ..utils.file_utils import find_dicom_files
+            start = time.perf_counter()
+            find_dicom_files(input_dir)
+        elif stage == "process_directory":
+            from ..anonymizer import RTDicomAnonymizer
+            anonymizer = RTDicomAnonymizer()
+            anonymizer.input_dir = input_dir
+            anonymizer.output_dir = output_dir
+            anonymizer.log_dir = work_dir / "logs"
+            start = time.perf_counter()
+            anonymizer.process_directory()
+        elif stage == "compare_directory_structure":
+            from ..utils.file_utils import compare_directory_structure
+            start = time.perf_counter()
+            compare_directory_structure(input_dir, output_dir, log_func=lambda message: None)
+        elif stage == "validate_files":
+            from ..validator import RTDicomValidator
+            validator = RTDicomValidator()
+            validator.report_dir = work_dir / "reports"
+            validator.report_dir.mkdir(parents=True, exist_ok=True)
+            start = time.perf_counter()
+            validator.validate_files(input_dir, output_dir)
+        else:
+            raise ValueError(f"未対応の段階です: {stage}")
+        seconds = time.perf_counter() - start
+    return {"seconds": seconds, "peak_rss_mb": _peak_rss_mb()}
+
+
+def _in_new_process(func, *args, **kwargs):
+    """
+    関数を新しいプロセスで実行
+
+    ピークメモリは子プロセスに引き継がれるため、データ生成や前の段階の
+    メモリ使用量が計測に影響しないよう、計測する側のプロセスでは重い処理を行わない。
+    """
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(func, *args, **kwargs).result()
+
+
+def _dataset_key(params):
+    """生成パラメータから合成データのディレクトリ名を決める"""
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+    return f"rt_synthetic_{digest[:12]}"
+
+
+def run_benchmark(data_dir=None, repeat=1, log_func=print, **params):
+    """
+    合成データに対して全段階を計測
+
+    Args:
+        data_dir: 合成データを生成・再利用するディレクトリ（省略時は一時ディレクトリ）
+        repeat: 計測回数（段階ごとに最短の時間を採用）
+        log_func: ログ出力関数
+        **params: 合成データの生成パラメータ（SYNTHETIC_DEFAULTSのキー）
+
+    Returns:
+        計測結果の辞書（環境・データセット・段階ごとの結果）
+    """
+    params = {**SYNTHETIC_DEFAULTS, **params}
+    data_root = Path(data_dir) if data_dir else Path(tempfile.gettempdir()) / "rt_dicom_toolkit_benchmark"
+    input_dir = data_root / _dataset_key(params)
+    dataset = _in_new_process(generate_dataset, str(input_dir), **params)
+    megabytes = dataset["bytes"] / 1024 / 1024
+    log_func(f"合成データ: {dataset['files']}ファイル ({megabytes:.1f} MB)")
+
+    stages = {}
+    work_dir = Path(tempfile.mkdtemp(prefix="rt_benchmark_"))
+    try:
+        for run in range(repeat):
+            output_dir = work_dir / "anonymized"
+            shutil.rmtree(output_dir, ignore_errors=True)
+            for stage in STAGES:
+                result = _in_new_process(_run_stage, stage, str(input_dir), str(output_dir),
+                                         str(work_dir / f"run{run}"))
+                best = stages.get(stage)
+                if best is None or result["seconds"] < best["seconds"]:
+                    stages[stage] = result
+                log_func(f"  [{run + 1}/{repeat}] {stage}: {result['seconds']:.2f}秒")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    for result in stages.values():
+        seconds = max(result["seconds"], 1e-9)
+        result["files_per_sec"] = dataset["files"] / seconds
+        result["mb_per_sec"] = megabytes / seconds
+
+    return {
+        "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "environment": {
+            "python": platform.python_version(),
+            "pydicom": pydicom.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "dataset": dataset,
+        "repeat": repeat,
+        "stages": stages,
+    }
+
+
+def compare_with_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    計測結果をベースラインと比較
+
+    Args:
+        results: run_benchmarkの結果
+        baseline: 保存済みのベースライン（run_benchmarkの結果）
+        tolerance: 処理速度（ファイル/秒）の許容低下率
+
+    Returns:
+        劣化した段階の (段階名, ベースラインのファイル/秒, 今回のファイル/秒) のリスト
+    """
+    regressions = []
+    for stage, result in results["stages"].items():
+        reference = baseline.get("stages", {}).get(stage)
+        if reference is None:
+            continue
+        if result["files_per_sec"] < reference["files_per_sec"] * (1 - tolerance):
+            regressions.append((stage, reference["files_per_sec"], result["files_per_sec"]))
+    return regressions
+
+
+def print_results(results, baseline=None):
+    """計測結果を表形式で表示"""
+    print(f"{'段階':<30}{'秒':>9}{'ファイル/秒':>12}{'MB/秒':>10}{'RSS(MB)':>10}{'ベースライン比':>12}")
+    for stage in STAGES:
+        result = results["stages"].get(stage)
+        if result is None:
+            continue
+        rss = f"{result['peak_rss_mb']:.0f}" if result["peak_rss_mb"] is not None else "-"
+        ratio = ""
+        reference = (baseline or {}).get("stages", {}).get(stage)
+        if reference:
+            ratio = f"{result['files_per_sec'] / reference['files_per_sec']:.2f}x"
+        print(f"{stage:<30}{result['seconds']:>9.2f}{result['files_per_sec']:>12.1f}"
+              f"{result['mb_per_sec']:>10.1f}{rss:>10}{ratio:>12}")
+
+
+def main():
+    """ベンチマークのコマンドラインエントリーポイント"""
+    parser = argparse.ArgumentParser(description='RT DICOM Toolkit 処理速度ベンチマーク')
+    add_arguments(parser)
+    parser.add_argument('--data-dir', help='合成データを生成・再利用するディレクトリ（省略時は一時ディレクトリ）')
+    parser.add_argument('--repeat', type=int, default=1, help='計測回数（段階ごとに最短の時間を採用）')
+    parser.add_argument('--baseline', help='比較するベースラインのJSON')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='劣化とみなす処理速度の低下率（0.2 = 20%%低下）')
+    parser.add_argument('--save-baseline', help='計測結果をベースラインとして保存するパス')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get("dataset", {}).get("params") != {**SYNTHETIC_DEFAULTS, **params_from_args(args)}:
+            print("⚠️ ベースラインと合成データのパラメータが異なります")
+
+    results = run_benchmark(args.data_dir, max(1, args.repeat), **params_from_args(args))
+    print_results(results, baseline)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"ベースライン保存完了: {args.save_baseline}")
+
+    if baseline is not None:
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        for stage, reference, current in regressions:
+            print(f"❌ {stage}: {reference:.1f} → {current:.1f} ファイル/秒（許容低下率 {args.tolerance:.0%}）")
+        if regressions:
+            sys.exit(1)
+        print("✅ ベースラインからの劣化はありません")
+
+
+if __name__ == "__main__":
+    main()
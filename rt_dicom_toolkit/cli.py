@@ -6,25 +6,144 @@ import argparse
 import sys
 from pathlib import Path
 
-from anonymizer import RTDicomAnonymizer
-from validator import RTDicomValidator
-from config import (
-    DEFAULT_INPUT_DIR, DEFAULT_ANONYMOUS_DIR, DEFAULT_LOG_DIR, DEFAULT_REPORT_DIR
+from .config import (
+    DEFAULT_INPUT_DIR, DEFAULT_ANONYMOUS_DIR, DEFAULT_LOG_DIR, DEFAULT_REPORT_DIR,
+    DEFAULT_SAMPLING_CONFIDENCE, DEFAULT_SAMPLING_THRESHOLD, DEFAULT_DAEMON_SOCKET,
+    DEFAULT_AUTOTUNE_MAX_WORKERS, ensure_default_directories
 )
 
+def _workers_arg(value):
+    """--workersの値（正の整数または auto）を解析"""
+    if value == 'auto':
+        return value
+    try:
+        workers = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"正の整数または auto を指定してください: {value}")
+    if workers < 1:
+        raise argparse.ArgumentTypeError(f"正の整数または auto を指定してください: {value}")
+    return workers
+
 def run_anonymizer_cli():
     """匿名化ツールのCLIエントリーポイント"""
     parser = argparse.ArgumentParser(description='RT DICOM匿名化ツール')
-    parser.add_argument('--input', help='入力ディレクトリのパス', default=str(DEFAULT_INPUT_DIR))
+    parser.add_argument('--input', help='入力ディレクトリ、またはzip・tarアーカイブのパス', default=str(DEFAULT_INPUT_DIR))
     parser.add_argument('--output', help='出力ディレクトリのパス', default=str(DEFAULT_ANONYMOUS_DIR))
     parser.add_argument('--log', help='ログディレクトリのパス', default=str(DEFAULT_LOG_DIR))
     parser.add_argument('--level', choices=['full', 'partial'], default='full',
                        help='匿名化レベル: full=完全匿名化, partial=部分匿名化')
     parser.add_argument('--private', choices=['remove', 'keep'], default='remove',
                        help='プライベートタグの処理: remove=削除, keep=保持')
+    parser.add_argument('--no-phi-bloom', action='store_true',
+                       help='置換したPHIトークンのBloomフィルタを出力しない')
+    parser.add_argument('--output-format', choices=['directory', 'zip', 'tar', 'stdout'], default='directory',
+                       help='出力形式: directory=ファイル, zip/tar=--outputのアーカイブに直接書き込み, stdout=tarを標準出力へ')
+    parser.add_argument('--group-by', choices=['patient', 'study'], default='patient',
+                       help='アーカイブ出力でのまとめ方: patient=患者ごと, study=患者・検査ごと')
+    parser.add_argument('--workers', type=_workers_arg, default=None,
+                       help='並列に匿名化するスレッド数（--daemonの場合はデーモンのワーカー数）。'
+                            'autoの場合は処理速度とCPU使用率を計測しながら自動調整する')
+    daemon_group = parser.add_mutually_exclusive_group()
+    daemon_group.add_argument('--daemon', action='store_true',
+                       help='匿名化デーモンを起動し、ソケット経由でジョブを受け付ける')
+    daemon_group.add_argument('--submit', action='store_true',
+                       help='--input/--outputのジョブを起動中のデーモンに投入する')
+    daemon_group.add_argument('--stop-daemon', action='store_true',
+                       help='起動中のデーモンを停止する')
+    daemon_group.add_argument('--reset-daemon', action='store_true',
+                       help='起動中のデーモンの患者ID・UIDの対応を初期化する（実行中のジョブの完了後）')
+    daemon_group.add_argument('--set-throttle', action='store_true',
+                       help='起動中のデーモンの帯域制限を--read-limitなどの値に変更する（実行中のジョブにも反映、0は無制限）')
+    daemon_group.add_argument('--watch', action='store_true',
+                       help='入力ディレクトリを監視し、届いたファイルを逐次匿名化する')
+    daemon_group.add_argument('--listen', action='store_true',
+                       help='DICOM受信（C-STORE SCP）を開始し、受信データをメモリ上で匿名化して保存する')
+    daemon_group.add_argument('--queue', metavar='DB',
+                       help='共有ストレージ上の作業キュー（SQLite）から検査単位のバッチを取得して処理する')
+    parser.add_argument('--queue-scan', action='store_true',
+                       help='--queue: 入力ディレクトリを再スキャンして新しいファイルをキューに追加する')
+    parser.add_argument('--queue-status', action='store_true',
+                       help='--queue: キューの状態を表示して終了する')
+    parser.add_argument('--port', type=int, default=None, help='--listen: 待ち受けポート')
+    parser.add_argument('--ae-title', default=None, help='--listen: 受信側のAEタイトル')
+    parser.add_argument('--stable-seconds', type=float, default=None,
+                       help='--watch: サイズと更新時刻がこの秒数変化しなければ書き込み完了とみなす')
+    parser.add_argument('--poll', action='store_true',
+                       help='--watch: inotifyを使わずポーリングで監視する')
+    parser.add_argument('--prefetch', type=int, default=None, metavar='N',
+                       help='現在のファイルの後に先読みするファイル数（0は先読みと処理済みファイルのページキャッシュの解放をしない）')
+    parser.add_argument('--read-limit', type=float, default=None, metavar='MBPS',
+                       help='読み込みの帯域の上限（MB/秒）。共有NASで他のシステムへの影響を抑える')
+    parser.add_argument('--read-iops', type=float, default=None, metavar='N',
+                       help='読み込むファイル数の上限（件/秒）')
+    parser.add_argument('--write-limit', type=float, default=None, metavar='MBPS',
+                       help='書き込みの帯域の上限（MB/秒）')
+    parser.add_argument('--write-iops', type=float, default=None, metavar='N',
+                       help='書き込むファイル数の上限（件/秒）')
+    parser.add_argument('--socket', help='デーモンのソケットのパス', default=str(DEFAULT_DAEMON_SOCKET))
+    parser.add_argument('--metrics-port', type=int,
+                       help='処理中のメトリクスをPrometheus形式で公開するHTTPポート（http://127.0.0.1:PORT/metrics）')
+    parser.add_argument('--metrics-file', metavar='PATH',
+                       help='処理中のメトリクスを一定間隔で書き出すファイル（node_exporterのtextfile collector用、.prom）')
+    parser.add_argument('--metrics-interval', type=float, default=None,
+                       help='--metrics-file: 書き出す間隔（秒）')
+    parser.add_argument('--trace', metavar='PATH',
+                       help='処理の時系列をChromeのトレース形式（JSON）で保存する（Perfettoやchrome://tracingで表示）')
+    parser.add_argument('--profile', action='store_true',
+                       help='一括処理をcProfile・tracemallocでプロファイルし、.profファイルとレポートをログディレクトリに保存')
+    parser.add_argument('--profile-every', type=int, default=None, metavar='N',
+                       help='--profile: ファイル単位の処理をN件に1件だけプロファイルする（オーバーヘッドの抑制）')
     args = parser.parse_args()
     
+    if args.submit or args.stop_daemon or args.reset_daemon or args.set_throttle:
+        # デーモンのクライアントはpydicomを読み込まずに動作する
+        sys.exit(_run_daemon_client(args))
+    
+    # 起動時間を短くするため、処理に必要なモジュールは引数の解析後に読み込む
+    ensure_default_directories()
+    
+    if args.daemon:
+        from .anonymizer.daemon import AnonymizationDaemon
+        if args.workers == 'auto':
+            daemon = AnonymizationDaemon(socket_path=args.socket, workers=DEFAULT_AUTOTUNE_MAX_WORKERS)
+            daemon.anonymizer.autotune = True
+        else:
+            daemon = AnonymizationDaemon(socket_path=args.socket, workers=args.workers)
+        daemon.anonymizer.log_dir = Path(args.log)
+        daemon.anonymizer.io_throttle.set_limits(**_throttle_limits(args))
+        if args.prefetch is not None:
+            daemon.anonymizer.prefetch_window = args.prefetch
+        daemon.defaults.update({
+            "anonymization_level": args.level,
+            "private_tags": args.private,
+            "emit_phi_bloom": not args.no_phi_bloom
+        })
+        exporters = _start_metrics(args, daemon.anonymizer)
+        try:
+            daemon.serve_forever()
+        finally:
+            _stop_metrics(exporters)
+        return
+    
+    output_stream = None
+    if args.output_format == 'stdout':
+        # 標準出力はアーカイブ専用にし、ログは標準エラー出力に表示する
+        output_stream = sys.stdout.buffer
+        sys.stdout = sys.stderr
+    
+    from .anonymizer import RTDicomAnonymizer
     anonymizer = RTDicomAnonymizer()
+    if args.workers == 'auto':
+        # 受信・監視モードはワーカー数を固定（設定値）で処理する
+        if not (args.listen or args.watch):
+            anonymizer.workers = DEFAULT_AUTOTUNE_MAX_WORKERS
+            anonymizer.autotune = True
+        args.workers = None
+    elif args.workers:
+        anonymizer.workers = args.workers
+    anonymizer.output_format = args.output_format
+    anonymizer.output_group_by = args.group_by
+    anonymizer.output_stream = output_stream
     anonymizer.input_dir = Path(args.input)
     anonymizer.output_dir = Path(args.output)
     anonymizer.log_dir = Path(args.log)
@@ -32,31 +151,252 @@ def run_anonymizer_cli():
     # 設定を適用
     anonymizer.anonymization_level = args.level
     anonymizer.private_tags = args.private
+    anonymizer.emit_phi_bloom = not args.no_phi_bloom
+    anonymizer.io_throttle.set_limits(**_throttle_limits(args))
+    if args.prefetch is not None:
+        anonymizer.prefetch_window = args.prefetch
+    anonymizer.profiling = args.profile
+    if args.profile_every:
+        anonymizer.profile_sample_every = args.profile_every
     
     print(f"入力ディレクトリ: {anonymizer.input_dir}")
     print(f"出力ディレクトリ: {anonymizer.output_dir}")
     print(f"ログディレクトリ: {anonymizer.log_dir}")
     
+    if args.trace:
+        from .utils.trace_utils import TraceRecorder
+        anonymizer.trace = TraceRecorder()
+    exporters = _start_metrics(args, anonymizer)
+    try:
+        _run_anonymizer_mode(args, anonymizer)
+    finally:
+        _stop_metrics(exporters)
+        if anonymizer.trace is not None:
+            trace_path = anonymizer.trace.save(args.trace)
+            print(f"トレース保存完了: {trace_path}")
+
+def _throttle_limits(args):
+    """
+    指定された帯域制限の引数を取得
+    
+    Args:
+        args: run_anonymizer_cliの引数
+        
+    Returns:
+        IOThrottle.set_limitsに渡す辞書（指定されなかった上限は含めない）
+    """
+    limits = {
+        "read_mbps": args.read_limit,
+        "read_iops": args.read_iops,
+        "write_mbps": args.write_limit,
+        "write_iops": args.write_iops,
+    }
+    return {key: value for key, value in limits.items() if value is not None}
+
+def _start_metrics(args, anonymizer):
+    """
+    指定に応じてメトリクスのHTTP公開・ファイル書き出しを開始
+    
+    Args:
+        args: run_anonymizer_cliの引数
+        anonymizer: メトリクスを記録するRTDicomAnonymizerインスタンス
+        
+    Returns:
+        開始した公開・書き出しのリスト（_stop_metricsに渡す）
+    """
+    if args.metrics_port is None and not args.metrics_file:
+        return []
+    from .anonymizer.metrics import attach_metrics
+    from .utils.metrics_utils import MetricsServer, TextfileExporter
+    
+    registry = attach_metrics(anonymizer)
+    exporters = []
+    if args.metrics_port is not None:
+        server = MetricsServer(registry, args.metrics_port).start()
+        host, port = server.address[:2]
+        print(f"メトリクス公開: http://{host}:{port}/metrics")
+        exporters.append(server)
+    if args.metrics_file:
+        exporters.append(TextfileExporter(registry, args.metrics_file, args.metrics_interval).start())
+        print(f"メトリクス書き出し: {args.metrics_file}")
+    return exporters
+
+def _stop_metrics(exporters):
+    """メトリクスの公開・書き出しを終了（ファイルには最終的な値を書き出す）"""
+    for exporter in exporters:
+        exporter.stop()
+
+def _run_anonymizer_mode(args, anonymizer):
+    """
+    引数に応じた動作モード（受信・作業キュー・監視・ディレクトリ処理）で匿名化を実行
+    
+    Args:
+        args: run_anonymizer_cliの引数
+        anonymizer: 設定済みのRTDicomAnonymizerインスタンス
+    """
+    if args.listen:
+        from .anonymizer.scp import AnonymizingStorageSCP
+        scp = AnonymizingStorageSCP(anonymizer, ae_title=args.ae_title, port=args.port,
+                                    max_associations=args.workers)
+        scp.start()
+        return
+    
+    if args.queue:
+        from .anonymizer.work_queue import WorkQueue, QueueWorker
+        queue = WorkQueue(args.queue)
+        if args.queue_status:
+            for state, counts in sorted(queue.status().items()):
+                print(f"{state}: {counts['batches']}バッチ ({counts['files']}ファイル)")
+            return
+        if args.queue_scan or queue.is_empty():
+            queue.populate(anonymizer.input_dir, log_func=anonymizer.log_message)
+        QueueWorker(anonymizer, queue).run()
+        return
+    
+    if args.watch:
+        from .anonymizer.watcher import FolderWatcher
+        watcher = FolderWatcher(anonymizer, workers=args.workers, stable_seconds=args.stable_seconds,
+                                use_polling=args.poll)
+        watcher.run()
+        return
+    
     anonymizer.process_directory()
 
+def _run_daemon_client(args):
+    """
+    起動中の匿名化デーモンにジョブ・帯域制限の変更・停止要求を送る
+
+    Args:
+        args: run_anonymizer_cliの引数
+
+    Returns:
+        終了コード
+    """
+    from .anonymizer.daemon import submit_job, send_command, set_throttle
+    
+    try:
+        if args.stop_daemon:
+            send_command("shutdown", socket_path=args.socket)
+            print("匿名化デーモンを停止しました")
+            return 0
+        
+        if args.reset_daemon:
+            for event in send_command("reset", socket_path=args.socket):
+                if event["event"] == "reset":
+                    print(f"対応表を初期化しました（患者 {event['patients']}件）")
+            return 0
+        
+        if args.set_throttle:
+            for event in set_throttle(socket_path=args.socket, **_throttle_limits(args)):
+                if event["event"] == "error":
+                    print(f"エラー: {event['message']}")
+                    return 1
+                for key, value in event["limits"].items():
+                    print(f"{key}: {value if value else '無制限'}")
+            return 0
+        
+        events = submit_job(args.input, args.output, socket_path=args.socket, log_dir=args.log,
+                            level=args.level, private=args.private, phi_bloom=not args.no_phi_bloom)
+        for event in events:
+            if event["event"] == "start":
+                print(f"{event['input_dir']}: {event['files']}ファイルを匿名化します")
+            elif event["event"] == "progress":
+                print(f"[{event['done']}/{event['total']}] {event['status']}: {event['file']}")
+            elif event["event"] == "done":
+                print(f"完了: 成功 {event['成功']}, スキップ {event['スキップ']}, "
+                      f"エラー {event['エラー']} ({event['elapsed']:.2f}秒)")
+                if event.get("summary_path"):
+                    print(f"処理サマリー: {event['summary_path']}")
+                return 1 if event['エラー'] else 0
+            elif event["event"] == "error":
+                print(f"エラー: {event['message']}")
+                return 1
+    except OSError as e:
+        print(f"デーモンに接続できません（{args.socket}）: {e}")
+        return 1
+    return 1
+
 def run_validator_cli():
     """検証ツールのCLIエントリーポイント"""
     parser = argparse.ArgumentParser(description='RT DICOM匿名化検証ツール')
     parser.add_argument('--original', help='原本DICOMディレクトリのパス', default=str(DEFAULT_INPUT_DIR))
     parser.add_argument('--anonymized', help='匿名化DICOMディレクトリのパス', default=str(DEFAULT_ANONYMOUS_DIR))
     parser.add_argument('--report', help='レポート出力ディレクトリのパス', default=str(DEFAULT_REPORT_DIR))
+    parser.add_argument('--manifest', help='検証後に匿名化ディレクトリのMerkleマニフェストを保存するパス')
+    parser.add_argument('--verify-manifest', help='マニフェストに対して匿名化ディレクトリを再検証（原本との比較は行わない）')
+    parser.add_argument('--full-rehash', action='store_true',
+                       help='再検証時にstat情報に関係なく全ファイルを再ハッシュ')
+    parser.add_argument('--bloom', help='匿名化ツールが出力したPHIフィルタで検証（原本は不要）')
+    parser.add_argument('--detailed-format', choices=['columnar', 'json'], default='columnar',
+                       help='詳細レポートの形式: columnar=列指向の結果ストア, json=JSONファイル')
+    parser.add_argument('--sample', action='store_true',
+                        help='モダリティ・患者・シリーズで層別抽出したファイルのみを検証し、匿名化率を信頼区間付きで推定')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_SAMPLING_THRESHOLD,
+                        help='抽出検証で層ごとに要求する匿名化率の下限（下回った層は全数検証）')
+    parser.add_argument('--confidence', type=float, default=DEFAULT_SAMPLING_CONFIDENCE, help='抽出検証の信頼水準')
+    parser.add_argument('--seed', type=int, help='抽出検証の乱数シード')
+    parser.add_argument('--query-results', help='保存済みの詳細結果ストアを照会（検証は行わない）')
+    parser.add_argument('--tag', default='PatientName', help='照会するタグ名')
+    parser.add_argument('--status', help='照会する状態（例: 未変更）、省略時は状態ごとの件数を表示')
+    parser.add_argument('--profile', action='store_true',
+                       help='検証をcProfile・tracemallocでプロファイルし、.profファイルとレポートをレポートディレクトリに保存')
+    parser.add_argument('--profile-every', type=int, default=None, metavar='N',
+                       help='--profile: ファイル単位の比較をN件に1件だけプロファイルする（オーバーヘッドの抑制）')
     args = parser.parse_args()
     
+    if args.query_results:
+        from .validator.result_store import ResultStore
+        store = ResultStore(args.query_results)
+        if args.status:
+            for anonymized_file in store.find_files(args.tag, args.status):
+                print(anonymized_file)
+        else:
+            print(f"{args.tag} ({len(store)}ファイル)")
+            for status, count in store.status_counts(args.tag).items():
+                print(f"  {status}: {count}")
+        return
+    
+    from .validator.manifest import build_manifest, verify_manifest, save_manifest, load_manifest
+    
+    if args.verify_manifest:
+        anonymized_dir = Path(args.anonymized)
+        print(f"匿名化ディレクトリ: {anonymized_dir}")
+        print(f"マニフェスト: {args.verify_manifest}")
+        result = verify_manifest(anonymized_dir, load_manifest(args.verify_manifest), full=args.full_rehash)
+        sys.exit(0 if result["match"] else 1)
+    
+    from .validator import RTDicomValidator
+    ensure_default_directories()
+    
     validator = RTDicomValidator()
     validator.original_dir = Path(args.original)
     validator.anonymized_dir = Path(args.anonymized)
     validator.report_dir = Path(args.report)
+    validator.detailed_report_format = args.detailed_format
+    validator.profiling = args.profile
+    if args.profile_every:
+        validator.profile_sample_every = args.profile_every
     
     print(f"原本ディレクトリ: {validator.original_dir}")
     print(f"匿名化ディレクトリ: {validator.anonymized_dir}")
     print(f"レポートディレクトリ: {validator.report_dir}")
     
-    validator.validate_files(validator.original_dir, validator.anonymized_dir)
+    if args.bloom:
+        report = validator.validate_with_bloom_filter(validator.anonymized_dir, args.bloom)
+        if report:
+            print(report)
+    elif args.sample:
+        report = validator.validate_sample(validator.original_dir, validator.anonymized_dir,
+                                           args.threshold, args.confidence, args.seed)
+        if report:
+            print(report)
+    else:
+        validator.validate_files(validator.original_dir, validator.anonymized_dir)
+    
+    if args.manifest:
+        manifest = build_manifest(validator.anonymized_dir)
+        manifest_path = save_manifest(manifest, args.manifest)
+        print(f"マニフェスト保存完了: {manifest_path}")
 
 if __name__ == '__main__':
     if len(sys.argv) > 1 and sys.argv[1] == 'validate':
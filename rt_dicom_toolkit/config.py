@@ -3,6 +3,7 @@ RT DICOM Toolkit の設定モジュール
 """
 
 import os
+import tempfile
 from pathlib import Path
 
 # アプリケーションのベースディレクトリ
@@ -17,11 +18,15 @@ DEFAULT_ANONYMOUS_DIR = DATA_DIR / 'anonymous_dicom'
 DEFAULT_LOG_DIR = DATA_DIR / 'logs'
 DEFAULT_REPORT_DIR = DATA_DIR / 'validation_reports'
 
-# ディレクトリが存在しない場合は作成
-DEFAULT_INPUT_DIR.mkdir(exist_ok=True, parents=True)
-DEFAULT_ANONYMOUS_DIR.mkdir(exist_ok=True, parents=True)
-DEFAULT_LOG_DIR.mkdir(exist_ok=True, parents=True)
-DEFAULT_REPORT_DIR.mkdir(exist_ok=True, parents=True)
+
+def ensure_default_directories():
+    """
+    デフォルトのデータディレクトリが存在しない場合は作成
+
+    インポート時の副作用をなくすため、ディレクトリは処理の開始時に作成する。
+    """
+    for directory in (DEFAULT_INPUT_DIR, DEFAULT_ANONYMOUS_DIR, DEFAULT_LOG_DIR, DEFAULT_REPORT_DIR):
+        directory.mkdir(exist_ok=True, parents=True)
 
 # ログ設定
 LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -32,4 +37,61 @@ DEFAULT_ANONYMIZATION_LEVEL = 'full'  # 'full' or 'partial'
 DEFAULT_PRIVATE_TAGS_HANDLING = 'remove'  # 'remove' or 'keep'
 DEFAULT_UID_HANDLING = 'consistent'  # 'consistent' or 'generate'
 DEFAULT_KEEP_STRUCTURE = True
-DEFAULT_PATIENT_ID_METHOD = 'hash'  # 'hash' or 'sequential'
\ No newline at end of file
+DEFAULT_PATIENT_ID_METHOD = 'hash'  # 'hash' or 'sequential'
+DEFAULT_EMIT_PHI_BLOOM = True  # 置換したPHIトークンのBloomフィルタを出力するか
+DEFAULT_ANONYMIZER_WORKERS = 1  # 匿名化を並列に行うスレッド数
+DEFAULT_OUTPUT_FORMAT = 'directory'  # 出力形式: 'directory', 'zip', 'tar', 'stdout'
+DEFAULT_OUTPUT_GROUP_BY = 'patient'  # アーカイブ出力でのまとめ方: 'patient' or 'study'
+DEFAULT_TIMING_SLOWEST_FILES = 20  # 処理サマリーに記録する処理時間の長いファイルの数
+DEFAULT_SCHEDULE_SMALL_FILE_BYTES = 1024 * 1024  # 並列処理でこのサイズ未満のファイルはまとめて1つのジョブにする
+DEFAULT_SCHEDULE_BATCH_FILES = 16  # 小さいファイルをまとめるジョブの最大ファイル数
+DEFAULT_PREFETCH_WINDOW = 8  # ジョブ内で現在のファイルの後に先読みするファイル数（0は先読みとページキャッシュの解放をしない）
+DEFAULT_PREFETCH_THREADS = 2  # 先読み・ページキャッシュの解放を行うスレッド数
+
+# ワーカー数の自動調整（--workers auto）の設定
+DEFAULT_AUTOTUNE_START_WORKERS = 2  # 計測を始めるワーカー数
+DEFAULT_AUTOTUNE_MAX_WORKERS = min(32, (os.cpu_count() or 1) * 4)  # ワーカー数の上限（I/O待ちが多いストレージ向けにCPU数より多くする）
+DEFAULT_AUTOTUNE_WINDOW_SECONDS = 2.0  # 1つのワーカー数で処理速度を計測する最短の時間（秒）
+DEFAULT_AUTOTUNE_MIN_GAIN = 0.05  # ワーカー数を増やして処理速度がこの割合以上向上しなければ頭打ちとみなす
+
+# 入出力の帯域制限（共有NASで臨床システムへの影響を抑える）の設定
+DEFAULT_READ_LIMIT_MBPS = None  # 読み込みの上限（MB/秒、Noneは無制限）
+DEFAULT_READ_LIMIT_IOPS = None  # 読み込むファイル数の上限（件/秒、Noneは無制限）
+DEFAULT_WRITE_LIMIT_MBPS = None  # 書き込みの上限（MB/秒、Noneは無制限）
+DEFAULT_WRITE_LIMIT_IOPS = None  # 書き込むファイル数の上限（件/秒、Noneは無制限）
+DEFAULT_THROTTLE_BURST_SECONDS = 1.0  # 上限を下回っていた間に貯められる量（何秒分か）
+
+# メトリクス（Prometheus形式）の設定
+DEFAULT_METRICS_HOST = '127.0.0.1'  # HTTPエンドポイントの待ち受けアドレス（ローカルからのみ接続可能）
+DEFAULT_METRICS_INTERVAL = 15.0  # テキストファイルを書き換える間隔（秒）
+
+# プロファイリング（cProfile・tracemalloc）の設定
+DEFAULT_PROFILE_SAMPLE_EVERY = 1  # ファイル単位の処理をN件に1件だけプロファイルする（1は全件）
+DEFAULT_PROFILE_TOP = 25  # レポートに出力する関数・メモリ確保箇所の件数
+
+# 匿名化デーモンの設定
+DEFAULT_DAEMON_SOCKET = Path(tempfile.gettempdir()) / 'rt_dicom_anonymizer.sock'  # ジョブを受け付けるUnixドメインソケット
+DEFAULT_DAEMON_WORKERS = min(4, os.cpu_count() or 1)  # デーモンが常駐させるワーカースレッド数
+
+# 監視フォルダモードの設定
+DEFAULT_WATCH_STABLE_SECONDS = 2.0  # サイズと更新時刻がこの秒数変化しなければ書き込み完了とみなす
+DEFAULT_WATCH_POLL_INTERVAL = 1.0  # inotifyが使えない場合のポーリング間隔（秒）
+DEFAULT_WATCH_FLUSH_SECONDS = 10.0  # シリーズへの新規ファイルがこの秒数途絶えたらサマリーを書き出す
+
+# DICOM受信（C-STORE SCP）の設定
+DEFAULT_SCP_AE_TITLE = 'RT_ANON_SCP'  # 受信側のAEタイトル
+DEFAULT_SCP_PORT = 11112  # 待ち受けポート
+DEFAULT_SCP_MAX_ASSOCIATIONS = 4  # 同時に受け付けるアソシエーション数（受信・匿名化のワーカー数）
+
+# 複数ホストでの分散処理（作業キュー）の設定
+DEFAULT_QUEUE_LEASE_SECONDS = 300  # バッチのリース期間（秒）。処理中はこの1/3ごとに延長する
+DEFAULT_QUEUE_MAX_ATTEMPTS = 3  # 1つのバッチを処理する最大回数
+DEFAULT_QUEUE_POLL_SECONDS = 5  # 他のホストの処理完了を待つ間隔（秒）
+
+# 検証設定のデフォルト
+DEFAULT_DETAILED_REPORT_FORMAT = 'columnar'  # 'columnar' or 'json'
+DEFAULT_SAMPLING_CONFIDENCE = 0.95  # 抽出検証の信頼水準
+DEFAULT_SAMPLING_THRESHOLD = 0.95  # 抽出検証で層ごとに要求する匿名化率の下限
+
+# ファイル検索設定
+DEFAULT_SCAN_WORKERS = min(8, os.cpu_count() or 1)  # DICOMヘッダーを並列に読み込むスレッド数
\ No newline at end of file
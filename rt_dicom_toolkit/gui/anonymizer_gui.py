@@ -16,6 +16,7 @@ from rt_dicom_toolkit.utils.matplotlib_utils import configure_matplotlib_for_jap
 
 # パッケージとしてインストールされている場合は以下のインポートを使用
 from rt_dicom_toolkit.anonymizer import RTDicomAnonymizer
+from rt_dicom_toolkit.config import ensure_default_directories
 
 # パッケージとしてインストールされていない場合は相対パスを追加
 if not "rt_dicom_toolkit" in sys.modules:
@@ -116,6 +117,25 @@ class AnonymizerGUI:
         ttk.Radiobutton(settings_frame, text="連番（Patient_001など）", variable=self.patient_id_method, 
                        value="sequential").grid(row=4, column=2, sticky=tk.W, pady=5)
         
+        # プロファイリング
+        ttk.Label(settings_frame, text="プロファイル:").grid(row=5, column=0, sticky=tk.W, pady=5)
+        self.profiling = tk.BooleanVar(value=False)
+        ttk.Checkbutton(settings_frame, text="処理時間・メモリ使用量をプロファイル（ログディレクトリに保存）", 
+                        variable=self.profiling).grid(row=5, column=1, columnspan=2, sticky=tk.W, pady=5)
+        
+        # 入出力の帯域制限（空欄は無制限、処理中も「適用」で変更可能）
+        ttk.Label(settings_frame, text="I/O上限:").grid(row=6, column=0, sticky=tk.W, pady=5)
+        limits_frame = ttk.Frame(settings_frame)
+        limits_frame.grid(row=6, column=1, columnspan=2, sticky=tk.W, pady=5)
+        self.io_limit_vars = {}
+        for column, (key, label) in enumerate((("read_mbps", "読み込み MB/秒"), ("read_iops", "件/秒"),
+                                                ("write_mbps", "書き込み MB/秒"), ("write_iops", "件/秒"))):
+            ttk.Label(limits_frame, text=label).grid(row=0, column=column * 2, sticky=tk.W)
+            self.io_limit_vars[key] = tk.StringVar(value="")
+            ttk.Entry(limits_frame, textvariable=self.io_limit_vars[key], width=6).grid(
+                row=0, column=column * 2 + 1, padx=(2, 8))
+        ttk.Button(limits_frame, text="適用", command=self.apply_io_limits).grid(row=0, column=8)
+        
         # 実行ボタン
         button_frame = ttk.Frame(main_frame)
         button_frame.pack(fill=tk.X, pady=10)
@@ -235,6 +255,29 @@ class AnonymizerGUI:
         except Exception as e:
             self.anonymizer.log_message(f"ディレクトリ調査中にエラー: {str(e)}")
     
+    def apply_io_limits(self):
+        """
+        入力された帯域制限を適用（処理中の場合は実行中の処理にも反映）
+        
+        Returns:
+            適用できた場合はTrue
+        """
+        limits = {}
+        for key, var in self.io_limit_vars.items():
+            value = var.get().strip()
+            try:
+                limits[key] = float(value) if value else None
+            except ValueError:
+                messagebox.showerror("エラー", f"I/O上限には数値を入力してください: {value}")
+                return False
+        try:
+            self.anonymizer.io_throttle.set_limits(**limits)
+        except ValueError as e:
+            messagebox.showerror("エラー", str(e))
+            return False
+        self.anonymizer.log_message(f"帯域制限: {self.anonymizer.io_throttle.describe()}")
+        return True
+    
     def start_processing(self):
         """匿名化処理を開始"""
         # 前回の処理が終わっていない場合は処理しない
@@ -264,10 +307,14 @@ class AnonymizerGUI:
         self.anonymizer.uid_handling = self.uid_handling.get()
         self.anonymizer.keep_structure = self.keep_structure.get()
         self.anonymizer.patient_id_method = self.patient_id_method.get()
+        self.anonymizer.profiling = self.profiling.get()
         
         # ログテキストをクリア
         self.log_text.delete(1.0, tk.END)
         
+        if not self.apply_io_limits():
+            return
+        
         # 処理開始
         self.status_var.set("処理を開始しています...")
         self.progress_var.set(0)
@@ -284,6 +331,7 @@ class AnonymizerGUI:
 
 def run_anonymizer_gui():
     """匿名化ツールのGUIを実行"""
+    ensure_default_directories()
     root = tk.Tk()
     app = AnonymizerGUI(root)
     root.mainloop()
@@ -17,6 +17,7 @@ from rt_dicom_toolkit.utils.matplotlib_utils import configure_matplotlib_for_jap
 # パッケージとしてインストールされている場合は以下のインポートを使用
 from rt_dicom_toolkit.validator import RTDicomValidator
 from rt_dicom_toolkit.validator.rules import ValidationRules
+from rt_dicom_toolkit.config import ensure_default_directories
 
 # パッケージとしてインストールされていない場合は相対パスを追加
 if not "rt_dicom_toolkit" in sys.modules:
@@ -117,6 +118,12 @@ class ValidatorGUI:
         ttk.Checkbutton(settings_frame, text="詳細なレポートを生成", 
                         variable=self.detailed_report).grid(row=4, column=1, columnspan=2, sticky=tk.W, pady=5)
         
+        # プロファイリング
+        ttk.Label(settings_frame, text="プロファイル:").grid(row=5, column=0, sticky=tk.W, pady=5)
+        self.profiling = tk.BooleanVar(value=False)
+        ttk.Checkbutton(settings_frame, text="処理時間・メモリ使用量をプロファイル（レポートディレクトリに保存）", 
+                        variable=self.profiling).grid(row=5, column=1, columnspan=2, sticky=tk.W, pady=5)
+        
         # 実行ボタン
         button_frame = ttk.Frame(main_frame)
         button_frame.pack(fill=tk.X, pady=10)
@@ -244,6 +251,7 @@ class ValidatorGUI:
                 self.rt_group = self.tree.insert("", "end", text="RT特有タグ", open=True)
                 self.private_group = self.tree.insert("", "end", text="プライベートタグ", open=True)
                 self.pixel_group = self.tree.insert("", "end", text="画像データ", open=True)
+                self.phi_group = self.tree.insert("", "end", text="残留PHI", open=True)
             
             # 必須匿名化タグを追加
             for tag, info in results["must_anonymize"].items():
@@ -259,7 +267,7 @@ class ValidatorGUI:
                 
                 # アイコンとステータスの設定
                 status = info["status"]
-                if info["anonymized"]:
+                if info["is_anonymized"]:
                     status = "✅ " + status
                 else:
                     status = "❌ " + status
@@ -370,6 +378,11 @@ class ValidatorGUI:
                 self.tree.insert(self.pixel_group, "end", text="ピクセル値", 
                                values=("原本データ", "匿名化データ", pixel_status))
             
+            # 残留PHIの検出結果を追加
+            for leak in results.get("phi_leaks", []):
+                self.tree.insert(self.phi_group, "end", text=leak["path"],
+                               values=(f"原本の{leak['source']}", leak["tag"], "❌ 残留"))
+            
         except Exception as e:
             self.validator.log_message(f"ツリービュー更新中にエラー: {str(e)}")
     
@@ -515,6 +528,7 @@ class ValidatorGUI:
         self.validator.original_dir = original_dir
         self.validator.anonymized_dir = anonymized_dir
         self.validator.report_dir = Path(self.report_dir_var.get())
+        self.validator.profiling = self.profiling.get()
         
         # ログテキストをクリア
         self.log_text.delete(1.0, tk.END)
@@ -558,6 +572,7 @@ class ValidatorGUI:
 
 def run_validator_gui():
     """検証ツールのGUIを実行"""
+    ensure_default_directories()
     root = tk.Tk()
     app = ValidatorGUI(root)
     root.mainloop()
@@ -5,10 +5,14 @@ RT DICOM Toolkit のユーティリティ関数
 from .dicom_utils import *
 from .file_utils import *
 from .logging_utils import *
+from .archive_utils import is_archive, iter_dicom_members
 
 __all__ = [
     'setup_logger',
     'find_dicom_files',
+    'scan_dicom_files',
+    'is_archive',
+    'iter_dicom_members',
     'get_dicom_info',
     'compare_directory_structure'
 ]
@@ -0,0 +1,95 @@
+"""
+zip・tarアーカイブ内のDICOMファイルを展開せずに読み込むモジュール
+
+アーカイブのメンバーを1つずつメモリに読み込み、ディレクトリ検索と同じ条件
+（プリアンブルの確認、なければヘッダーの判定）でDICOMファイルを選別する。
+tarは先頭から順に読むストリームとして開くため、圧縮されたtarでも一時ファイルを作らない。
+"""
+
+import tarfile
+import zipfile
+from pathlib import Path, PurePosixPath
+
+from .file_utils import is_dicom_bytes
+
+# アーカイブとして扱う拡張子
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+# 読み込まないメンバーのディレクトリ（macOSのリソースフォーク）
+IGNORED_MEMBER_DIRS = ('__MACOSX',)
+
+
+def is_archive(path):
+    """
+    パスが対応するアーカイブファイルか判定
+
+    Args:
+        path: ファイルのパス
+
+    Returns:
+        zipまたはtarアーカイブであればTrue
+    """
+    path = Path(path)
+    return path.is_file() and path.name.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def safe_member_path(name):
+    """
+    メンバー名を出力先で使える相対パスに変換（絶対パスや'..'による出力先外への書き込みを防ぐ）
+
+    Args:
+        name: アーカイブ内のメンバー名
+
+    Returns:
+        相対パス、使用できる部分がない場合はNone
+    """
+    parts = [part for part in PurePosixPath(name.replace('\\', '/')).parts if part not in ('/', '.', '..')]
+    return Path(*parts) if parts else None
+
+
+def _is_ignored(name):
+    parts = PurePosixPath(name).parts
+    return not parts or parts[0] in IGNORED_MEMBER_DIRS
+
+
+def iter_archive_members(archive_path):
+    """
+    アーカイブ内の通常ファイルを順に読み込む
+
+    Args:
+        archive_path: アーカイブファイルのパス
+
+    Yields:
+        (メンバー名, 内容のbytes) のタプル
+    """
+    archive_path = Path(archive_path)
+    if archive_path.name.lower().endswith('.zip'):
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or _is_ignored(info.filename):
+                    continue
+                with archive.open(info) as member:
+                    yield info.filename, member.read()
+    else:
+        # 圧縮形式を自動判定し、シークせずに先頭から読み込む
+        with tarfile.open(archive_path, mode='r|*') as archive:
+            for info in archive:
+                if not info.isfile() or _is_ignored(info.name):
+                    continue
+                member = archive.extractfile(info)
+                yield info.name, member.read()
+
+
+def iter_dicom_members(archive_path):
+    """
+    アーカイブ内のDICOMファイルを順に読み込む
+
+    Args:
+        archive_path: アーカイブファイルのパス
+
+    Yields:
+        (メンバー名, 内容のbytes) のタプル
+    """
+    for name, data in iter_archive_members(archive_path):
+        if is_dicom_bytes(data):
+            yield name, data
@@ -0,0 +1,123 @@
+"""
+ソルト付きハッシュによるBloomフィルタを提供するモジュール
+
+匿名化時に置換したPHIトークンを登録し、原本を持たない受け取り側でも
+匿名化データに同じトークンが残っていないかを1トークンあたりO(1)で確認できる。
+フィルタにはPHIそのものは保存されない。
+"""
+
+import os
+import math
+import json
+import base64
+import hashlib
+from pathlib import Path
+
+# フィルタファイルの形式バージョン
+BLOOM_FORMAT_VERSION = 1
+
+
+class PHIBloomFilter:
+    """PHIトークンを登録するソルト付きBloomフィルタ"""
+
+    def __init__(self, capacity, error_rate=0.001, salt=None):
+        """
+        初期化
+
+        Args:
+            capacity: 登録を想定するトークン数
+            error_rate: 目標とする偽陽性率
+            salt: ハッシュのソルト（省略時はランダムに生成）
+        """
+        capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        self.size = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hash_count = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.salt = salt if salt is not None else os.urandom(16)
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _indexes(self, token):
+        """トークンに対応するビット位置を計算（ダブルハッシュ法）"""
+        digest = hashlib.blake2b(token.encode('utf-8'), key=self.salt, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, token):
+        """
+        トークンを登録
+
+        Args:
+            token: 登録するトークン
+        """
+        for index in self._indexes(token):
+            self._bits[index >> 3] |= 1 << (index & 7)
+        self.count += 1
+
+    def __contains__(self, token):
+        return all(self._bits[index >> 3] & (1 << (index & 7)) for index in self._indexes(token))
+
+    def to_dict(self):
+        """フィルタを辞書形式に変換"""
+        return {
+            "version": BLOOM_FORMAT_VERSION,
+            "size": self.size,
+            "hash_count": self.hash_count,
+            "error_rate": self.error_rate,
+            "count": self.count,
+            "salt": self.salt.hex(),
+            "bits": base64.b64encode(bytes(self._bits)).decode('ascii')
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        辞書形式からフィルタを復元
+
+        Args:
+            data: to_dictで作成した辞書
+
+        Returns:
+            PHIBloomFilterインスタンス
+        """
+        if data.get("version") != BLOOM_FORMAT_VERSION:
+            raise ValueError(f"未対応のBloomフィルタ形式です: {data.get('version')}")
+        bloom = cls.__new__(cls)
+        bloom.size = data["size"]
+        bloom.hash_count = data["hash_count"]
+        bloom.error_rate = data["error_rate"]
+        bloom.count = data["count"]
+        bloom.salt = bytes.fromhex(data["salt"])
+        bloom._bits = bytearray(base64.b64decode(data["bits"]))
+        return bloom
+
+    def save(self, path):
+        """
+        フィルタをJSONファイルに保存
+
+        Args:
+            path: 保存先のパス
+
+        Returns:
+            保存したファイルのパス
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """
+        JSONファイルからフィルタを読み込む
+
+        Args:
+            path: フィルタファイルのパス
+
+        Returns:
+            PHIBloomFilterインスタンス
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
@@ -3,9 +3,145 @@
 """
 
 import os
+import io
 import pydicom
-import numpy as np
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from ..config import DEFAULT_SCAN_WORKERS
+
+# 検出時にヘッダーから取得するタグ（索引情報の項目）
+PROBE_TAGS = ["SOPClassUID", "Modality", "PatientID", "StudyInstanceUID", "SeriesInstanceUID"]
+
+def _is_dicom_header(header):
+    """先頭128バイトのプリアンブルの後に'DICM'があるか確認"""
+    return header[128:132] == b"DICM"
+
+def _has_dicom_preamble(file_path):
+    """ファイルがプリアンブルと'DICM'で始まるか確認"""
+    with open(file_path, 'rb') as f:
+        return _is_dicom_header(f.read(132))
+
+def looks_like_dicom(dcm):
+    """
+    プリアンブルのないデータをDICOMとみなすか判定
+    
+    Args:
+        dcm: force=Trueで読み込んだpydicomのデータセット
+        
+    Returns:
+        DICOMファイルとみなせる場合はTrue
+    """
+    # DICOMファイルの判定条件を緩和
+    # SOPClassUID・モダリティ・患者IDのいずれかがあるか、
+    # 少なくとも5つ以上のDICOMタグがあればDICOMファイルとみなす
+    return (hasattr(dcm, 'SOPClassUID') or hasattr(dcm, 'Modality')
+            or hasattr(dcm, 'PatientID') or len(dcm) >= 5)
+
+def is_dicom_bytes(data):
+    """
+    メモリ上のデータがDICOMファイルか判定（ディレクトリ検索と同じ条件）
+    
+    Args:
+        data: ファイルの内容（bytes）
+        
+    Returns:
+        DICOMファイルであればTrue
+    """
+    if _is_dicom_header(data[:132]):
+        return True
+    try:
+        dcm = pydicom.dcmread(io.BytesIO(data), force=True, stop_before_pixels=True)
+    except Exception:
+        return False
+    return looks_like_dicom(dcm)
+
+def _header_text(dcm, keyword):
+    """ヘッダーの値を文字列として取得（未変換の要素は値の変換を省略してデコード）"""
+    elem = dcm.get_item(keyword)
+    if elem is None or elem.value is None:
+        return ""
+    if isinstance(elem.value, bytes):
+        return elem.value.decode('latin-1', errors='ignore').strip("\x00 ")
+    return str(elem.value)
+
+def _probe_dicom_file(file_path):
+    """
+    ファイルのヘッダーを1回だけ読み込み、DICOMファイルであれば索引情報を返す
+    
+    プリアンブルを持つファイルは索引に必要なタグだけを読み込む。
+    プリアンブルのないファイルはヘッダー全体を読み込み、従来の条件で判定する。
+    
+    Args:
+        file_path: ファイルのパス
+        
+    Returns:
+        索引情報の辞書、DICOMファイルでない場合はNone
+    """
+    try:
+        stat = file_path.stat()
+        if _has_dicom_preamble(file_path):
+            dcm = pydicom.dcmread(str(file_path), stop_before_pixels=True, specific_tags=PROBE_TAGS)
+        else:
+            # DICOMファイルとして読み込めるか確認
+            dcm = pydicom.dcmread(str(file_path), force=True, stop_before_pixels=True)
+            if not looks_like_dicom(dcm):
+                return None
+    except Exception:
+        return None
+    
+    return {
+        "path": file_path,
+        "size": stat.st_size,
+        # 同じディレクトリ内をディスク上の配置に近い順に読み込むためのiノード番号
+        "inode": stat.st_ino,
+        "modality": _header_text(dcm, "Modality"),
+        "patient_id": _header_text(dcm, "PatientID"),
+        "study_uid": _header_text(dcm, "StudyInstanceUID"),
+        "series_uid": _header_text(dcm, "SeriesInstanceUID"),
+        "sop_class_uid": _header_text(dcm, "SOPClassUID")
+    }
+
+def _walk_files(directory):
+    """ディレクトリ内の全ファイルのパスを再帰的に列挙"""
+    for root, _, files in os.walk(directory):
+        for file in files:
+            yield Path(root) / file
+
+def _probe_files(file_paths, workers=1):
+    """
+    ファイルのヘッダーを読み込み、DICOMファイルの索引情報を収集
+    
+    Args:
+        file_paths: ファイルパスのリスト
+        workers: ヘッダーを並列に読み込むスレッド数
+        
+    Returns:
+        file_pathsと同じ順序の索引情報（DICOMファイルでない場合はNone）のリスト
+    """
+    if workers <= 1 or len(file_paths) < 2:
+        return [_probe_dicom_file(file_path) for file_path in file_paths]
+    
+    # ヘッダーの読み込みはI/O待ちが主体のため、スレッドで並列化する
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_probe_dicom_file, file_paths))
+
+def scan_dicom_files(directory, workers=1):
+    """
+    ディレクトリ内のDICOMファイルを再帰的に検索し、ヘッダーの索引情報を収集
+    
+    検出時に読み込んだヘッダーからモダリティ・患者ID・スタディ/シリーズUIDなどを
+    取り出すため、後続の処理（層別抽出・集計など）でヘッダーを読み直す必要がない。
+    
+    Args:
+        directory: 検索するディレクトリのパス
+        workers: ヘッダーを並列に読み込むスレッド数
+        
+    Returns:
+        索引情報（path, size, inode, modality, patient_id, study_uid, series_uid, sop_class_uid）の辞書のリスト
+    """
+    records = _probe_files(list(_walk_files(directory)), workers)
+    return [record for record in records if record is not None]
 
 def find_dicom_files(directory):
     """
@@ -17,39 +153,7 @@ def find_dicom_files(directory):
     Returns:
         DICOMファイルのパスのリスト
     """
-    dicom_files = []
-    for root, _, files in os.walk(directory):
-        for file in files:
-            file_path = Path(root) / file
-            try:
-                # DICOMファイルとして読み込めるか確認
-                dcm = pydicom.dcmread(str(file_path), force=True, stop_before_pixels=True)
-                
-                # DICOMファイルの判定条件を緩和
-                # SOPClassUIDがなくても、他の一般的なDICOMタグがあればDICOMファイルとみなす
-                is_dicom = False
-                
-                # SOPClassUIDがあればDICOMファイル
-                if hasattr(dcm, 'SOPClassUID'):
-                    is_dicom = True
-                # モダリティがあればDICOMファイル
-                elif hasattr(dcm, 'Modality'):
-                    is_dicom = True
-                # 患者IDがあればDICOMファイル
-                elif hasattr(dcm, 'PatientID'):
-                    is_dicom = True
-                # 少なくとも5つ以上のDICOMタグがあればDICOMファイルとみなす
-                elif len(dcm) >= 5:
-                    is_dicom = True
-                
-                if is_dicom:
-                    dicom_files.append(file_path)
-            except Exception as e:
-                # エラーの詳細をログに出力（デバッグ用）
-                # print(f"ファイル読み込みエラー: {file_path} - {e}")
-                pass
-    
-    return dicom_files
+    return [record["path"] for record in scan_dicom_files(directory)]
 
 def get_relative_path(file_path, base_dir):
     """
@@ -114,14 +218,35 @@ def copy_directory_structure(src_dir, dst_dir):
     
     return created_dirs
 
-def compare_directory_structure(original_dir, anonymized_dir, log_func=print):
+def _count_by(records, field):
+    """索引情報を指定したフィールドの値ごとに集計"""
+    counts = {}
+    for record in records:
+        value = record[field]
+        if value:
+            counts[value] = counts.get(value, 0) + 1
+    return counts
+
+def _format_size(size):
+    """バイト数を読みやすい単位に変換"""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+def compare_directory_structure(original_dir, anonymized_dir, log_func=print, workers=None):
     """
     2つのディレクトリの構造を比較し、詳細なレポートを生成
     
+    両ディレクトリのファイルをまとめて1回ずつだけヘッダーを読み込み（並列）、
+    DICOMファイルの判定とモダリティ・SOPクラス・ファイルサイズの集計を同時に行う。
+    
     Args:
         original_dir: 原本ディレクトリ
         anonymized_dir: 匿名化ディレクトリ
         log_func: ログ出力関数
+        workers: ヘッダーを並列に読み込むスレッド数（省略時は設定値）
         
     Returns:
         比較結果を含む辞書
@@ -133,9 +258,13 @@ def compare_directory_structure(original_dir, anonymized_dir, log_func=print):
         log_func("指定されたディレクトリが存在しません。")
         return {"summary": ["指定されたディレクトリが存在しません。"]}
     
-    # ファイル数をカウント
-    original_files = find_dicom_files(original_dir)
-    anonymized_files = find_dicom_files(anonymized_dir)
+    # 両ディレクトリのファイルを1つのプールで並列に検査
+    original_paths = list(_walk_files(original_dir))
+    anonymized_paths = list(_walk_files(anonymized_dir))
+    records = _probe_files(original_paths + anonymized_paths,
+                           DEFAULT_SCAN_WORKERS if workers is None else workers)
+    original_files = [record for record in records[:len(original_paths)] if record is not None]
+    anonymized_files = [record for record in records[len(original_paths):] if record is not None]
     
     log_func(f"原本ディレクトリのDICOMファイル数: {len(original_files)}")
     log_func(f"匿名化ディレクトリのDICOMファイル数: {len(anonymized_files)}")
@@ -148,6 +277,11 @@ def compare_directory_structure(original_dir, anonymized_dir, log_func=print):
     summary.append(f"原本DICOMファイル数: {len(original_files)}")
     summary.append(f"匿名化DICOMファイル数: {len(anonymized_files)}")
     
+    original_size = sum(record["size"] for record in original_files)
+    anonymized_size = sum(record["size"] for record in anonymized_files)
+    summary.append(f"原本DICOM総サイズ: {_format_size(original_size)}")
+    summary.append(f"匿名化DICOM総サイズ: {_format_size(anonymized_size)}")
+    
     if len(original_files) == len(anonymized_files):
         summary.append("\n✅ ファイル数一致: 原本と匿名化ファイルの数が一致しています。")
     else:
@@ -157,33 +291,9 @@ def compare_directory_structure(original_dir, anonymized_dir, log_func=print):
         else:
             summary.append(f"  過剰ファイル数: {len(anonymized_files) - len(original_files)}")
     
-    # モダリティの分布を取得
-    original_modalities = {}
-    anonymized_modalities = {}
-    
-    for file_path in original_files:
-        try:
-            dcm = pydicom.dcmread(str(file_path), force=True, stop_before_pixels=True)
-            if hasattr(dcm, 'Modality'):
-                modality = dcm.Modality
-                if modality in original_modalities:
-                    original_modalities[modality] += 1
-                else:
-                    original_modalities[modality] = 1
-        except:
-            pass
-    
-    for file_path in anonymized_files:
-        try:
-            dcm = pydicom.dcmread(str(file_path), force=True, stop_before_pixels=True)
-            if hasattr(dcm, 'Modality'):
-                modality = dcm.Modality
-                if modality in anonymized_modalities:
-                    anonymized_modalities[modality] += 1
-                else:
-                    anonymized_modalities[modality] = 1
-        except:
-            pass
+    # モダリティの分布（検出時のヘッダー情報から集計）
+    original_modalities = _count_by(original_files, "modality")
+    anonymized_modalities = _count_by(anonymized_files, "modality")
     
     # モダリティ分布をサマリーに追加
     summary.append("\n=== モダリティ分布 ===")
@@ -197,13 +307,31 @@ def compare_directory_structure(original_dir, anonymized_dir, log_func=print):
         status = "✅" if orig_count == anon_count else "⚠️"
         summary.append(f"{status} {modality}: 原本 {orig_count}, 匿名化 {anon_count}")
     
+    # SOPクラスの分布
+    original_sop_classes = _count_by(original_files, "sop_class_uid")
+    anonymized_sop_classes = _count_by(anonymized_files, "sop_class_uid")
+    
+    summary.append("\n=== SOPクラス分布 ===")
+    for sop_class_uid in sorted(set(original_sop_classes) | set(anonymized_sop_classes)):
+        orig_count = original_sop_classes.get(sop_class_uid, 0)
+        anon_count = anonymized_sop_classes.get(sop_class_uid, 0)
+        status = "✅" if orig_count == anon_count else "⚠️"
+        name = pydicom.uid.UID(sop_class_uid).name
+        summary.append(f"{status} {name}: 原本 {orig_count}, 匿名化 {anon_count}")
+    
     return {
         "summary": summary,
         "original_files": len(original_files),
         "anonymized_files": len(anonymized_files),
+        "original_size": original_size,
+        "anonymized_size": anonymized_size,
         "modality_data": {
             "modalities": modalities,
             "original_counts": original_counts,
             "anonymized_counts": anonymized_counts
+        },
+        "sop_class_data": {
+            "original_counts": original_sop_classes,
+            "anonymized_counts": anonymized_sop_classes
         }
     }
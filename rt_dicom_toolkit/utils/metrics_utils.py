@@ -0,0 +1,285 @@
+"""
+処理中の状態をPrometheus形式のメトリクスとして公開するユーティリティ
+
+カウンターはスレッドごとの辞書に加算し、出力時に全スレッド分を合計する。
+各スレッドは自分の辞書にだけ書き込むため、処理中の加算ではロックを取らない
+（ロックはスレッドが初めて加算するときの登録時のみ）。終了したスレッドの辞書は
+登録時と出力時に終了済みの合計へまとめて破棄するため、受信の接続やデーモンのジョブごとに
+スレッドが作られる常駐プロセスでも辞書は増え続けない。ゲージは出力時に
+値を返す関数を呼び出して取得する。
+
+公開方法は次の2つ:
+    - MetricsServer: ローカルのHTTPエンドポイント（/metrics）
+    - TextfileExporter: 一定間隔で書き換えるテキストファイル（node_exporterのtextfile collector用）
+"""
+
+import os
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ..config import DEFAULT_METRICS_HOST, DEFAULT_METRICS_INTERVAL
+
+# Prometheusのテキスト形式のContent-Type
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    """ラベルの値をPrometheusの表記用にエスケープ"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    """ラベルのタプルをPrometheusの表記に変換"""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _format_value(value):
+    """数値をPrometheusの表記に変換"""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """カウンターとゲージを保持し、Prometheusのテキスト形式で出力するクラス"""
+
+    def __init__(self):
+        # メトリクス名 → (種類, 説明)
+        self.descriptions = {}
+        # メトリクス名 → 値を返す関数（ゲージ）
+        self.gauges = {}
+        # スレッドごとのカウンター（(スレッド, (名前, ラベル) → 値) のリスト）
+        self._shards = []
+        # 終了したスレッドのカウンターの合計（(名前, ラベル) → 値）
+        self._retired = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def describe(self, name, metric_type, help_text):
+        """
+        メトリクスの種類と説明を登録
+
+        Args:
+            name: メトリクス名
+            metric_type: 'counter' または 'gauge'
+            help_text: 説明
+        """
+        self.descriptions[name] = (metric_type, help_text)
+
+    def inc(self, name, value=1, labels=()):
+        """
+        カウンターに加算（ロックを取らない）
+
+        Args:
+            name: メトリクス名
+            value: 加算する値
+            labels: (ラベル名, 値) のタプルのタプル
+        """
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._register_shard()
+        key = (name, labels)
+        shard[key] = shard.get(key, 0) + value
+
+    def _register_shard(self):
+        """現在のスレッド用のカウンターを作成して登録"""
+        shard = {}
+        self._local.shard = shard
+        with self._lock:
+            self._retire_finished_locked()
+            self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _retire_finished_locked(self):
+        """終了したスレッドのカウンターを合計に移して破棄（ロックを取った状態で呼び出す）"""
+        alive = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+                continue
+            # 終了したスレッドはもう加算しないため、そのまま合計に移せる
+            for key, value in shard.items():
+                self._retired[key] = self._retired.get(key, 0) + value
+        self._shards = alive
+
+    def _snapshot(self):
+        """終了済みの合計と実行中のスレッドのカウンターのコピーのリストを取得"""
+        with self._lock:
+            self._retire_finished_locked()
+            shards = [dict(self._retired)]
+            # 他のスレッドが加算中でも辞書のコピーは1回の操作で行われる
+            shards.extend(dict(shard) for _, shard in self._shards)
+        return shards
+
+    def value(self, name):
+        """
+        カウンターの現在値（全スレッド・全ラベルの合計）を取得
+
+        Args:
+            name: メトリクス名
+
+        Returns:
+            合計値
+        """
+        return sum(value for shard in self._snapshot() for (key, _), value in shard.items() if key == name)
+
+    def gauge(self, name, func, help_text=""):
+        """
+        出力時に値を取得するゲージを登録
+
+        Args:
+            name: メトリクス名
+            func: 値、または (ラベル, 値) のリストを返す関数
+            help_text: 説明
+        """
+        self.describe(name, "gauge", help_text)
+        self.gauges[name] = func
+
+    def remove_gauge(self, name):
+        """ゲージの登録を解除"""
+        self.gauges.pop(name, None)
+
+    def collect(self):
+        """
+        全スレッドのカウンターとゲージの現在値を取得
+
+        Returns:
+            メトリクス名 → {ラベル: 値} の辞書
+        """
+        metrics = {}
+        for shard in self._snapshot():
+            for (name, labels), value in shard.items():
+                series = metrics.setdefault(name, {})
+                series[labels] = series.get(labels, 0) + value
+        for name, func in list(self.gauges.items()):
+            try:
+                value = func()
+            except Exception:
+                continue
+            if isinstance(value, (list, tuple)):
+                metrics[name] = dict(value)
+            elif value is not None:
+                metrics[name] = {(): value}
+        return metrics
+
+    def render(self):
+        """
+        Prometheusのテキスト形式で出力
+
+        Returns:
+            メトリクスの文字列
+        """
+        lines = []
+        for name, series in sorted(self.collect().items()):
+            metric_type, help_text = self.descriptions.get(name, ("untyped", ""))
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """/metricsへのリクエストにメトリクスを返すハンドラー"""
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 取得のたびにアクセスログを出力しない
+        pass
+
+
+class MetricsServer:
+    """メトリクスをHTTPで公開するサーバー（バックグラウンドのスレッドで動作）"""
+
+    def __init__(self, registry, port, host=None):
+        """
+        初期化
+
+        Args:
+            registry: MetricsRegistryインスタンス
+            port: 待ち受けポート
+            host: 待ち受けアドレス（省略時は設定値。既定ではローカルからのみ接続可能）
+        """
+        self.server = ThreadingHTTPServer((host or DEFAULT_METRICS_HOST, port), _MetricsHandler)
+        self.server.daemon_threads = True
+        self.server.registry = registry
+        self._thread = None
+
+    @property
+    def address(self):
+        """待ち受けている (アドレス, ポート)"""
+        return self.server.server_address
+
+    def start(self):
+        """公開を開始"""
+        self._thread = threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """公開を終了"""
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TextfileExporter:
+    """メトリクスを一定間隔でテキストファイルに書き出すクラス（バックグラウンドのスレッドで動作）"""
+
+    def __init__(self, registry, path, interval=None):
+        """
+        初期化
+
+        Args:
+            registry: MetricsRegistryインスタンス
+            path: 書き出すファイルのパス（node_exporterで読み込む場合は拡張子を.promにする）
+            interval: 書き出す間隔（秒、省略時は設定値）
+        """
+        self.registry = registry
+        self.path = Path(path)
+        self.interval = interval or DEFAULT_METRICS_INTERVAL
+        self._stop = threading.Event()
+        self._thread = None
+
+    def write(self):
+        """現在の値を書き出す（読み込み途中のファイルが見えないよう一時ファイルから置き換える）"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(self.registry.render())
+        os.replace(temp_path, self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except OSError:
+                # 出力先に一時的に書き込めない場合は次の間隔で再試行する
+                pass
+
+    def start(self):
+        """書き出しを開始"""
+        self.write()
+        self._thread = threading.Thread(target=self._run, name="metrics-textfile", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """書き出しを終了し、最終的な値を書き出す"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.write()
@@ -0,0 +1,199 @@
+"""
+個人情報（PHI）の抽出と正規化に関連するユーティリティ関数を提供するモジュール
+"""
+
+import re
+
+# 原本から照合パターンとして収集するタグ
+PHI_SOURCE_TAGS = [
+    "PatientName",
+    "PatientID",
+    "PatientBirthDate",
+    "OtherPatientIDs",
+    "OtherPatientNames",
+    "ReferringPhysicianName",
+    "PhysiciansOfRecord",
+    "PerformingPhysicianName",
+    "OperatorsName"
+]
+
+# Bloomフィルタに登録する氏名タグ（構成要素ごとにも登録）
+PHI_NAME_TAGS = {
+    "PatientName",
+    "ReferringPhysicianName",
+    "PhysiciansOfRecord",
+    "PerformingPhysicianName",
+    "OperatorsName"
+}
+
+# Bloomフィルタに登録する氏名以外のタグ（値全体を登録）
+PHI_VALUE_TAGS = {
+    "PatientID",
+    "PatientBirthDate",
+    "PatientAddress",
+    "PatientTelephoneNumbers",
+    "AccessionNumber",
+    "InstitutionName",
+    "InstitutionAddress",
+    "StationName",
+    "DeviceSerialNumber",
+    "StudyDate",
+    "SeriesDate",
+    "AcquisitionDate",
+    "ContentDate"
+}
+
+# トークン照合で連結して照合する最大トークン数
+MAX_TOKEN_NGRAM = 4
+
+# 文字列として検査するVR（数値・UID・バイナリ系は対象外）
+TEXT_VRS = {"AE", "DA", "DT", "LO", "LT", "PN", "SH", "ST", "TM", "UC", "UT", "UN"}
+
+# 照合パターンとして扱う最小文字数（短すぎる文字列は誤検出が多い）
+MIN_PATTERN_LENGTH = 3
+
+_SEPARATOR_PATTERN = re.compile(r"[\^=\s\\]+")
+_TOKEN_PATTERN = re.compile(r"[0-9A-Z\u3040-\u30ff\u3400-\u9fff]+")
+
+
+def normalize_phi_text(value):
+    """
+    照合用に文字列を正規化（大文字化・区切り文字の空白化）
+
+    Args:
+        value: 正規化する値
+
+    Returns:
+        正規化された文字列
+    """
+    return _SEPARATOR_PATTERN.sub(" ", str(value)).strip().upper()
+
+
+def tokenize_phi_text(value):
+    """
+    正規化した文字列を英数字・日本語のトークンに分割
+
+    Args:
+        value: 分割する値
+
+    Returns:
+        トークンのリスト
+    """
+    return _TOKEN_PATTERN.findall(normalize_phi_text(value))
+
+
+def phi_token_keys(tag, value):
+    """
+    置換されたPHI値からBloomフィルタに登録するキーを生成
+
+    キーはトークンを空白で連結した文字列。氏名は構成要素ごとのキーも生成する。
+
+    Args:
+        tag: タグ名
+        value: 元の値
+
+    Returns:
+        キーの集合（対象外のタグの場合は空集合）
+    """
+    if tag not in PHI_NAME_TAGS and tag not in PHI_VALUE_TAGS:
+        return set()
+
+    keys = set()
+    tokens = tokenize_phi_text(value)
+    if tokens:
+        keys.add(" ".join(tokens))
+    if tag in PHI_NAME_TAGS:
+        keys.update(tokens)
+    return {key for key in keys if len(key) >= MIN_PATTERN_LENGTH}
+
+
+def iter_token_keys(text):
+    """
+    文字列からBloomフィルタに照会するキー（トークンのn-gram）を列挙
+
+    Args:
+        text: 照会する文字列
+
+    Yields:
+        トークンを空白で連結したキー
+    """
+    tokens = tokenize_phi_text(text)
+    for start in range(len(tokens)):
+        for end in range(start + 1, min(start + MAX_TOKEN_NGRAM, len(tokens)) + 1):
+            yield " ".join(tokens[start:end])
+
+
+def element_text(elem):
+    """
+    データ要素の値を照合用の文字列として取得
+
+    Args:
+        elem: pydicomのデータ要素
+
+    Returns:
+        文字列、文字列として扱えない場合はNone
+    """
+    value = elem.value
+    if value is None or value == "":
+        return None
+    if isinstance(value, bytes):
+        # VRが不明なプライベートタグなどはASCIIとして解釈
+        return value.decode('latin-1', errors='ignore').strip("\x00 ")
+    if elem.VM > 1:
+        return "\\".join(str(v) for v in value)
+    return str(value)
+
+
+def iter_text_elements(dataset, path=""):
+    """
+    データセット内の文字列要素をシーケンスも含めて再帰的に列挙
+
+    Args:
+        dataset: pydicomのデータセット
+        path: 親要素のパス（再帰呼び出し用）
+
+    Yields:
+        (要素のパス, データ要素, 文字列) のタプル
+    """
+    for elem in dataset:
+        name = elem.keyword or str(elem.tag)
+        elem_path = f"{path}.{name}" if path else name
+        if elem.VR == "SQ":
+            for index, item in enumerate(elem.value or []):
+                if item is not None:
+                    yield from iter_text_elements(item, f"{elem_path}[{index}]")
+        elif elem.VR in TEXT_VRS:
+            text = element_text(elem)
+            if text:
+                yield elem_path, elem, text
+
+
+def collect_phi_values(dataset, tags=None):
+    """
+    データセットから照合対象のPHI値を収集
+
+    氏名は姓・名などの構成要素も個別の値として収集する。
+
+    Args:
+        dataset: pydicomのデータセット
+        tags: 収集するタグ名のリスト（省略時はPHI_SOURCE_TAGS）
+
+    Returns:
+        正規化された値をキー、取得元タグ名を値とする辞書
+    """
+    values = {}
+    for tag in tags or PHI_SOURCE_TAGS:
+        elem = dataset.data_element(tag) if tag in dataset else None
+        if elem is None or elem.value is None or elem.value == "":
+            continue
+
+        for item in (list(elem.value) if elem.VM > 1 else [elem.value]):
+            text = str(item)
+            candidates = [normalize_phi_text(text)]
+            if "^" in text:
+                # 氏名の構成要素（姓・名など）も個別に照合
+                candidates += [normalize_phi_text(part) for part in text.split("^")]
+            for candidate in candidates:
+                if len(candidate) >= MIN_PATTERN_LENGTH:
+                    values.setdefault(candidate, tag)
+    return values
@@ -0,0 +1,230 @@
+"""
+匿名化・検証の実行をcProfileとtracemallocでプロファイルするユーティリティ
+
+実行全体を1つのcProfileに集計して.profファイル（pstats・snakevizなどで読み込み可能）に保存し、
+段階の区切りごとに取得したtracemallocのスナップショットから、メモリ使用量と
+メモリ確保箇所の上位をテキストのレポートに書き出す。
+
+ファイル単位の処理はN件に1件だけプロファイルしてオーバーヘッドを抑えられる。
+Python 3.12以降のcProfileは同時に1つしか有効にできないため、プロファイルは
+一度に1つのスレッドだけで行う（並列処理中に他のスレッドがプロファイル中の場合、
+そのファイルは対象外になる）。また3.12以降では、プロファイル中に他のスレッドで
+実行された関数も集計に含まれる。
+"""
+
+import gc
+import io
+import time
+import pstats
+import cProfile
+import itertools
+import threading
+import contextlib
+import tracemalloc
+from pathlib import Path
+from datetime import datetime
+
+from ..config import DEFAULT_PROFILE_SAMPLE_EVERY, DEFAULT_PROFILE_TOP
+
+# スナップショットから除外するメモリ確保箇所（tracemalloc自身とモジュールの読み込み）
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def _megabytes(size):
+    """バイト数をMB表記に変換"""
+    return f"{size / 1024 / 1024:.1f} MB"
+
+
+class RunProfiler:
+    """実行単位のcProfileとtracemallocのスナップショットを記録するクラス"""
+
+    def __init__(self, output_dir, name, sample_every=None, trace_memory=True, top=None):
+        """
+        初期化
+
+        Args:
+            output_dir: .profファイルとレポートの出力先
+            name: 出力ファイル名の接頭辞（例: rt_anonymization_profile）
+            sample_every: ファイル単位の処理をN件に1件だけプロファイルする（省略時は設定値）
+            trace_memory: tracemallocでメモリ使用量を記録するか
+            top: レポートに出力する件数（省略時は設定値）
+        """
+        self.output_dir = Path(output_dir)
+        self.name = name
+        self.sample_every = max(1, sample_every or DEFAULT_PROFILE_SAMPLE_EVERY)
+        self.trace_memory = trace_memory
+        self.top = top or DEFAULT_PROFILE_TOP
+        self.profile = cProfile.Profile()
+        # (ラベル, スナップショット, 現在のメモリ使用量, 前のスナップショットからのピーク) のリスト
+        self.snapshots = []
+        self.files = 0
+        self.sampled_files = 0
+        self._counter = itertools.count()
+        # プロファイル中のスレッドは1つだけにする
+        self._active = threading.Lock()
+        self._lock = threading.Lock()
+        self._owns_tracemalloc = False
+        self._started = None
+
+    def start(self):
+        """プロファイルを開始"""
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._owns_tracemalloc = True
+            self.snapshot("開始")
+        self._started = time.perf_counter()
+        return self
+
+    def snapshot(self, label):
+        """
+        メモリのスナップショットを取得（段階の区切りで呼び出す）
+
+        Args:
+            label: スナップショットの名前（例: 検索後）
+        """
+        if not self.trace_memory or not tracemalloc.is_tracing():
+            return
+        # 循環参照で残っている解放待ちのオブジェクト（pydicomのデータセットなど）を除いて計測する
+        gc.collect()
+        snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        current, peak = tracemalloc.get_traced_memory()
+        # ピークは段階ごとの値にする（Python 3.9以降）
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        with self._lock:
+            self.snapshots.append((label, snapshot, current, peak))
+
+    @contextlib.contextmanager
+    def section(self, label=None):
+        """
+        呼び出し元のスレッドの処理をプロファイルする（ファイル検索など実行単位の段階用）
+
+        Args:
+            label: 終了時に取得するスナップショットの名前（省略時は取得しない）
+        """
+        with self._active:
+            self.profile.enable()
+            try:
+                yield
+            finally:
+                self.profile.disable()
+        if label:
+            self.snapshot(label)
+
+    @contextlib.contextmanager
+    def file(self):
+        """1ファイルの処理をプロファイルする（N件に1件、他のスレッドがプロファイル中でない場合のみ）"""
+        index = next(self._counter)
+        with self._lock:
+            self.files += 1
+        if index % self.sample_every or not self._active.acquire(blocking=False):
+            yield
+            return
+        try:
+            with self._lock:
+                self.sampled_files += 1
+            self.profile.enable()
+            try:
+                yield
+            finally:
+                self.profile.disable()
+        finally:
+            self._active.release()
+
+    def stop(self):
+        """
+        プロファイルを終了し、.profファイルとレポートを保存
+
+        Returns:
+            (.profファイルのパス, レポートのパス) のタプル
+        """
+        elapsed = time.perf_counter() - self._started if self._started is not None else 0.0
+        self.snapshot("終了")
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+            self._owns_tracemalloc = False
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        stem = f"{self.name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        prof_path = self.output_dir / f"{stem}.prof"
+        report_path = self.output_dir / f"{stem}.txt"
+
+        self.profile.create_stats()
+        has_stats = bool(self.profile.stats)
+        if has_stats:
+            self.profile.dump_stats(str(prof_path))
+        with open(report_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(self.report_lines(elapsed, has_stats)) + "\n")
+        return (prof_path if has_stats else None), report_path
+
+    def report_lines(self, elapsed, has_stats=True):
+        """
+        レポートの行を作成
+
+        Args:
+            elapsed: プロファイルの開始から終了までの時間（秒）
+            has_stats: cProfileの集計結果があるか
+
+        Returns:
+            レポートの文字列のリスト
+        """
+        lines = [
+            f"プロファイル: {self.name}",
+            f"経過時間: {elapsed:.3f}秒",
+            f"プロファイルしたファイル: {self.sampled_files}/{self.files}（{self.sample_every}件に1件）",
+            "",
+            f"=== 関数ごとの処理時間（累積時間順・上位{self.top}件） ===",
+        ]
+        if has_stats:
+            stream = io.StringIO()
+            pstats.Stats(self.profile, stream=stream).strip_dirs().sort_stats("cumulative").print_stats(self.top)
+            lines.extend(stream.getvalue().strip("\n").splitlines())
+        else:
+            lines.append("（プロファイルした処理がありません）")
+
+        if not self.snapshots:
+            return lines
+
+        lines += ["", "=== メモリ使用量（tracemalloc） ==="]
+        for label, _, current, peak in self.snapshots:
+            lines.append(f"  {label}: 現在 {_megabytes(current)}, ピーク {_megabytes(peak)}")
+
+        # メモリ使用量が最大だった時点のメモリ確保箇所
+        label, snapshot, current, _ = max(self.snapshots, key=lambda entry: entry[2])
+        lines += ["", f"=== メモリ確保箇所（{label}・上位{self.top}件） ==="]
+        for stat in snapshot.statistics("lineno")[:self.top]:
+            lines.append(f"  {stat}")
+
+        # 段階ごとに増えたメモリ確保箇所
+        for (before_label, before, _, _), (after_label, after, _, _) in zip(self.snapshots, self.snapshots[1:]):
+            lines += ["", f"=== メモリ増減（{before_label} → {after_label}・上位10件） ==="]
+            for stat in after.compare_to(before, "lineno")[:10]:
+                lines.append(f"  {stat}")
+        return lines
+
+
+def profile_section(profiler, label=None):
+    """
+    プロファイラーが設定されている場合のみ区間をプロファイルするコンテキストマネージャー
+
+    Args:
+        profiler: RunProfilerインスタンス（Noneの場合は何もしない）
+        label: 終了時に取得するスナップショットの名前
+    """
+    return profiler.section(label) if profiler is not None else contextlib.nullcontext()
+
+
+def profile_file(profiler):
+    """
+    プロファイラーが設定されている場合のみ1ファイルの処理をプロファイルするコンテキストマネージャー
+
+    Args:
+        profiler: RunProfilerインスタンス（Noneの場合は何もしない）
+    """
+    return profiler.file() if profiler is not None else contextlib.nullcontext()
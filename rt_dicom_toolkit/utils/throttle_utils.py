@@ -0,0 +1,220 @@
+"""
+入出力の帯域を制限するユーティリティ（トークンバケット）
+
+共有のNASで大量のファイルを処理すると、同じストレージを使う臨床システム（治療計画装置など）の
+応答が遅くなる。読み込みと書き込みのそれぞれに、バイト数（MB/秒）とファイル数（件/秒）の
+トークンバケットを設け、上限を超える場合はワーカーを待たせる。
+
+1ファイルが1秒分の上限より大きい場合も処理できるよう、バケットは不足分を前借りできる。
+前借りした分を返し終えるまで次の呼び出しを待たせるため、平均の速度は上限に収まる。
+上限は処理中に変更でき、待っているワーカーにもすぐに反映される。
+"""
+
+import time
+import threading
+
+from ..config import DEFAULT_THROTTLE_BURST_SECONDS
+
+# 上限の名前（set_limitsのキー）
+LIMIT_KEYS = ("read_mbps", "read_iops", "write_mbps", "write_iops")
+
+# 上限の変更を確認する間隔（待ち時間がこれより長い場合も途中で起きて確認する）
+MAX_WAIT_SECONDS = 0.5
+
+# 入出力の方向と表示名
+DIRECTION_NAMES = {"read": "読み込み", "write": "書き込み"}
+
+
+class TokenBucket:
+    """一定の速度でトークンが補充されるバケット（スレッドから並列に使用可能）"""
+
+    def __init__(self, rate=None, burst_seconds=None):
+        """
+        初期化
+
+        Args:
+            rate: 1秒あたりに補充するトークン数（Noneの場合は無制限）
+            burst_seconds: 何秒分のトークンまで貯められるか（省略時は設定値）
+        """
+        self.burst_seconds = DEFAULT_THROTTLE_BURST_SECONDS if burst_seconds is None else burst_seconds
+        self.rate = None
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+        self._condition = threading.Condition()
+        self.set_rate(rate)
+
+    def _refill(self):
+        """経過時間に応じてトークンを補充"""
+        now = time.monotonic()
+        if self.rate is not None:
+            self._tokens = min(self.rate * self.burst_seconds, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def set_rate(self, rate):
+        """
+        補充の速度を変更（待っている呼び出しにも反映される）
+
+        Args:
+            rate: 1秒あたりに補充するトークン数（Noneまたは0以下の場合は無制限）
+        """
+        with self._condition:
+            self._refill()
+            self.rate = rate if rate and rate > 0 else None
+            if self.rate is None:
+                self._tokens = 0.0
+            self._condition.notify_all()
+
+    def acquire(self, amount=1):
+        """
+        トークンを取得（前借りした分を返し終えるまで待つ）
+
+        Args:
+            amount: 取得するトークン数
+
+        Returns:
+            待った時間（秒）
+        """
+        if self.rate is None:
+            return 0.0
+        started = None
+        with self._condition:
+            while self.rate is not None:
+                self._refill()
+                if self._tokens >= 0:
+                    self._tokens -= amount
+                    break
+                if started is None:
+                    started = time.monotonic()
+                self._condition.wait(min(-self._tokens / self.rate, MAX_WAIT_SECONDS))
+        return time.monotonic() - started if started is not None else 0.0
+
+
+class IOThrottle:
+    """読み込み・書き込みの帯域（MB/秒）とファイル数（件/秒）を制限するクラス"""
+
+    def __init__(self, **limits):
+        """
+        初期化
+
+        Args:
+            **limits: read_mbps, read_iops, write_mbps, write_iops（省略したものは無制限）
+        """
+        self.limits = {key: None for key in LIMIT_KEYS}
+        self._buckets = {key: TokenBucket() for key in LIMIT_KEYS}
+        self.set_limits(**limits)
+
+    def set_limits(self, **limits):
+        """
+        上限を変更（処理中も変更可能）
+
+        Args:
+            **limits: read_mbps, read_iops, write_mbps, write_iops
+                      （省略したものは変更しない、Noneまたは0の場合は無制限）
+        """
+        for key, value in limits.items():
+            if key not in LIMIT_KEYS:
+                raise ValueError(f"不明な上限です: {key}")
+            value = float(value) if value else None
+            if value is not None and value < 0:
+                raise ValueError(f"上限には0以上の値を指定してください: {key}={value}")
+            self.limits[key] = value
+            scale = 1024 * 1024 if key.endswith("_mbps") else 1
+            self._buckets[key].set_rate(value * scale if value else None)
+
+    @property
+    def enabled(self):
+        """いずれかの上限が設定されているか"""
+        return any(value is not None for value in self.limits.values())
+
+    def read(self, size):
+        """
+        1ファイル分の読み込みの許可を待つ
+
+        Args:
+            size: 読み込むバイト数
+
+        Returns:
+            待った時間（秒）
+        """
+        return self._acquire("read", size)
+
+    def write(self, size):
+        """
+        1ファイル分の書き込みを記録し、上限を超えている場合は待つ
+
+        Args:
+            size: 書き込んだバイト数
+
+        Returns:
+            待った時間（秒）
+        """
+        return self._acquire("write", size)
+
+    def _acquire(self, direction, size):
+        """ファイル数とバイト数のバケットからトークンを取得"""
+        waited = self._buckets[f"{direction}_iops"].acquire(1)
+        waited += self._buckets[f"{direction}_mbps"].acquire(size or 0)
+        return waited
+
+    def describe(self):
+        """ログ表示用の上限の文字列"""
+        parts = []
+        for direction, label in DIRECTION_NAMES.items():
+            mbps, iops = self.limits[f"{direction}_mbps"], self.limits[f"{direction}_iops"]
+            rate = f"{mbps:g} MB/秒" if mbps else "無制限"
+            if iops:
+                rate += f", {iops:g} 件/秒"
+            parts.append(f"{label} {rate}")
+        return ", ".join(parts)
+
+
+class IOUsage:
+    """実行単位の読み込み・書き込みの量と、帯域制限で待った時間を集計するクラス"""
+
+    def __init__(self):
+        """初期化"""
+        self.totals = {direction: {"bytes": 0, "files": 0, "waited": 0.0} for direction in DIRECTION_NAMES}
+        self._lock = threading.Lock()
+
+    def add(self, direction, size, waited=0.0):
+        """
+        1ファイル分の入出力を記録
+
+        Args:
+            direction: read または write
+            size: バイト数
+            waited: 帯域制限で待った時間（秒）
+        """
+        with self._lock:
+            totals = self.totals[direction]
+            totals["bytes"] += size or 0
+            totals["files"] += 1
+            totals["waited"] += waited
+
+    def summary(self, wall_seconds, limits=None):
+        """
+        処理サマリーに記録する入出力の量と実効速度を作成
+
+        Args:
+            wall_seconds: 実行単位全体の経過時間（秒）
+            limits: IOThrottle.limitsの辞書（省略時は記録しない）
+
+        Returns:
+            方向（読み込み・書き込み）ごとの集計の辞書
+        """
+        wall_seconds = max(wall_seconds, 1e-9)
+        result = {}
+        with self._lock:
+            for direction, label in DIRECTION_NAMES.items():
+                totals = self.totals[direction]
+                entry = {
+                    "ファイル数": totals["files"],
+                    "MB": round(totals["bytes"] / 1024 / 1024, 3),
+                    "MB/秒": round(totals["bytes"] / 1024 / 1024 / wall_seconds, 3),
+                    "件/秒": round(totals["files"] / wall_seconds, 3),
+                    "制限による待ち時間の合計": round(totals["waited"], 3),
+                }
+                if limits is not None:
+                    entry["上限"] = {"MB/秒": limits[f"{direction}_mbps"], "件/秒": limits[f"{direction}_iops"]}
+                result[label] = entry
+        return result
@@ -2,6 +2,17 @@
 DICOM匿名化検証機能を提供するモジュール
 """
 
-from .core import RTDicomValidator
-
 __all__ = ['RTDicomValidator']
+
+
+def __getattr__(name):
+    """
+    RTDicomValidatorを初回参照時にインポート（PEP 562）
+
+    結果ストアの照会やマニフェストの再検証など、サブモジュールのみを使う場合に
+    検証エンジン全体を読み込まないようにする。
+    """
+    if name == 'RTDicomValidator':
+        from .core import RTDicomValidator
+        return RTDicomValidator
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,253 @@
+"""
+検証ルールのタグ比較を列指向で一括処理するモジュール
+
+複数ファイル分のルールタグの値をNumPyの文字列行列（ファイル×タグ）に展開し、
+状態の分類（削除済み・空白化・変更済み・未変更など）を行列演算で、
+タグごとの統計を列方向の集計で求める。
+"""
+
+import numpy as np
+
+# 値が存在しないことを示す文字列（従来の比較処理と同じ表現）
+MISSING_VALUE = "N/A"
+
+# 状態コードと表示ラベル
+STATUS_DELETED = 0
+STATUS_BLANKED = 1
+STATUS_CHANGED = 2
+STATUS_UNCHANGED = 3
+STATUS_PRESERVED = 4
+STATUS_MODIFIED = 5
+STATUS_SPECIAL = 6
+STATUS_CORRECTLY_KEPT = 7
+STATUS_ORGAN_CHANGED = 8
+STATUS_CORRECTLY_ANONYMIZED = 9
+STATUS_NOT_ANONYMIZED = 10
+
+STATUS_LABELS = (
+    "削除済み",
+    "空白化",
+    "変更済み",
+    "未変更",
+    "保持",
+    "変更",
+    "特殊処理",
+    "正しく保持",
+    "保持すべき臓器名が変更",
+    "正しく匿名化",
+    "匿名化されていない"
+)
+
+# 保持すべき臓器名（匿名化プロファイルと同じ定義）
+PRESERVED_ORGANS = ["lung", "heart", "liver", "kidney", "spinal", "brain"]
+
+# 検証結果のカテゴリ名と検証ルールの属性名
+CATEGORIES = [
+    ("must_anonymize", "must_anonymize_tags"),
+    ("uid_tags", "uid_tags"),
+    ("structure_tags", "structure_tags"),
+    ("optional_tags", "optional_anonymize_tags"),
+    ("rt_specific_tags", "rt_specific_tags")
+]
+
+
+class TagComparisonBatch:
+    """複数ファイル分のタグ比較結果を保持するクラス"""
+
+    def __init__(self, comparator, original, anonymized, level):
+        """
+        行列から状態コードを計算
+
+        Args:
+            comparator: ColumnarTagComparatorインスタンス
+            original: 原本の値の行列（ファイル×タグ）
+            anonymized: 匿名化後の値の行列（ファイル×タグ）
+            level: 匿名化レベル（'full' または 'partial'）
+        """
+        self.comparator = comparator
+        self.original = original
+        self.anonymized = anonymized
+        self.level = level
+        self.status = np.full(original.shape, STATUS_UNCHANGED, dtype=np.int8)
+
+        deleted = anonymized == MISSING_VALUE
+        blanked = anonymized == ""
+        differs = original != anonymized
+
+        for category, _ in CATEGORIES:
+            columns = comparator.slices[category]
+            status = self.status[:, columns]
+            if category == "must_anonymize":
+                status[differs[:, columns]] = STATUS_CHANGED
+                status[blanked[:, columns]] = STATUS_BLANKED
+                status[deleted[:, columns]] = STATUS_DELETED
+            elif category == "uid_tags" or (category == "optional_tags" and level == "full"):
+                status[differs[:, columns]] = STATUS_CHANGED
+                status[deleted[:, columns]] = STATUS_DELETED
+            elif category in ("structure_tags", "optional_tags"):
+                status[:] = np.where(differs[:, columns], STATUS_MODIFIED, STATUS_PRESERVED)
+            else:
+                status[differs[:, columns]] = STATUS_CHANGED
+                status[deleted[:, columns]] = STATUS_DELETED
+                self._classify_roi_names(status, columns, differs)
+            self.status[:, columns] = status
+
+    def _classify_roi_names(self, status, columns, differs):
+        """ROINameの状態を分類（保持すべき臓器名は変更されていないこと）"""
+        if "ROIName" not in self.comparator.index:
+            return
+        column = self.comparator.index["ROIName"]
+        local = column - columns.start
+        original = self.original[:, column]
+        lowered = np.char.lower(original)
+        is_organ = np.zeros(original.shape, dtype=bool)
+        for organ in PRESERVED_ORGANS:
+            is_organ |= np.char.find(lowered, organ) >= 0
+        changed = differs[:, column]
+
+        roi_status = np.where(
+            is_organ,
+            np.where(changed, STATUS_ORGAN_CHANGED, STATUS_CORRECTLY_KEPT),
+            np.where(changed, STATUS_CORRECTLY_ANONYMIZED, STATUS_NOT_ANONYMIZED))
+        roi_status[np.char.find(original, MISSING_VALUE) >= 0] = STATUS_SPECIAL
+        status[:, local] = roi_status
+
+    def __len__(self):
+        return self.original.shape[0]
+
+    def _counts(self, category, mask):
+        """カテゴリのタグごとにマスクの真の数を列方向に集計"""
+        columns = self.comparator.slices[category]
+        counts = mask[:, columns].sum(axis=0)
+        return dict(zip(self.comparator.category_tags[category], counts.tolist()))
+
+    def accumulate(self, summary):
+        """
+        タグごとの統計をサマリーに加算
+
+        Args:
+            summary: validate_filesの集計データ
+        """
+        total = len(self)
+        if total == 0:
+            return
+        status = self.status
+
+        ok = self._counts("must_anonymize", status != STATUS_UNCHANGED)
+        for tag, count in ok.items():
+            summary["must_anonymize_stats"][tag]["anonymized"] += count
+            summary["must_anonymize_stats"][tag]["not_anonymized"] += total - count
+
+        ok = self._counts("uid_tags", status == STATUS_CHANGED)
+        for tag, count in ok.items():
+            summary["uid_stats"][tag]["changed"] += count
+            summary["uid_stats"][tag]["not_changed"] += total - count
+
+        ok = self._counts("structure_tags", status == STATUS_PRESERVED)
+        for tag, count in ok.items():
+            summary["structure_stats"][tag]["preserved"] += count
+            summary["structure_stats"][tag]["not_preserved"] += total - count
+
+        not_ok = self._counts("rt_specific_tags", np.isin(
+            status, [STATUS_UNCHANGED, STATUS_ORGAN_CHANGED, STATUS_NOT_ANONYMIZED]))
+        for tag, count in not_ok.items():
+            summary["rt_specific_stats"][tag]["anonymized"] += total - count
+            summary["rt_specific_stats"][tag]["not_anonymized"] += count
+
+        # 患者ID対応表
+        if "PatientID" in self.comparator.index:
+            column = self.comparator.index["PatientID"]
+            valid = ((self.original[:, column] != MISSING_VALUE)
+                     & (self.anonymized[:, column] != MISSING_VALUE))
+            summary["patient_id_map"].update(
+                zip(self.original[valid, column].tolist(), self.anonymized[valid, column].tolist()))
+
+    def file_results(self, row):
+        """
+        1ファイル分の結果を従来のcompare_dicom_filesと同じ辞書形式で取得
+
+        Args:
+            row: ファイルの行番号
+
+        Returns:
+            カテゴリごとのタグ比較結果を含む辞書
+        """
+        original = self.original[row].tolist()
+        anonymized = self.anonymized[row].tolist()
+        status = self.status[row].tolist()
+        results = {}
+
+        for category, _ in CATEGORIES:
+            columns = self.comparator.slices[category]
+            entries = {}
+            for offset, tag in enumerate(self.comparator.category_tags[category]):
+                column = columns.start + offset
+                code = status[column]
+                entry = {
+                    "original": original[column],
+                    "anonymized": anonymized[column],
+                    "status": STATUS_LABELS[code]
+                }
+                if category == "must_anonymize":
+                    entry["is_anonymized"] = code != STATUS_UNCHANGED
+                elif category == "uid_tags":
+                    entry["changed"] = code == STATUS_CHANGED
+                elif category == "structure_tags":
+                    entry["preserved"] = code == STATUS_PRESERVED
+                elif category == "optional_tags":
+                    entry["changed"] = self.level != "full" or code != STATUS_UNCHANGED
+                entries[tag] = entry
+            results[category] = entries
+
+        return results
+
+
+class ColumnarTagComparator:
+    """検証ルールのタグを列指向で比較するクラス"""
+
+    def __init__(self, rules):
+        """
+        初期化
+
+        Args:
+            rules: ValidationRulesインスタンス
+        """
+        self.tags = []
+        self.slices = {}
+        self.category_tags = {}
+        for category, attribute in CATEGORIES:
+            tags = list(getattr(rules, attribute))
+            self.slices[category] = slice(len(self.tags), len(self.tags) + len(tags))
+            self.category_tags[category] = tags
+            self.tags.extend(tags)
+        self.index = {tag: i for i, tag in enumerate(self.tags)}
+
+    def extract_row(self, dataset):
+        """
+        データセットから全ルールタグの値を文字列として取り出す
+
+        Args:
+            dataset: pydicomのデータセット
+
+        Returns:
+            タグ順に並んだ値の文字列リスト
+        """
+        get = dataset.get
+        return [str(get(tag, MISSING_VALUE)) for tag in self.tags]
+
+    def compare_rows(self, original_rows, anonymized_rows, level="full"):
+        """
+        行のリストから比較結果のバッチを作成
+
+        Args:
+            original_rows: 原本の値の行リスト
+            anonymized_rows: 匿名化後の値の行リスト
+            level: 匿名化レベル（'full' または 'partial'）
+
+        Returns:
+            TagComparisonBatchインスタンス
+        """
+        shape = (len(original_rows), len(self.tags))
+        original = np.array(original_rows, dtype=str).reshape(shape)
+        anonymized = np.array(anonymized_rows, dtype=str).reshape(shape)
+        return TagComparisonBatch(self, original, anonymized, level)
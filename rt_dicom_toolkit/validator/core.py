@@ -11,17 +11,30 @@ import traceback
 import threading
 
 import pydicom
-import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 
 from ..config import (
-    DEFAULT_INPUT_DIR, DEFAULT_ANONYMOUS_DIR, DEFAULT_REPORT_DIR
+    DEFAULT_INPUT_DIR, DEFAULT_ANONYMOUS_DIR, DEFAULT_REPORT_DIR,
+    DEFAULT_DETAILED_REPORT_FORMAT, DEFAULT_SAMPLING_CONFIDENCE, DEFAULT_SAMPLING_THRESHOLD,
+    DEFAULT_PROFILE_SAMPLE_EVERY
 )
 from .rules import ValidationRules
-from .report import generate_summary_report
+from .phi_scanner import ResidualPHIScanner
+from .columnar import ColumnarTagComparator, STATUS_UNCHANGED, STATUS_CHANGED
+from .sampling import (
+    PHI_LEAK_METRIC, group_strata, stratum_label, draw_stratified_sample,
+    lower_confidence_bound, stratified_interval
+)
+from .result_store import ResultStoreWriter
+from .report import (
+    generate_summary_report, generate_bloom_report, save_report,
+    generate_validation_report_filename
+)
 from ..utils.logging_utils import setup_logger
-from ..utils.file_utils import find_dicom_files
+from ..utils.file_utils import find_dicom_files, scan_dicom_files
+from ..utils.phi_utils import iter_text_elements, iter_token_keys
+from ..utils.bloom_filter import PHIBloomFilter
+from ..utils.profiling_utils import RunProfiler, profile_section, profile_file
 
 class RTDicomValidator:
     """放射線治療用DICOMファイルの匿名化検証を行うクラス"""
@@ -41,7 +54,7 @@ class RTDicomValidator:
         self.report_dir = DEFAULT_REPORT_DIR
         
         # ディレクトリが存在しない場合は作成
-        self.report_dir.mkdir(exist_ok=True)
+        self.report_dir.mkdir(exist_ok=True, parents=True)
         
         # ロガーの設定
         self.logger = setup_logger("RTDicomValidator")
@@ -49,6 +62,23 @@ class RTDicomValidator:
         # 検証ルールの設定
         self.rules = ValidationRules()
         
+        # 残留PHIスキャナー
+        self.phi_scanner = ResidualPHIScanner()
+        
+        # ルールタグの列指向比較エンジン
+        self.tag_comparator = ColumnarTagComparator(self.rules)
+        self.batch_size = 64
+        
+        # 詳細レポートの形式（'columnar'=列指向の結果ストア, 'json'=JSONファイル）
+        self.detailed_report_format = DEFAULT_DETAILED_REPORT_FORMAT
+        
+        # validate_filesをcProfile・tracemallocでプロファイルするか（結果はレポートディレクトリに保存）
+        self.profiling = False
+        # ファイル単位の比較をN件に1件だけプロファイルする
+        self.profile_sample_every = DEFAULT_PROFILE_SAMPLE_EVERY
+        # 実行中のRunProfiler（Noneの場合はプロファイルしない）
+        self.profiler = None
+        
         # GUI関連の属性を初期化
         if self.root:
             self.log_text = None
@@ -93,6 +123,13 @@ class RTDicomValidator:
         except Exception as e:
             print(f"サマリー更新エラー: {str(e)}")
     
+    def _get_anonymization_level(self):
+        """検証対象の匿名化レベルを取得（GUIがない場合はfull）"""
+        anonymization_level = getattr(self, 'anonymization_level', None)
+        if anonymization_level and hasattr(anonymization_level, 'get'):
+            return anonymization_level.get()
+        return "full"
+    
     def compare_dicom_files(self, original_file, anonymized_file):
         """
         2つのDICOMファイルを比較して匿名化の状態を確認する
@@ -109,213 +146,89 @@ class RTDicomValidator:
             original_dcm = pydicom.dcmread(str(original_file), force=True)
             anonymized_dcm = pydicom.dcmread(str(anonymized_file), force=True)
             
-            # 検証結果を初期化
-            results = {
-                "must_anonymize": {},  # 必須匿名化タグの結果
-                "uid_tags": {},        # UIDタグの結果
-                "structure_tags": {},  # 構造タグの結果
-                "optional_tags": {},   # オプションタグの結果
-                "rt_specific_tags": {}, # RT特有タグの結果
-                "private_tags": {      # プライベートタグの結果
-                    "original_count": 0,
-                    "anonymized_count": 0
-                },
-                "pixel_data": {        # ピクセルデータの比較結果
-                    "original_shape": None,
-                    "anonymized_shape": None,
-                    "match": False
-                }
-            }
+            # ルールタグを1件のバッチとして比較
+            batch = self.tag_comparator.compare_rows(
+                [self.tag_comparator.extract_row(original_dcm)],
+                [self.tag_comparator.extract_row(anonymized_dcm)],
+                self._get_anonymization_level()
+            )
+            results = batch.file_results(0)
+            results.update(self._compare_dataset_contents(original_dcm, anonymized_dcm))
+            return results
             
-            # 必須匿名化タグを確認
-            for tag in self.rules.must_anonymize_tags:
-                original_value = getattr(original_dcm, tag, "N/A") if hasattr(original_dcm, tag) else "N/A"
-                anonymized_value = getattr(anonymized_dcm, tag, "N/A") if hasattr(anonymized_dcm, tag) else "N/A"
-                
-                # 匿名化されているかチェック
-                anonymized = False
-                if str(anonymized_value) == "N/A":
-                    status = "削除済み"
-                    anonymized = True
-                elif str(anonymized_value) == "":
-                    status = "空白化"
-                    anonymized = True
-                elif str(original_value) != str(anonymized_value):
-                    status = "変更済み"
-                    anonymized = True
-                else:
-                    status = "未変更"
-                
-                results["must_anonymize"][tag] = {
-                    "original": str(original_value),
-                    "anonymized": str(anonymized_value),
-                    "status": status,
-                    "anonymized": anonymized
-                }
-            
-            # UIDタグを確認
-            for tag in self.rules.uid_tags:
-                original_value = getattr(original_dcm, tag, "N/A") if hasattr(original_dcm, tag) else "N/A"
-                anonymized_value = getattr(anonymized_dcm, tag, "N/A") if hasattr(anonymized_dcm, tag) else "N/A"
-                
-                # UIDが変更されているかチェック
-                changed = False
-                if str(anonymized_value) == "N/A":
-                    status = "削除済み"
-                elif str(original_value) != str(anonymized_value):
-                    status = "変更済み"
-                    changed = True
-                else:
-                    status = "未変更"
-                
-                results["uid_tags"][tag] = {
-                    "original": str(original_value),
-                    "anonymized": str(anonymized_value),
-                    "status": status,
-                    "changed": changed
-                }
-            
-            # 構造タグを確認
-            for tag in self.rules.structure_tags:
-                original_value = getattr(original_dcm, tag, "N/A") if hasattr(original_dcm, tag) else "N/A"
-                anonymized_value = getattr(anonymized_dcm, tag, "N/A") if hasattr(anonymized_dcm, tag) else "N/A"
-                
-                # 構造タグが保持されているかチェック
-                preserved = False
-                if str(original_value) == str(anonymized_value):
-                    status = "保持"
-                    preserved = True
-                else:
-                    status = "変更"
+        except Exception as e:
+            self.logger.error(f"DICOM比較中にエラー: {e}")
+            self.logger.error(traceback.format_exc())
+            return None
+    
+    def _compare_dataset_contents(self, original_dcm, anonymized_dcm):
+        """
+        ルールタグ以外の内容（プライベートタグ・残留PHI・ピクセルデータ）を比較する
+        
+        Args:
+            original_dcm: 原本のデータセット
+            anonymized_dcm: 匿名化されたデータセット
+            
+        Returns:
+            検証結果を含む辞書
+        """
+        results = {
+            "private_tags": {      # プライベートタグの結果
+                "original_count": 0,
+                "anonymized_count": 0
+            },
+            "pixel_data": {        # ピクセルデータの比較結果
+                "original_shape": None,
+                "anonymized_shape": None,
+                "match": False
+            },
+            "phi_leaks": []        # 残留PHIの検出結果
+        }
+        
+        # プライベートタグの確認
+        original_private_tags = [tag for tag in original_dcm.keys() if tag.is_private]
+        anonymized_private_tags = [tag for tag in anonymized_dcm.keys() if tag.is_private]
+        
+        results["private_tags"]["original_count"] = len(original_private_tags)
+        results["private_tags"]["anonymized_count"] = len(anonymized_private_tags)
+        
+        # 残留PHIの確認（シーケンス・プライベートタグを含む全文字列要素を照合）
+        results["phi_leaks"] = self.phi_scanner.scan(original_dcm, anonymized_dcm)
+        
+        # ピクセルデータの比較（画像データがある場合）
+        if hasattr(original_dcm, 'PixelData') and hasattr(anonymized_dcm, 'PixelData'):
+            try:
+                # TransferSyntaxUIDの確認
+                original_transfer_syntax = None
+                anonymized_transfer_syntax = None
                 
-                results["structure_tags"][tag] = {
-                    "original": str(original_value),
-                    "anonymized": str(anonymized_value),
-                    "status": status,
-                    "preserved": preserved
-                }
-            
-            # オプションタグを確認
-            # GUIが存在する場合はGUIの設定を使用、そうでなければデフォルト（full）
-            anonymization_level = getattr(self, 'anonymization_level', None)
-            if anonymization_level and hasattr(anonymization_level, 'get'):
-                level = anonymization_level.get()
-            else:
-                level = "full"
+                # FileMetaがあり、TransferSyntaxUIDが存在する場合のみ取得
+                if hasattr(original_dcm, 'file_meta') and hasattr(original_dcm.file_meta, 'TransferSyntaxUID'):
+                    original_transfer_syntax = original_dcm.file_meta.TransferSyntaxUID
                 
-            for tag in self.rules.optional_anonymize_tags:
-                original_value = getattr(original_dcm, tag, "N/A") if hasattr(original_dcm, tag) else "N/A"
-                anonymized_value = getattr(anonymized_dcm, tag, "N/A") if hasattr(anonymized_dcm, tag) else "N/A"
+                if hasattr(anonymized_dcm, 'file_meta') and hasattr(anonymized_dcm.file_meta, 'TransferSyntaxUID'):
+                    anonymized_transfer_syntax = anonymized_dcm.file_meta.TransferSyntaxUID
                 
-                # 匿名化設定に応じた確認
-                if level == "full":
-                    # 完全匿名化の場合は変更されるべき
-                    changed = False
-                    if str(anonymized_value) == "N/A":
-                        status = "削除済み"
-                        changed = True
-                    elif str(original_value) != str(anonymized_value):
-                        status = "変更済み"
-                        changed = True
-                    else:
-                        status = "未変更"
-                else:
-                    # 部分匿名化の場合は保持されていてもよい
-                    changed = True
-                    if str(original_value) == str(anonymized_value):
-                        status = "保持"
-                    else:
-                        status = "変更"
+                # 転送構文が異なる場合は警告
+                if original_transfer_syntax != anonymized_transfer_syntax:
+                    self.logger.warning(f"転送構文が異なります: 原本={original_transfer_syntax}, 匿名化={anonymized_transfer_syntax}")
                 
-                results["optional_tags"][tag] = {
-                    "original": str(original_value),
-                    "anonymized": str(anonymized_value),
-                    "status": status,
-                    "changed": changed
-                }
-            
-            # RT特有タグを確認
-            for tag in self.rules.rt_specific_tags:
-                original_value = getattr(original_dcm, tag, "N/A") if hasattr(original_dcm, tag) else "N/A"
-                anonymized_value = getattr(anonymized_dcm, tag, "N/A") if hasattr(anonymized_dcm, tag) else "N/A"
+                # ピクセルデータの比較
+                original_pixel_array = original_dcm.pixel_array
+                anonymized_pixel_array = anonymized_dcm.pixel_array
                 
-                # 臓器名は特殊処理（一部保持すべき）
-                if tag == "ROIName":
-                    status = "特殊処理"
-                    # 特定の臓器名（例：heart, lung）は保持されるべき
-                    if "N/A" not in str(original_value):
-                        organs = ["lung", "heart", "liver", "kidney", "spinal", "brain"]
-                        if any(organ in str(original_value).lower() for organ in organs):
-                            if str(original_value) == str(anonymized_value):
-                                status = "正しく保持"
-                            else:
-                                status = "保持すべき臓器名が変更"
-                        else:
-                            if str(original_value) != str(anonymized_value):
-                                status = "正しく匿名化"
-                            else:
-                                status = "匿名化されていない"
-                else:
-                    # その他のRT特有タグは匿名化されるべき
-                    if str(anonymized_value) == "N/A":
-                        status = "削除済み"
-                    elif str(original_value) != str(anonymized_value):
-                        status = "変更済み"
-                    else:
-                        status = "未変更"
+                results["pixel_data"]["original_shape"] = original_pixel_array.shape
+                results["pixel_data"]["anonymized_shape"] = anonymized_pixel_array.shape
                 
-                results["rt_specific_tags"][tag] = {
-                    "original": str(original_value),
-                    "anonymized": str(anonymized_value),
-                    "status": status
-                }
-            
-            # プライベートタグの確認
-            original_private_tags = [tag for tag in original_dcm.keys() if tag.is_private]
-            anonymized_private_tags = [tag for tag in anonymized_dcm.keys() if tag.is_private]
-            
-            results["private_tags"]["original_count"] = len(original_private_tags)
-            results["private_tags"]["anonymized_count"] = len(anonymized_private_tags)
-            
-            # ピクセルデータの比較（画像データがある場合）
-            if hasattr(original_dcm, 'PixelData') and hasattr(anonymized_dcm, 'PixelData'):
-                try:
-                    # TransferSyntaxUIDの確認
-                    original_transfer_syntax = None
-                    anonymized_transfer_syntax = None
-                    
-                    # FileMetaがあり、TransferSyntaxUIDが存在する場合のみ取得
-                    if hasattr(original_dcm, 'file_meta') and hasattr(original_dcm.file_meta, 'TransferSyntaxUID'):
-                        original_transfer_syntax = original_dcm.file_meta.TransferSyntaxUID
-                    
-                    if hasattr(anonymized_dcm, 'file_meta') and hasattr(anonymized_dcm.file_meta, 'TransferSyntaxUID'):
-                        anonymized_transfer_syntax = anonymized_dcm.file_meta.TransferSyntaxUID
-                    
-                    # 転送構文が異なる場合は警告
-                    if original_transfer_syntax != anonymized_transfer_syntax:
-                        self.logger.warning(f"転送構文が異なります: 原本={original_transfer_syntax}, 匿名化={anonymized_transfer_syntax}")
-                    
-                    # ピクセルデータの比較
-                    original_pixel_array = original_dcm.pixel_array
-                    anonymized_pixel_array = anonymized_dcm.pixel_array
-                    
-                    results["pixel_data"]["original_shape"] = original_pixel_array.shape
-                    results["pixel_data"]["anonymized_shape"] = anonymized_pixel_array.shape
-                    
-                    # 形状が一致するか確認
-                    if original_pixel_array.shape == anonymized_pixel_array.shape:
-                        # ピクセル値が一致するか確認
-                        if np.array_equal(original_pixel_array, anonymized_pixel_array):
-                            results["pixel_data"]["match"] = True
-                except Exception as e:
-                    self.logger.warning(f"ピクセルデータの比較中にエラー: {e}")
-            
-            return results
-            
-        except Exception as e:
-            self.logger.error(f"DICOM比較中にエラー: {e}")
-            self.logger.error(traceback.format_exc())
-            return None
+                # 形状が一致するか確認
+                if original_pixel_array.shape == anonymized_pixel_array.shape:
+                    # ピクセル値が一致するか確認
+                    if np.array_equal(original_pixel_array, anonymized_pixel_array):
+                        results["pixel_data"]["match"] = True
+            except Exception as e:
+                self.logger.warning(f"ピクセルデータの比較中にエラー: {e}")
+        
+        return results
     
     def _generate_matching_key(self, dcm):
         """
@@ -364,42 +277,461 @@ class RTDicomValidator:
             self.logger.warning(f"マッチングキー生成エラー: {e}")
             return None
 
-    def validate_files(self, original_dir, anonymized_dir):
+    def _create_summary(self, total_files):
         """
-        ディレクトリ内のファイルを検証する
+        検証結果の集計データを初期化
+        
+        Args:
+            total_files: 原本のファイル数
+            
+        Returns:
+            集計データの辞書
+        """
+        return {
+            "total_files": total_files,
+            "matched_files": 0,
+            "must_anonymize_stats": {tag: {"anonymized": 0, "not_anonymized": 0} for tag in self.rules.must_anonymize_tags},
+            "uid_stats": {tag: {"changed": 0, "not_changed": 0} for tag in self.rules.uid_tags},
+            "structure_stats": {tag: {"preserved": 0, "not_preserved": 0} for tag in self.rules.structure_tags},
+            "private_tags_stats": {"removed": 0, "not_removed": 0},
+            "modality_stats": {},
+            "rt_specific_stats": {tag: {"anonymized": 0, "not_anonymized": 0} for tag in self.rules.rt_specific_tags},
+            "patient_id_map": {},
+            "phi_leak_stats": {"clean": 0, "leaked": 0, "by_source": {}, "by_element": {}},
+        }
+    
+    def _validate_batch(self, pairs, summary, result_store=None, detailed_results=None):
+        """
+        マッチしたファイルの組をまとめて検証し、集計データを更新する
+        
+        ルールタグは列指向エンジンで一括分類・集計し、
+        プライベートタグ・残留PHI・ピクセルデータはファイルごとに比較する。
+        
+        Args:
+            pairs: (原本ファイル, 匿名化ファイル, 相対パス) のリスト
+            summary: 集計データ
+            result_store: 詳細結果を追記する結果ストア（省略可）
+            detailed_results: 詳細結果を追加するリスト（JSON形式の場合、省略可）
+            
+        Returns:
+            (比較結果のバッチ, 検証できたファイルの組のリスト, ルールタグ以外の比較結果のリスト) のタプル
+        """
+        first_batch = summary["matched_files"] == 0
+        original_rows = []
+        anonymized_rows = []
+        contents = []
+        validated = []
+        
+        for orig_file, anon_file, rel_path in pairs:
+            self.log_message(f"検証中: {rel_path}")
+            try:
+                with profile_file(self.profiler):
+                    original_dcm = pydicom.dcmread(str(orig_file), force=True)
+                    anonymized_dcm = pydicom.dcmread(str(anon_file), force=True)
+                    
+                    orig_row = self.tag_comparator.extract_row(original_dcm)
+                    anon_row = self.tag_comparator.extract_row(anonymized_dcm)
+                    content = self._compare_dataset_contents(original_dcm, anonymized_dcm)
+                    modality = getattr(original_dcm, 'Modality', None)
+                
+                # 途中で失敗したファイルが列と結果の対応をずらさないよう、全て成功してから追加する
+                original_rows.append(orig_row)
+                anonymized_rows.append(anon_row)
+                contents.append(content)
+                validated.append((orig_file, anon_file, rel_path))
+                
+                # モダリティ統計を更新
+                if modality:
+                    summary["modality_stats"][modality] = summary["modality_stats"].get(modality, 0) + 1
+            except Exception as e:
+                self.logger.error(f"DICOM比較中にエラー: {e}")
+                self.logger.error(traceback.format_exc())
+        
+        with profile_section(self.profiler):
+            # ルールタグの状態分類とタグごとの統計（列単位の一括処理）
+            batch = self.tag_comparator.compare_rows(
+                original_rows, anonymized_rows, self._get_anonymization_level())
+            batch.accumulate(summary)
+            summary["matched_files"] += len(batch)
+            
+            # 詳細結果を結果ストアに追記
+            if result_store is not None:
+                result_store.append(batch, validated, contents)
+        
+        update_treeview = self.root and hasattr(self, 'update_treeview')
+        leak_stats = summary["phi_leak_stats"]
+        for row, (orig_file, anon_file, rel_path) in enumerate(validated):
+            file_contents = contents[row]
+            
+            # プライベートタグの統計
+            if file_contents["private_tags"]["anonymized_count"] == 0:
+                summary["private_tags_stats"]["removed"] += 1
+            else:
+                summary["private_tags_stats"]["not_removed"] += 1
+            
+            # 残留PHIの統計
+            if file_contents["phi_leaks"]:
+                leak_stats["leaked"] += 1
+                self.log_message(f"⚠️ 残留PHIを検出: {rel_path} ({len(file_contents['phi_leaks'])}箇所)")
+            else:
+                leak_stats["clean"] += 1
+            for leak in file_contents["phi_leaks"]:
+                leak_stats["by_source"][leak["source"]] = leak_stats["by_source"].get(leak["source"], 0) + 1
+                leak_stats["by_element"][leak["path"]] = leak_stats["by_element"].get(leak["path"], 0) + 1
+            
+            # ファイル単位の結果は詳細レポートやGUI表示が必要な場合のみ組み立てる
+            if detailed_results is None and not update_treeview:
+                continue
+            results = batch.file_results(row)
+            results.update(file_contents)
+            
+            if detailed_results is not None:
+                detailed_results.append({
+                    "original_file": str(orig_file),
+                    "anonymized_file": str(anon_file),
+                    "results": results
+                })
+            
+            # GUIがある場合はツリービューを更新（最初のファイルのみクリア）
+            if update_treeview:
+                self.update_treeview(results, clear=first_batch and row == 0)
+        
+        return batch, validated, contents
+    
+    def _sample_metric_names(self):
+        """抽出検証で合格率を推定する評価項目の名前"""
+        return (self.tag_comparator.category_tags["must_anonymize"]
+                + self.tag_comparator.category_tags["uid_tags"]
+                + [PHI_LEAK_METRIC])
+    
+    def _sample_metrics(self, batch, contents):
+        """
+        バッチの各ファイルについて評価項目ごとの合否を取得
+        
+        必須匿名化タグは未変更でなければ、UIDタグは変更されていれば、
+        残留PHIは検出されなければ合格とする（サマリーの集計と同じ基準）。
+        
+        Returns:
+            ファイル×評価項目の真偽値の行列
+        """
+        must_columns = self.tag_comparator.slices["must_anonymize"]
+        uid_columns = self.tag_comparator.slices["uid_tags"]
+        clean = np.array([not content["phi_leaks"] for content in contents], dtype=bool)
+        return np.hstack([
+            batch.status[:, must_columns] != STATUS_UNCHANGED,
+            batch.status[:, uid_columns] == STATUS_CHANGED,
+            clean.reshape(-1, 1)
+        ])
+    
+    def _find_anonymized_file(self, orig_file, original_dir, anonymized_dir, anonymized_map, anonymized_keys):
+        """
+        原本ファイルに対応する匿名化ファイルを探す（相対パス、次にDICOMタグで照合）
+        
+        Args:
+            orig_file: 原本ファイルのパス
+            original_dir: 原本ディレクトリ
+            anonymized_dir: 匿名化ディレクトリ
+            anonymized_map: 相対パスをキーとする匿名化ファイルの辞書
+            anonymized_keys: マッチングキーをキーとする匿名化ファイルの辞書（初回のタグ照合時に作成）
+            
+        Returns:
+            (匿名化ファイルのパス, 相対パス) のタプル、見つからない場合は (None, 相対パス)
+        """
+        rel_path = orig_file.relative_to(original_dir)
+        if str(rel_path) in anonymized_map:
+            return anonymized_map[str(rel_path)], rel_path
+        
+        # パスで見つからない場合のみ、匿名化ファイルのマッチングキーを作成
+        if not anonymized_keys:
+            for anon_file in anonymized_map.values():
+                try:
+                    dcm = pydicom.dcmread(str(anon_file), force=True, stop_before_pixels=True)
+                    key = self._generate_matching_key(dcm)
+                    if key:
+                        anonymized_keys[key] = anon_file
+                except Exception as e:
+                    self.logger.warning(f"匿名化ファイル読み込みエラー: {anon_file} - {e}")
+            # キーが1件も作成できなかった場合も作成済みとして扱う
+            anonymized_keys.setdefault(None, None)
+        
+        try:
+            dcm = pydicom.dcmread(str(orig_file), force=True, stop_before_pixels=True)
+            key = self._generate_matching_key(dcm)
+        except Exception as e:
+            self.logger.warning(f"原本ファイル読み込みエラー: {orig_file} - {e}")
+            key = None
+        if key and key in anonymized_keys:
+            return anonymized_keys[key], rel_path
+        return None, rel_path
+    
+    def validate_sample(self, original_dir, anonymized_dir, threshold=None, confidence=None, seed=None):
+        """
+        層別無作為抽出したファイルのみを検証し、匿名化率を信頼区間付きで推定する
+        
+        原本をモダリティ・患者・シリーズで層に分け、全件合格なら層の匿名化率の
+        下側信頼限界が閾値以上となる数だけ抽出して検証する。不合格などにより
+        下側信頼限界が閾値を下回った層は、残りのファイルもすべて検証する。
         
         Args:
             original_dir: 原本DICOMファイルのディレクトリパス
             anonymized_dir: 匿名化されたDICOMファイルのディレクトリパス
+            threshold: 層ごとに要求する匿名化率の下限（省略時は設定値）
+            confidence: 信頼水準（省略時は設定値）
+            seed: 乱数のシード（再現性が必要な場合に指定）
             
         Returns:
             検証結果のサマリーレポート
         """
         try:
-            # 原本ディレクトリからDICOMファイルのリストを取得
-            original_files = find_dicom_files(original_dir)
+            threshold = DEFAULT_SAMPLING_THRESHOLD if threshold is None else threshold
+            confidence = DEFAULT_SAMPLING_CONFIDENCE if confidence is None else confidence
+            original_dir = Path(original_dir)
+            anonymized_dir = Path(anonymized_dir)
             
-            # 匿名化ディレクトリからDICOMファイルのリストを取得
+            # 検出時のヘッダー情報（スキャン索引）で層を作成
+            original_records = scan_dicom_files(original_dir)
             anonymized_files = find_dicom_files(anonymized_dir)
+            self.log_message(f"原本DICOMファイル数: {len(original_records)}")
+            self.log_message(f"匿名化DICOMファイル数: {len(anonymized_files)}")
             
-            self.log_message(f"原本DICOMファイル数: {len(original_files)}")
+            summary = self._create_summary(len(original_records))
+            self.phi_scanner = ResidualPHIScanner()
+            
+            anonymized_map = {str(path.relative_to(anonymized_dir)): path for path in anonymized_files}
+            anonymized_keys = {}
+            
+            strata = group_strata(original_records)
+            sample = draw_stratified_sample(strata, threshold, confidence, seed)
+            sampled_count = sum(len(records) for records in sample.values())
+            self.log_message(f"層の数: {len(strata)}、抽出ファイル数: {sampled_count}")
+            
+            metric_names = self._sample_metric_names()
+            stratum_stats = {
+                key: {"population": len(records), "validated": 0, "unmatched": 0, "errors": 0,
+                      "passed": np.zeros(len(metric_names), dtype=np.int64)}
+                for key, records in strata.items()
+            }
+            
+            def validate_records(key, records):
+                """
+                1つの層のファイルをバッチにまとめて検証し、層の合格数を集計
+                
+                匿名化ファイルが見つからない・比較できなかった抽出ファイルは、匿名化に
+                失敗した可能性が高いため、全評価項目の不合格として信頼限界に含める。
+                """
+                stats = stratum_stats[key]
+                pending = []
+                for i, record in enumerate(records):
+                    anon_file, rel_path = self._find_anonymized_file(
+                        record["path"], original_dir, anonymized_dir, anonymized_map, anonymized_keys)
+                    if anon_file is None:
+                        self.log_message(f"マッチするファイルなし: {rel_path}")
+                        stats["validated"] += 1
+                        stats["unmatched"] += 1
+                    else:
+                        pending.append((record["path"], anon_file, rel_path))
+                    if pending and (len(pending) >= self.batch_size or i == len(records) - 1):
+                        batch, validated, contents = self._validate_batch(pending, summary)
+                        stats["validated"] += len(pending)
+                        stats["errors"] += len(pending) - len(validated)
+                        if validated:
+                            stats["passed"] += self._sample_metrics(batch, contents).sum(axis=0)
+                        pending = []
+            
+            for progress_count, (key, records) in enumerate(sample.items(), start=1):
+                if self.root and hasattr(self, 'status_var') and self.status_var:
+                    progress = progress_count / len(sample) * 100
+                    self.status_var.set(f"抽出検証中... {progress_count}/{len(sample)}層 ({progress:.1f}%)")
+                validate_records(key, records)
+            
+            # 下側信頼限界が閾値を下回った層は全数検証に切り替え
+            escalated_strata = []
+            escalated_count = 0
+            for key, records in strata.items():
+                stats = stratum_stats[key]
+                if len(sample[key]) >= stats["population"]:
+                    continue
+                failures = stats["validated"] - int(stats["passed"].min())
+                lower = lower_confidence_bound(stats["population"], stats["validated"], failures, confidence)
+                if lower >= threshold:
+                    continue
+                
+                label = stratum_label(key)
+                self.log_message(f"⚠️ 下側信頼限界 {lower:.1%} < {threshold:.0%}: {label} を全数検証します")
+                sampled_paths = {record["path"] for record in sample[key]}
+                remaining = [record for record in records if record["path"] not in sampled_paths]
+                escalated_strata.append(label)
+                escalated_count += len(remaining)
+                validate_records(key, remaining)
+            
+            # 評価項目ごとの推定値と信頼区間
+            tag_intervals = {}
+            for i, name in enumerate(metric_names):
+                estimate, lower, upper = stratified_interval(
+                    [(stats["population"], stats["validated"], int(stats["passed"][i]))
+                     for stats in stratum_stats.values()],
+                    confidence)
+                tag_intervals[name] = {"estimate": estimate, "lower": lower, "upper": upper}
+            
+            summary["sampling_stats"] = {
+                "population_files": len(original_records),
+                "sampled_files": sampled_count,
+                "escalated_files": escalated_count,
+                "unmatched_files": sum(stats["unmatched"] for stats in stratum_stats.values()),
+                "error_files": sum(stats["errors"] for stats in stratum_stats.values()),
+                "strata": len(strata),
+                "escalated_strata": escalated_strata,
+                "confidence": confidence,
+                "threshold": threshold,
+                "tags": tag_intervals
+            }
+            
+            report = generate_summary_report(summary, self.rules)
+            report_path = save_report(report, self.report_dir,
+                                      generate_validation_report_filename("sampling_validation_summary"))
+            self.log_message(f"レポート保存完了: {report_path}")
+            
+            # GUIがある場合はグラフを描画
+            if self.root and hasattr(self, 'draw_validation_graphs'):
+                self.draw_validation_graphs(summary)
+            
+            return report
+            
+        except Exception as e:
+            error_msg = f"抽出検証中にエラーが発生しました: {str(e)}"
+            self.log_message(error_msg)
+            self.logger.error(traceback.format_exc())
+            return None
+    
+    def validate_with_bloom_filter(self, anonymized_dir, bloom_path):
+        """
+        原本を使わずに、匿名化時に出力されたPHIフィルタで残留PHIを検証する
+        
+        Args:
+            anonymized_dir: 匿名化されたDICOMファイルのディレクトリパス
+            bloom_path: 匿名化ツールが出力したPHIフィルタ（rt_phi_bloom_*.json）のパス
+            
+        Returns:
+            検証結果のレポート
+        """
+        try:
+            bloom = PHIBloomFilter.load(bloom_path)
+            anonymized_files = find_dicom_files(anonymized_dir)
             self.log_message(f"匿名化DICOMファイル数: {len(anonymized_files)}")
+            self.log_message(f"PHIフィルタ: {bloom_path} ({bloom.count}トークン)")
             
-            # 分析用の集計データ
             summary = {
-                "total_files": len(original_files),
-                "matched_files": 0,
-                "must_anonymize_stats": {tag: {"anonymized": 0, "not_anonymized": 0} for tag in self.rules.must_anonymize_tags},
-                "uid_stats": {tag: {"changed": 0, "not_changed": 0} for tag in self.rules.uid_tags},
-                "structure_stats": {tag: {"preserved": 0, "not_preserved": 0} for tag in self.rules.structure_tags},
-                "private_tags_stats": {"removed": 0, "not_removed": 0},
-                "modality_stats": {},
-                "rt_specific_stats": {tag: {"anonymized": 0, "not_anonymized": 0} for tag in self.rules.rt_specific_tags},
-                "patient_id_map": {},
+                "total_files": len(anonymized_files),
+                "checked_files": 0,
+                "leaked_files": [],
+                "token_checks": 0,
+                "by_element": {},
+                "phi_token_count": bloom.count,
+                "error_rate": bloom.error_rate
             }
             
+            for i, file_path in enumerate(anonymized_files):
+                if self.root and hasattr(self, 'status_var') and self.status_var:
+                    progress = (i + 1) / len(anonymized_files) * 100
+                    self.status_var.set(f"検証中... {i+1}/{len(anonymized_files)} ({progress:.1f}%)")
+                
+                try:
+                    dcm = pydicom.dcmread(str(file_path), force=True, stop_before_pixels=True)
+                except Exception as e:
+                    self.logger.warning(f"匿名化ファイル読み込みエラー: {file_path} - {e}")
+                    continue
+                
+                summary["checked_files"] += 1
+                hit_paths = []
+                for path, elem, text in iter_text_elements(dcm):
+                    for key in iter_token_keys(text):
+                        summary["token_checks"] += 1
+                        if key in bloom:
+                            hit_paths.append(path)
+                            break
+                
+                if hit_paths:
+                    rel_path = file_path.relative_to(anonymized_dir)
+                    summary["leaked_files"].append(str(rel_path))
+                    self.log_message(f"⚠️ 残留PHIの疑い: {rel_path} ({', '.join(hit_paths)})")
+                    for path in hit_paths:
+                        summary["by_element"][path] = summary["by_element"].get(path, 0) + 1
+            
+            report = generate_bloom_report(summary)
+            report_path = save_report(report, self.report_dir,
+                                      generate_validation_report_filename("bloom_leak_check"))
+            self.log_message(f"レポート保存完了: {report_path}")
+            return report
+            
+        except Exception as e:
+            error_msg = f"PHIフィルタによる検証中にエラーが発生しました: {str(e)}"
+            self.log_message(error_msg)
+            self.logger.error(traceback.format_exc())
+            return None
+    
+    def validate_files(self, original_dir, anonymized_dir):
+        """
+        ディレクトリ内のファイルを検証する
+        
+        profilingを設定した場合は、検証をcProfile・tracemallocでプロファイルして
+        .profファイルとレポートをレポートディレクトリに保存する。
+        
+        Args:
+            original_dir: 原本DICOMファイルのディレクトリパス
+            anonymized_dir: 匿名化されたDICOMファイルのディレクトリパス
+            
+        Returns:
+            検証結果のサマリーレポート
+        """
+        if not self.profiling:
+            return self._validate_files(original_dir, anonymized_dir)
+        
+        self.profiler = RunProfiler(self.report_dir, "validation_profile", self.profile_sample_every).start()
+        try:
+            return self._validate_files(original_dir, anonymized_dir)
+        finally:
+            profiler, self.profiler = self.profiler, None
+            prof_path, report_path = profiler.stop()
+            if prof_path:
+                self.log_message(f"プロファイル: {prof_path}")
+            self.log_message(f"プロファイルレポート: {report_path}")
+    
+    def _validate_files(self, original_dir, anonymized_dir):
+        """validate_filesの本体"""
+        try:
+            with profile_section(self.profiler, "検索後"):
+                # 原本ディレクトリからDICOMファイルのリストを取得
+                original_files = find_dicom_files(original_dir)
+                
+                # 匿名化ディレクトリからDICOMファイルのリストを取得
+                anonymized_files = find_dicom_files(anonymized_dir)
+            
+            self.log_message(f"原本DICOMファイル数: {len(original_files)}")
+            self.log_message(f"匿名化DICOMファイル数: {len(anonymized_files)}")
+            
+            # 分析用の集計データ
+            summary = self._create_summary(len(original_files))
+            
+            # 残留PHIスキャナーのパターンを初期化
+            self.phi_scanner = ResidualPHIScanner()
+            
             # 詳細な結果保存用
-            detailed_results = []
+            detailed_report = True
+            if hasattr(self, 'detailed_report') and hasattr(self.detailed_report, 'get'):
+                detailed_report = self.detailed_report.get()
+            
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            result_store = None
+            detailed_results = None
+            if detailed_report and self.detailed_report_format == "columnar":
+                # 結果はバッチごとに結果ストアへ追記し、メモリには保持しない
+                result_store = ResultStoreWriter(
+                    Path(self.report_dir) / f"detailed_validation_results_{timestamp}", self.tag_comparator)
+            elif detailed_report:
+                detailed_results = []
+            
+            # バッチ検証待ちのファイルの組
+            pending = []
             
             # 匿名化前後のファイルをマッチングして検証
             progress_count = 0
@@ -411,19 +743,20 @@ class RTDicomValidator:
             original_files_info = {}
             
             # 原本ファイルをマップに追加
-            for file_path in original_files:
-                # 相対パスでのマッチング用
-                rel_path = file_path.relative_to(original_dir)
-                original_files_map[str(rel_path)] = file_path
-                
-                # DICOMタグでのマッチング用
-                try:
-                    dcm = pydicom.dcmread(str(file_path), force=True, stop_before_pixels=True)
-                    key = self._generate_matching_key(dcm)
-                    if key:
-                        original_files_info[key] = file_path
-                except Exception as e:
-                    self.logger.warning(f"原本ファイル読み込みエラー: {file_path} - {e}")
+            with profile_section(self.profiler, "照合準備後"):
+                for file_path in original_files:
+                    # 相対パスでのマッチング用
+                    rel_path = file_path.relative_to(original_dir)
+                    original_files_map[str(rel_path)] = file_path
+                    
+                    # DICOMタグでのマッチング用
+                    try:
+                        dcm = pydicom.dcmread(str(file_path), force=True, stop_before_pixels=True)
+                        key = self._generate_matching_key(dcm)
+                        if key:
+                            original_files_info[key] = file_path
+                    except Exception as e:
+                        self.logger.warning(f"原本ファイル読み込みエラー: {file_path} - {e}")
             
             # マッチングして検証
             for anon_file in anonymized_files:
@@ -456,79 +789,11 @@ class RTDicomValidator:
                     
                     # マッチするファイルが見つかった場合
                     if orig_file:
-                        
-                        self.log_message(f"検証中: {rel_path}")
-                        
-                        # 2つのファイルを比較
-                        results = self.compare_dicom_files(orig_file, anon_file)
-                        
-                        if results:
-                            summary["matched_files"] += 1
-                            
-                            # モダリティ統計を更新
-                            try:
-                                orig_dcm = pydicom.dcmread(str(orig_file), force=True)
-                                if hasattr(orig_dcm, 'Modality'):
-                                    modality = orig_dcm.Modality
-                                    if modality not in summary["modality_stats"]:
-                                        summary["modality_stats"][modality] = 1
-                                    else:
-                                        summary["modality_stats"][modality] += 1
-                            except:
-                                pass
-                            
-                            # 必須匿名化タグの統計
-                            for tag, info in results["must_anonymize"].items():
-                                if info["anonymized"]:
-                                    summary["must_anonymize_stats"][tag]["anonymized"] += 1
-                                else:
-                                    summary["must_anonymize_stats"][tag]["not_anonymized"] += 1
-                            
-                            # UIDタグの統計
-                            for tag, info in results["uid_tags"].items():
-                                if info["changed"]:
-                                    summary["uid_stats"][tag]["changed"] += 1
-                                else:
-                                    summary["uid_stats"][tag]["not_changed"] += 1
-                            
-                            # 構造タグの統計
-                            for tag, info in results["structure_tags"].items():
-                                if info["preserved"]:
-                                    summary["structure_stats"][tag]["preserved"] += 1
-                                else:
-                                    summary["structure_stats"][tag]["not_preserved"] += 1
-                            
-                            # プライベートタグの統計
-                            if results["private_tags"]["anonymized_count"] == 0:
-                                summary["private_tags_stats"]["removed"] += 1
-                            else:
-                                summary["private_tags_stats"]["not_removed"] += 1
-                            
-                            # 患者ID対応表の更新
-                            if "PatientID" in results["must_anonymize"]:
-                                orig_id = results["must_anonymize"]["PatientID"]["original"]
-                                anon_id = results["must_anonymize"]["PatientID"]["anonymized"]
-                                
-                                if orig_id != "N/A" and anon_id != "N/A":
-                                    summary["patient_id_map"][orig_id] = anon_id
-                            
-                            # 詳細結果を追加
-                            detailed_report = True
-                            if hasattr(self, 'detailed_report') and hasattr(self.detailed_report, 'get'):
-                                detailed_report = self.detailed_report.get()
-                                
-                            if detailed_report:
-                                detailed_results.append({
-                                    "original_file": str(orig_file),
-                                    "anonymized_file": str(anon_file),
-                                    "results": results
-                                })
-                            
-                            # GUIがある場合はツリービューを更新
-                            if self.root and hasattr(self, 'update_treeview'):
-                                # 最初のファイルのみclear=Trueで呼び出し、以降はclear=Falseで呼び出す
-                                clear = (progress_count == 1)
-                                self.update_treeview(results, clear=clear)
+                        # 比較対象をバッチに追加し、一定数たまったらまとめて検証
+                        pending.append((orig_file, anon_file, rel_path))
+                        if len(pending) >= self.batch_size:
+                            self._validate_batch(pending, summary, result_store, detailed_results)
+                            pending = []
                     else:
                         self.log_message(f"マッチするファイルなし: {rel_path}")
                 
@@ -536,16 +801,20 @@ class RTDicomValidator:
                     self.log_message(f"ファイル検証中にエラー: {str(e)}")
                     self.logger.error(traceback.format_exc())
             
+            # 残りのバッチを検証
+            if pending:
+                self._validate_batch(pending, summary, result_store, detailed_results)
+            if self.profiler is not None:
+                self.profiler.snapshot("検証後")
+            
             # サマリーレポートを生成
             report = generate_summary_report(summary, self.rules)
             
             # 詳細レポートを保存
-            detailed_report = True
-            if hasattr(self, 'detailed_report') and hasattr(self.detailed_report, 'get'):
-                detailed_report = self.detailed_report.get()
-                
-            if detailed_report:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            if result_store is not None:
+                store_dir = result_store.close()
+                self.log_message(f"詳細結果ストア保存完了: {store_dir}")
+            elif detailed_results is not None:
                 detailed_report_path = Path(self.report_dir) / f"detailed_validation_report_{timestamp}.json"
                 
                 with open(detailed_report_path, 'w', encoding='utf-8') as f:
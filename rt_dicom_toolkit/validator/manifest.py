@@ -0,0 +1,332 @@
+"""
+匿名化済みディレクトリのMerkleマニフェストを扱うモジュール
+
+ファイルごとのハッシュをシリーズ・スタディ・患者の単位で積み上げた
+Merkle木を作成し、再検証時はstat情報が変化したファイルを含む部分木のみを
+再計算する。
+"""
+
+import os
+import json
+import hashlib
+from pathlib import Path
+from datetime import datetime
+
+import pydicom
+
+# マニフェストの形式バージョン
+MANIFEST_VERSION = 1
+
+# ハッシュ計算時の読み込みサイズ
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# DICOMとして解釈できないファイルの分類キー
+NON_DICOM_KEY = "NON_DICOM"
+
+# グループ化に使用するタグ
+GROUPING_TAGS = ["PatientID", "StudyInstanceUID", "SeriesInstanceUID"]
+
+
+def _hash_file(file_path):
+    """
+    ファイル内容のSHA-256ハッシュを計算
+
+    Args:
+        file_path: ファイルのパス
+
+    Returns:
+        16進数のハッシュ文字列
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _hash_children(children):
+    """
+    子ノードのハッシュから親ノードのハッシュを計算
+
+    Args:
+        children: 子ノードのキーとハッシュの辞書
+
+    Returns:
+        16進数のハッシュ文字列
+    """
+    digest = hashlib.sha256()
+    for key in sorted(children):
+        digest.update(f"{key}:{children[key]}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _probe_grouping(file_path):
+    """
+    ファイルが属する患者・スタディ・シリーズを取得
+
+    Args:
+        file_path: ファイルのパス
+
+    Returns:
+        (患者ID, スタディUID, シリーズUID) のタプル
+    """
+    try:
+        dcm = pydicom.dcmread(str(file_path), stop_before_pixels=True,
+                              specific_tags=GROUPING_TAGS)
+        return tuple(str(getattr(dcm, tag, "") or "UNKNOWN") for tag in GROUPING_TAGS)
+    except Exception:
+        return (NON_DICOM_KEY, NON_DICOM_KEY, NON_DICOM_KEY)
+
+
+def _file_entry(file_path, stat_result):
+    """ファイル1件分のマニフェストエントリを作成"""
+    patient, study, series = _probe_grouping(file_path)
+    return {
+        "size": stat_result.st_size,
+        "mtime_ns": stat_result.st_mtime_ns,
+        "hash": _hash_file(file_path),
+        "patient": patient,
+        "study": study,
+        "series": series
+    }
+
+
+def _walk_files(directory):
+    """
+    ディレクトリ内の全ファイルの相対パスとstat情報を列挙
+
+    Args:
+        directory: 走査するディレクトリ
+
+    Yields:
+        (相対パス文字列, 絶対パス, stat結果) のタプル
+    """
+    directory = Path(directory)
+    for root, _, files in os.walk(directory):
+        for file in files:
+            file_path = Path(root) / file
+            try:
+                stat_result = file_path.stat()
+            except OSError:
+                continue
+            yield file_path.relative_to(directory).as_posix(), file_path, stat_result
+
+
+def _series_key(entry):
+    """エントリからシリーズを識別するキーを生成"""
+    return (entry["patient"], entry["study"], entry["series"])
+
+
+def _build_tree(files, series_keys=None, previous_tree=None):
+    """
+    ファイルエントリからMerkle木を構築
+
+    Args:
+        files: 相対パスをキーとするファイルエントリの辞書
+        series_keys: 再計算するシリーズのキーの集合（Noneの場合は全シリーズ）
+        previous_tree: 再計算しないシリーズのハッシュを引き継ぐ既存の木
+
+    Returns:
+        (患者ごとの木, ルートハッシュ) のタプル
+    """
+    # シリーズごとにファイルを振り分け
+    series_files = {}
+    for rel_path, entry in files.items():
+        series_files.setdefault(_series_key(entry), {})[rel_path] = entry["hash"]
+
+    patients = {}
+    for key, children in series_files.items():
+        patient, study, series = key
+        series_hash = None
+        if series_keys is not None and key not in series_keys and previous_tree:
+            # stat変化のないシリーズは既存のハッシュを再利用
+            series_hash = (previous_tree.get(patient, {}).get("studies", {})
+                           .get(study, {}).get("series", {}).get(series))
+        if series_hash is None:
+            series_hash = _hash_children(children)
+
+        study_node = patients.setdefault(patient, {"studies": {}})["studies"].setdefault(
+            study, {"series": {}})
+        study_node["series"][series] = series_hash
+
+    # スタディ・患者・ルートへハッシュを積み上げ
+    for patient_node in patients.values():
+        for study_node in patient_node["studies"].values():
+            study_node["hash"] = _hash_children(study_node["series"])
+        patient_node["hash"] = _hash_children(
+            {study: node["hash"] for study, node in patient_node["studies"].items()})
+    root_hash = _hash_children({patient: node["hash"] for patient, node in patients.items()})
+
+    return patients, root_hash
+
+
+def build_manifest(directory, log_func=print):
+    """
+    ディレクトリのMerkleマニフェストを作成
+
+    Args:
+        directory: 対象ディレクトリ（通常は匿名化済みディレクトリ）
+        log_func: ログ出力関数
+
+    Returns:
+        マニフェストの辞書
+    """
+    directory = Path(directory)
+    files = {}
+    for rel_path, file_path, stat_result in _walk_files(directory):
+        try:
+            files[rel_path] = _file_entry(file_path, stat_result)
+        except OSError as e:
+            log_func(f"マニフェスト作成中に読み込みエラー: {rel_path} - {e}")
+
+    patients, root_hash = _build_tree(files)
+    log_func(f"マニフェスト作成完了: {len(files)}ファイル, {len(patients)}患者")
+
+    return {
+        "version": MANIFEST_VERSION,
+        "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "root": str(directory),
+        "root_hash": root_hash,
+        "files": files,
+        "patients": patients
+    }
+
+
+def verify_manifest(directory, manifest, full=False, log_func=print):
+    """
+    マニフェストに対してディレクトリを再検証
+
+    stat情報（サイズ・更新時刻）が変化したファイルのみ再ハッシュし、
+    それらを含むシリーズの部分木だけを再計算する。
+
+    Args:
+        directory: 再検証するディレクトリ
+        manifest: build_manifestで作成したマニフェスト
+        full: Trueの場合はstat情報に関係なく全ファイルを再ハッシュ
+        log_func: ログ出力関数
+
+    Returns:
+        再検証結果を含む辞書
+    """
+    directory = Path(directory)
+    old_files = manifest.get("files", {})
+    new_files = {}
+    dirty_series = set()
+    rehashed = 0
+
+    for rel_path, file_path, stat_result in _walk_files(directory):
+        old_entry = old_files.get(rel_path)
+        if (not full and old_entry
+                and old_entry["size"] == stat_result.st_size
+                and old_entry["mtime_ns"] == stat_result.st_mtime_ns):
+            new_files[rel_path] = old_entry
+            continue
+
+        try:
+            entry = _file_entry(file_path, stat_result)
+        except OSError as e:
+            log_func(f"再検証中に読み込みエラー: {rel_path} - {e}")
+            continue
+        rehashed += 1
+        new_files[rel_path] = entry
+        dirty_series.add(_series_key(entry))
+        if old_entry:
+            dirty_series.add(_series_key(old_entry))
+
+    # 削除されたファイルのシリーズも再計算対象
+    removed_files = sorted(set(old_files) - set(new_files))
+    for rel_path in removed_files:
+        dirty_series.add(_series_key(old_files[rel_path]))
+
+    patients, root_hash = _build_tree(new_files, dirty_series, manifest.get("patients"))
+
+    # 再計算したシリーズに属するファイルを収集
+    dirty_files = {}
+    if dirty_series:
+        for files in (old_files, new_files):
+            for rel_path, entry in files.items():
+                key = _series_key(entry)
+                if key in dirty_series:
+                    dirty_files.setdefault(key, set()).add(rel_path)
+
+    # 変化したシリーズを特定
+    old_patients = manifest.get("patients", {})
+    changed_series = []
+    for key in sorted(dirty_series):
+        patient, study, series = key
+        old_hash = (old_patients.get(patient, {}).get("studies", {})
+                    .get(study, {}).get("series", {}).get(series))
+        new_hash = (patients.get(patient, {}).get("studies", {})
+                    .get(study, {}).get("series", {}).get(series))
+        if old_hash == new_hash:
+            continue
+
+        series_files = dirty_files.get(key, set())
+        changed_series.append({
+            "patient": patient,
+            "study": study,
+            "series": series,
+            "status": "追加" if old_hash is None else "削除" if new_hash is None else "変更",
+            "added": sorted(p for p in series_files if p not in old_files),
+            "removed": sorted(p for p in series_files if p not in new_files),
+            "modified": sorted(p for p in series_files
+                               if p in old_files and p in new_files
+                               and old_files[p]["hash"] != new_files[p]["hash"])
+        })
+
+    result = {
+        "match": root_hash == manifest.get("root_hash"),
+        "root_hash": root_hash,
+        "expected_root_hash": manifest.get("root_hash"),
+        "total_files": len(new_files),
+        "rehashed_files": rehashed,
+        "removed_files": removed_files,
+        "changed_series": changed_series
+    }
+
+    if result["match"]:
+        log_func(f"✅ マニフェスト一致: {len(new_files)}ファイル（再ハッシュ {rehashed}件）")
+    else:
+        log_func(f"⚠️ マニフェスト不一致: {len(changed_series)}シリーズに差異があります")
+        for series in changed_series:
+            log_func(f"  {series['status']}: 患者 {series['patient']} / "
+                     f"スタディ {series['study']} / シリーズ {series['series']} "
+                     f"(追加 {len(series['added'])}, 削除 {len(series['removed'])}, "
+                     f"変更 {len(series['modified'])})")
+
+    return result
+
+
+def save_manifest(manifest, manifest_path):
+    """
+    マニフェストをJSONファイルに保存
+
+    Args:
+        manifest: マニフェストの辞書
+        manifest_path: 保存先のパス
+
+    Returns:
+        保存したファイルのパス
+    """
+    manifest_path = Path(manifest_path)
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    return manifest_path
+
+
+def load_manifest(manifest_path):
+    """
+    JSONファイルからマニフェストを読み込む
+
+    Args:
+        manifest_path: マニフェストファイルのパス
+
+    Returns:
+        マニフェストの辞書
+    """
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"未対応のマニフェスト形式です: {manifest.get('version')}")
+    return manifest
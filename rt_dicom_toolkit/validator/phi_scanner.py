@@ -0,0 +1,147 @@
+"""
+匿名化データセット内の残留個人情報（PHI）を検出するモジュール
+
+原本の患者名・患者ID・生年月日・医師名などをAho-Corasickオートマトンに
+まとめてコンパイルし、匿名化データセットの全文字列要素（シーケンス内・
+プライベートタグを含む）を1パスで照合する。照合コストはデータセットの
+サイズに比例し、パターン数には依存しない。
+"""
+
+from collections import deque
+
+from ..utils.phi_utils import collect_phi_values, iter_text_elements, normalize_phi_text
+
+
+class AhoCorasickMatcher:
+    """複数パターンを同時に照合するAho-Corasickオートマトン"""
+
+    def __init__(self, patterns):
+        """
+        オートマトンを構築
+
+        Args:
+            patterns: パターン文字列をキー、照合時に返す付加情報を値とする辞書
+        """
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+
+        for pattern, payload in patterns.items():
+            if pattern:
+                self._add_pattern(pattern, payload)
+        self._build_failure_links()
+
+    def _add_pattern(self, pattern, payload):
+        """トライ木にパターンを追加"""
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((pattern, payload))
+
+    def _build_failure_links(self):
+        """幅優先探索で失敗遷移を構築"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                if self._fail[next_state] == next_state:
+                    self._fail[next_state] = 0
+                self._output[next_state] = (self._output[next_state]
+                                            + self._output[self._fail[next_state]])
+
+    def finditer(self, text):
+        """
+        テキスト中のパターン出現を列挙
+
+        Args:
+            text: 照合するテキスト
+
+        Yields:
+            (開始位置, 終了位置, パターン, 付加情報) のタプル
+        """
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern, payload in output[state]:
+                yield index - len(pattern) + 1, index + 1, pattern, payload
+
+
+def _is_word_boundary(text, start, end):
+    """一致箇所が単語の境界にあるか確認（部分文字列による誤検出を防ぐ）"""
+    before = text[start - 1] if start > 0 else " "
+    after = text[end] if end < len(text) else " "
+    return not before.isalnum() and not after.isalnum()
+
+
+class ResidualPHIScanner:
+    """患者ごとにコンパイルしたオートマトンで残留PHIを検出するクラス"""
+
+    def __init__(self, source_tags=None):
+        """
+        初期化
+
+        Args:
+            source_tags: 原本から照合パターンを収集するタグ名のリスト（省略時は既定）
+        """
+        self.source_tags = source_tags
+        self._patterns = {}
+        self._matchers = {}
+
+    def _get_matcher(self, original_dcm):
+        """原本の患者に対応するオートマトンを取得（新しいパターンがある場合のみ再構築）"""
+        patient_key = str(getattr(original_dcm, 'PatientID', "") or "")
+        patterns = self._patterns.setdefault(patient_key, {})
+
+        new_values = collect_phi_values(original_dcm, self.source_tags)
+        if patient_key in self._matchers and all(value in patterns for value in new_values):
+            return self._matchers[patient_key]
+
+        for value, tag in new_values.items():
+            patterns.setdefault(value, tag)
+        self._matchers[patient_key] = AhoCorasickMatcher(patterns)
+        return self._matchers[patient_key]
+
+    def scan(self, original_dcm, anonymized_dcm):
+        """
+        匿名化データセットに原本のPHIが残っていないか検査
+
+        Args:
+            original_dcm: 原本のデータセット
+            anonymized_dcm: 匿名化されたデータセット
+
+        Returns:
+            検出結果のリスト
+        """
+        matcher = self._get_matcher(original_dcm)
+        leaks = []
+        for path, elem, text in iter_text_elements(anonymized_dcm):
+            normalized = normalize_phi_text(text)
+            found = set()
+            for start, end, pattern, source in matcher.finditer(normalized):
+                if source in found or not _is_word_boundary(normalized, start, end):
+                    continue
+                found.add(source)
+                leaks.append({
+                    "path": path,
+                    "tag": str(elem.tag),
+                    "private": elem.tag.is_private,
+                    "source": source
+                })
+        return leaks
@@ -24,6 +24,37 @@ def generate_summary_report(summary, rules):
     report.append(f"マッチングファイル数: {summary['matched_files']}")
     report.append("")
     
+    # 層別抽出検証の推定結果
+    sampling = summary.get('sampling_stats')
+    if sampling:
+        confidence = sampling['confidence']
+        threshold = sampling['threshold']
+        report.append(f"--- 層別抽出検証（信頼水準 {confidence:.0%}、閾値 {threshold:.0%}） ---")
+        report.append(f"層の数: {sampling['strata']}")
+        report.append(f"抽出ファイル数: {sampling['sampled_files']}/{sampling['population_files']}")
+        unverified = sampling.get('unmatched_files', 0) + sampling.get('error_files', 0)
+        if unverified:
+            report.append(f"❌ 検証できなかった抽出ファイル（不合格として集計）: {unverified} "
+                          f"(マッチなし {sampling['unmatched_files']}, 比較エラー {sampling['error_files']})")
+        if sampling['escalated_strata']:
+            report.append(f"⚠️ 全数検証に切り替えた層: {len(sampling['escalated_strata'])} "
+                          f"(追加検証 {sampling['escalated_files']}ファイル)")
+            for label in sampling['escalated_strata'][:10]:
+                report.append(f"  {label}")
+            if len(sampling['escalated_strata']) > 10:
+                report.append(f"  ...他 {len(sampling['escalated_strata']) - 10} 層")
+        else:
+            report.append("✅ 全数検証に切り替えた層: なし")
+        report.append("評価項目ごとの推定匿名化率（信頼区間）:")
+        for name, interval in sampling['tags'].items():
+            if interval['estimate'] is None:
+                continue
+            lower = interval['lower']
+            status = "✅" if lower >= threshold else "⚠️" if interval['estimate'] >= threshold else "❌"
+            report.append(f"{status} {name}: {interval['estimate']:.1%} "
+                          f"({lower:.1%} - {interval['upper']:.1%})")
+        report.append("")
+    
     # 全体の匿名化状況
     total_must_tags = len(rules.must_anonymize_tags) * summary['matched_files']
     total_anonymized = sum(summary['must_anonymize_stats'][tag]['anonymized'] for tag in rules.must_anonymize_tags)
@@ -86,6 +117,22 @@ def generate_summary_report(summary, rules):
         status = "✅" if rate >= 95 else "⚠️" if rate >= 80 else "❌"
         report.append(f"{status} プライベートタグ削除: {removed}/{total} ({rate:.1f}%)")
     
+    # 残留PHIスキャン
+    leak_stats = summary.get('phi_leak_stats')
+    if leak_stats and leak_stats['clean'] + leak_stats['leaked'] > 0:
+        report.append("")
+        report.append("--- 残留PHIスキャン（全文字列要素） ---")
+        total = leak_stats['clean'] + leak_stats['leaked']
+        if leak_stats['leaked'] == 0:
+            report.append(f"✅ 残留PHIなし: {total}ファイル")
+        else:
+            report.append(f"❌ 残留PHIあり: {leak_stats['leaked']}/{total}ファイル")
+            for source, count in sorted(leak_stats['by_source'].items(), key=lambda x: -x[1]):
+                report.append(f"  原本の{source}: {count}箇所")
+            report.append("  検出された要素（上位10件）:")
+            for path, count in sorted(leak_stats['by_element'].items(), key=lambda x: -x[1])[:10]:
+                report.append(f"    {path}: {count}箇所")
+    
     # モダリティ分布
     report.append("")
     report.append("--- モダリティ分布 ---")
@@ -112,6 +159,45 @@ def generate_summary_report(summary, rules):
     
     return "\n".join(report)
 
+def generate_bloom_report(summary):
+    """
+    PHIフィルタによる検証結果のレポートを生成
+    
+    Args:
+        summary: RTDicomValidator.validate_with_bloom_filterの集計情報
+        
+    Returns:
+        生成されたレポートテキスト
+    """
+    report = []
+    
+    report.append("=== PHIフィルタによる残留PHI検証レポート ===")
+    report.append(f"検証日時: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    report.append(f"総ファイル数: {summary['total_files']}")
+    report.append(f"検証ファイル数: {summary['checked_files']}")
+    report.append(f"照合トークン数: {summary['token_checks']}")
+    report.append(f"フィルタ登録トークン数: {summary['phi_token_count']} (偽陽性率 {summary['error_rate']:.2%}/トークン)")
+    report.append("")
+    
+    leaked_files = summary['leaked_files']
+    if not leaked_files:
+        report.append("✅ 残留PHIの疑いなし")
+    else:
+        report.append(f"❌ 残留PHIの疑い: {len(leaked_files)}/{summary['checked_files']}ファイル")
+        report.append("※ Bloomフィルタの性質上、一致には偽陽性が含まれる可能性があります")
+        report.append("")
+        report.append("--- 検出された要素 ---")
+        for path, count in sorted(summary['by_element'].items(), key=lambda x: -x[1]):
+            report.append(f"{path}: {count}ファイル")
+        report.append("")
+        report.append("--- 該当ファイル （最大20件表示） ---")
+        for rel_path in leaked_files[:20]:
+            report.append(rel_path)
+        if len(leaked_files) > 20:
+            report.append(f"...他 {len(leaked_files) - 20} 件")
+    
+    return "\n".join(report)
+
 def generate_validation_report_filename(prefix="validation_summary"):
     """
     レポートのファイル名を生成
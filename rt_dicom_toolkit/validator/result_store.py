@@ -0,0 +1,256 @@
+"""
+詳細な検証結果を列指向で保存・照会するモジュール
+
+検証バッチごとに1つの.npzチャンクを追記する。タグの値はチャンク単位の
+辞書で符号化し、状態は状態コード（int8）の行列として保存する。照会は
+チャンクを1つずつ読み込むため、結果全体をメモリに載せる必要がない。
+チャンクは一時ファイルに書き込んでから連番のファイル名（chunk_00000.npz）に置き換え、
+照会側はファイル名からチャンクを探す。メタデータ（meta.json）にはタグなどの固定の情報と
+検証が完了したかだけを書き込むため、チャンクの追記ごとに書き直す必要がなく、検証が
+途中で失敗した場合も書き込み済みのチャンクを照会できる。
+"""
+
+import os
+import json
+from pathlib import Path
+
+import numpy as np
+
+from .columnar import STATUS_LABELS, CATEGORIES
+
+# 結果ストアの形式バージョン（1はmeta.jsonにチャンクの一覧を持つ形式）
+RESULT_STORE_VERSION = 2
+SUPPORTED_VERSIONS = (1, RESULT_STORE_VERSION)
+
+# メタデータファイル名
+META_FILENAME = "meta.json"
+
+# チャンクのファイル名（連番の順に読み込む）
+CHUNK_PATTERN = "chunk_*.npz"
+
+# ピクセルデータ比較結果のコード
+PIXEL_NOT_COMPARED = -1
+PIXEL_MISMATCH = 0
+PIXEL_MATCH = 1
+
+
+class ResultStoreWriter:
+    """検証結果をチャンク単位で追記するクラス"""
+
+    def __init__(self, store_dir, comparator):
+        """
+        初期化
+
+        Args:
+            store_dir: 結果ストアのディレクトリ
+            comparator: ColumnarTagComparatorインスタンス
+        """
+        self.store_dir = Path(store_dir)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.comparator = comparator
+        self.chunk_count = 0
+        self.file_count = 0
+        # 同じディレクトリに以前のチャンクが残っている場合は、照会時に混ざらないよう削除
+        for stale_chunk in self.store_dir.glob(CHUNK_PATTERN):
+            stale_chunk.unlink()
+        self._write_meta(complete=False)
+
+    def append(self, batch, pairs, contents):
+        """
+        1バッチ分の検証結果をチャンクとして書き込む
+
+        Args:
+            batch: TagComparisonBatchインスタンス
+            pairs: バッチの各行に対応する (原本ファイル, 匿名化ファイル, 相対パス) のリスト
+            contents: バッチの各行に対応するルールタグ以外の比較結果のリスト
+        """
+        count = len(batch)
+        if count == 0:
+            return
+
+        # タグの値をチャンク内の辞書で符号化
+        values = np.concatenate([batch.original.ravel(), batch.anonymized.ravel()])
+        dictionary, codes = np.unique(values, return_inverse=True)
+        codes = codes.astype(np.int32).reshape((2,) + batch.original.shape)
+
+        pixel_match = np.full(count, PIXEL_NOT_COMPARED, dtype=np.int8)
+        leak_rows, leak_paths, leak_sources = [], [], []
+        for row, content in enumerate(contents):
+            if content["pixel_data"]["original_shape"] is not None:
+                pixel_match[row] = PIXEL_MATCH if content["pixel_data"]["match"] else PIXEL_MISMATCH
+            for leak in content["phi_leaks"]:
+                leak_rows.append(row)
+                leak_paths.append(leak["path"])
+                leak_sources.append(leak["source"])
+
+        # 照会側が書き込み途中のチャンクを読まないよう、一時ファイルから置き換える
+        chunk_path = self.store_dir / f"chunk_{self.chunk_count:05d}.npz"
+        temp_path = chunk_path.with_name(chunk_path.name + ".part")
+        with open(temp_path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                original_file=np.array([str(pair[0]) for pair in pairs], dtype=str),
+                anonymized_file=np.array([str(pair[1]) for pair in pairs], dtype=str),
+                status=batch.status,
+                dictionary=dictionary,
+                original_codes=codes[0],
+                anonymized_codes=codes[1],
+                private_original=np.array([c["private_tags"]["original_count"] for c in contents], dtype=np.int32),
+                private_anonymized=np.array([c["private_tags"]["anonymized_count"] for c in contents], dtype=np.int32),
+                pixel_match=pixel_match,
+                leak_row=np.array(leak_rows, dtype=np.int32),
+                leak_path=np.array(leak_paths, dtype=str),
+                leak_source=np.array(leak_sources, dtype=str)
+            )
+        os.replace(temp_path, chunk_path)
+        self.chunk_count += 1
+        self.file_count += count
+
+    def _write_meta(self, complete):
+        """メタデータを一時ファイルに書き込んでから置き換える（読み込み側が書き込み途中のファイルを読まないように）"""
+        meta = {
+            "version": RESULT_STORE_VERSION,
+            "tags": self.comparator.tags,
+            "categories": {category: self.comparator.category_tags[category] for category, _ in CATEGORIES},
+            "status_labels": list(STATUS_LABELS),
+            # Falseの場合は検証が途中で終了した（書き込み済みのチャンクのみ）
+            "complete": complete
+        }
+        if complete:
+            meta["file_count"] = self.file_count
+        temp_path = self.store_dir / (META_FILENAME + ".part")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.store_dir / META_FILENAME)
+
+    def close(self):
+        """
+        メタデータを書き込んでストアを確定
+
+        Returns:
+            結果ストアのディレクトリ
+        """
+        self._write_meta(complete=True)
+        return self.store_dir
+
+
+class ResultStore:
+    """保存された検証結果を照会するクラス"""
+
+    def __init__(self, store_dir):
+        """
+        初期化
+
+        Args:
+            store_dir: 結果ストアのディレクトリ
+        """
+        self.store_dir = Path(store_dir)
+        with open(self.store_dir / META_FILENAME, 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") not in SUPPORTED_VERSIONS:
+            raise ValueError(f"未対応の結果ストア形式です: {self.meta.get('version')}")
+        self.tags = self.meta["tags"]
+        self.index = {tag: i for i, tag in enumerate(self.tags)}
+        self.status_labels = self.meta["status_labels"]
+        if "chunks" in self.meta:
+            self.chunks = self.meta["chunks"]
+        else:
+            self.chunks = sorted(path.name for path in self.store_dir.glob(CHUNK_PATTERN))
+
+    def __len__(self):
+        if "file_count" in self.meta:
+            return self.meta["file_count"]
+        # 途中で終了した検証では、書き込み済みのチャンクの行数を数える
+        return sum(len(chunk["anonymized_file"]) for chunk in self.iter_chunks())
+
+    def iter_chunks(self):
+        """
+        チャンクを1つずつ読み込む
+
+        Yields:
+            np.loadで開いたチャンク（配列はアクセス時に読み込まれる）
+        """
+        for chunk_name in self.chunks:
+            with np.load(self.store_dir / chunk_name, allow_pickle=False) as chunk:
+                yield chunk
+
+    def _column(self, tag):
+        if tag not in self.index:
+            raise KeyError(f"結果ストアに存在しないタグです: {tag}")
+        return self.index[tag]
+
+    def find_files(self, tag, status):
+        """
+        指定したタグが指定した状態のファイルを列挙
+
+        Args:
+            tag: タグ名（例: 'PatientName'）
+            status: 状態ラベル（例: '未変更'）
+
+        Yields:
+            匿名化ファイルのパス文字列
+        """
+        column = self._column(tag)
+        code = self.status_labels.index(status)
+        for chunk in self.iter_chunks():
+            mask = chunk["status"][:, column] == code
+            if mask.any():
+                yield from chunk["anonymized_file"][mask].tolist()
+
+    def status_counts(self, tag):
+        """
+        指定したタグの状態ごとのファイル数を集計
+
+        Args:
+            tag: タグ名
+
+        Returns:
+            状態ラベルをキー、ファイル数を値とする辞書
+        """
+        column = self._column(tag)
+        counts = np.zeros(len(self.status_labels), dtype=np.int64)
+        for chunk in self.iter_chunks():
+            counts += np.bincount(chunk["status"][:, column], minlength=len(self.status_labels))
+        return {label: int(count) for label, count in zip(self.status_labels, counts) if count}
+
+    def find_leaked_files(self):
+        """
+        残留PHIが検出されたファイルを列挙
+
+        Yields:
+            (匿名化ファイルのパス文字列, 要素のパス, 取得元タグ) のタプル
+        """
+        for chunk in self.iter_chunks():
+            anonymized_files = chunk["anonymized_file"].tolist()
+            for row, path, source in zip(chunk["leak_row"].tolist(), chunk["leak_path"].tolist(),
+                                         chunk["leak_source"].tolist()):
+                yield anonymized_files[row], path, source
+
+    def file_values(self, anonymized_file):
+        """
+        1ファイル分のタグの値と状態を取得
+
+        Args:
+            anonymized_file: 匿名化ファイルのパス
+
+        Returns:
+            タグ名をキーとする {original, anonymized, status} の辞書、見つからない場合はNone
+        """
+        for chunk in self.iter_chunks():
+            rows = np.flatnonzero(chunk["anonymized_file"] == str(anonymized_file))
+            if rows.size == 0:
+                continue
+            row = rows[0]
+            dictionary = chunk["dictionary"]
+            original = dictionary[chunk["original_codes"][row]].tolist()
+            anonymized = dictionary[chunk["anonymized_codes"][row]].tolist()
+            status = chunk["status"][row].tolist()
+            return {
+                tag: {
+                    "original": original[i],
+                    "anonymized": anonymized[i],
+                    "status": self.status_labels[status[i]]
+                }
+                for i, tag in enumerate(self.tags)
+            }
+        return None
@@ -0,0 +1,226 @@
+"""
+層別無作為抽出による匿名化検証の統計処理を提供するモジュール
+
+スキャン索引のファイルをモダリティ・患者・シリーズで層に分け、各層から
+「抽出したファイルがすべて合格なら、層の匿名化率の下側信頼限界が閾値以上」
+となる最小のファイル数を抽出する。下側信頼限界は有限母集団（超幾何分布）に
+基づく正確な値で、不合格が見つかり閾値を下回った層だけを全数検証に切り替える。
+"""
+
+import math
+import random
+from statistics import NormalDist
+
+# 索引に値がない場合に使用する層の値
+UNKNOWN_STRATUM_VALUE = "不明"
+
+# ルールタグ以外の評価項目（残留PHIが検出されなかったファイルを合格とする）
+PHI_LEAK_METRIC = "残留PHIなし"
+
+
+def stratum_key(record):
+    """
+    スキャン索引の情報から層のキーを生成
+
+    Args:
+        record: scan_dicom_filesが返す索引情報
+
+    Returns:
+        (モダリティ, 患者ID, シリーズUID) のタプル
+    """
+    return (record["modality"] or UNKNOWN_STRATUM_VALUE,
+            record["patient_id"] or UNKNOWN_STRATUM_VALUE,
+            record["series_uid"] or UNKNOWN_STRATUM_VALUE)
+
+
+def stratum_label(key):
+    """
+    ログやレポートに表示する層の名前を生成（患者IDは一部をマスク）
+
+    Args:
+        key: stratum_keyが返す層のキー
+
+    Returns:
+        層の表示名
+    """
+    modality, patient_id, series_uid = key
+    masked_id = patient_id[:2] + "***" + patient_id[-2:] if len(patient_id) > 4 else "***"
+    return f"{modality} / 患者 {masked_id} / シリーズ ...{series_uid[-12:]}"
+
+
+def group_strata(records):
+    """
+    スキャン索引の情報を層ごとにまとめる
+
+    Args:
+        records: scan_dicom_filesが返す索引情報のリスト
+
+    Returns:
+        層のキーをキー、索引情報のリストを値とする辞書
+    """
+    strata = {}
+    for record in records:
+        strata.setdefault(stratum_key(record), []).append(record)
+    return strata
+
+
+def _zero_failure_probability(population, defects, sample_size):
+    """不合格がdefects件ある母集団から不合格を1件も引かない確率"""
+    if defects + sample_size > population:
+        return 0.0
+    probability = 1.0
+    for i in range(sample_size):
+        probability *= (population - defects - i) / (population - i)
+    return probability
+
+
+def _hypergeometric_cdf(failures, population, defects, sample_size):
+    """超幾何分布で不合格がfailures件以下となる確率"""
+    total = math.lgamma(population + 1) - math.lgamma(sample_size + 1) - math.lgamma(population - sample_size + 1)
+    probability = 0.0
+    for k in range(max(0, sample_size - (population - defects)), min(failures, defects) + 1):
+        log_p = (math.lgamma(defects + 1) - math.lgamma(k + 1) - math.lgamma(defects - k + 1)
+                 + math.lgamma(population - defects + 1) - math.lgamma(sample_size - k + 1)
+                 - math.lgamma(population - defects - sample_size + k + 1)
+                 - total)
+        probability += math.exp(log_p)
+    return probability
+
+
+def lower_confidence_bound(population, sample_size, failures, confidence=0.95):
+    """
+    層の合格率の片側下側信頼限界を超幾何分布から正確に計算
+
+    Args:
+        population: 層のファイル数
+        sample_size: 検証したファイル数
+        failures: 検証で不合格だったファイル数
+        confidence: 信頼水準
+
+    Returns:
+        合格率の下側信頼限界（0〜1）
+    """
+    if population <= 0:
+        return 1.0
+    if sample_size >= population:
+        return (population - failures) / population
+
+    alpha = 1 - confidence
+    # 観測結果と矛盾しない（棄却されない）最大の不合格数を探す
+    max_defects = failures
+    for defects in range(failures + 1, population - (sample_size - failures) + 1):
+        if _hypergeometric_cdf(failures, population, defects, sample_size) <= alpha:
+            break
+        max_defects = defects
+    else:
+        max_defects = population - (sample_size - failures)
+    return 1 - max_defects / population
+
+
+def required_sample_size(population, threshold=0.95, confidence=0.95):
+    """
+    全件合格なら下側信頼限界が閾値以上になる最小の抽出数を計算
+
+    Args:
+        population: 層のファイル数
+        threshold: 合格率の閾値
+        confidence: 信頼水準
+
+    Returns:
+        抽出するファイル数（層のファイル数以下）
+    """
+    # 閾値を満たさなくなる最小の不合格数を、不合格0件の観測で棄却できればよい
+    defects = math.floor(population * (1 - threshold)) + 1
+    alpha = 1 - confidence
+    for sample_size in range(1, population + 1):
+        if _zero_failure_probability(population, defects, sample_size) <= alpha:
+            return sample_size
+    return population
+
+
+def draw_stratified_sample(strata, threshold=0.95, confidence=0.95, seed=None):
+    """
+    各層から必要数のファイルを無作為に抽出
+
+    Args:
+        strata: group_strataが返す層ごとの索引情報
+        threshold: 合格率の閾値
+        confidence: 信頼水準
+        seed: 乱数のシード（再現性が必要な場合に指定）
+
+    Returns:
+        層のキーをキー、抽出した索引情報のリストを値とする辞書
+    """
+    rng = random.Random(seed)
+    sizes = {}
+    sample = {}
+    for key, records in strata.items():
+        population = len(records)
+        if population not in sizes:
+            sizes[population] = required_sample_size(population, threshold, confidence)
+        sample[key] = rng.sample(records, sizes[population])
+    return sample
+
+
+def _wilson_interval(rate, effective_size, confidence):
+    """Wilsonのスコア区間"""
+    if effective_size <= 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(1 - (1 - confidence) / 2)
+    denominator = 1 + z * z / effective_size
+    center = (rate + z * z / (2 * effective_size)) / denominator
+    margin = z * math.sqrt(rate * (1 - rate) / effective_size + z * z / (4 * effective_size ** 2)) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def stratified_interval(strata_counts, confidence=0.95):
+    """
+    層別抽出の結果から母集団全体の合格率と信頼区間を推定
+
+    全数検証した層はそのまま合算し、抽出検証した層は層の大きさで重み付けした
+    推定値の分散（有限母集団修正を含む）から有効サンプルサイズを求めて
+    Wilsonのスコア区間を計算する。
+
+    Args:
+        strata_counts: (層のファイル数, 検証したファイル数, 合格したファイル数) のリスト
+        confidence: 信頼水準
+
+    Returns:
+        (推定値, 下限, 上限) のタプル
+    """
+    strata_counts = [counts for counts in strata_counts if counts[1] > 0]
+    population = sum(counts[0] for counts in strata_counts)
+    if population == 0:
+        return None, None, None
+
+    census_passed = 0
+    sampled_population = 0
+    sampled_size = 0
+    weighted_rate = 0.0
+    variance = 0.0
+    for stratum_population, sample_size, passed in strata_counts:
+        if sample_size >= stratum_population:
+            census_passed += passed
+            continue
+        rate = passed / sample_size
+        sampled_population += stratum_population
+        sampled_size += sample_size
+        weighted_rate += stratum_population * rate
+        variance += (stratum_population ** 2 * (1 - sample_size / stratum_population)
+                     * rate * (1 - rate) / max(sample_size - 1, 1))
+
+    if sampled_population == 0:
+        rate = census_passed / population
+        return rate, rate, rate
+
+    rate = weighted_rate / sampled_population
+    variance /= sampled_population ** 2
+    if variance > 0:
+        effective_size = rate * (1 - rate) / variance
+    else:
+        # 抽出した層がすべて同じ結果の場合は有限母集団修正のみを考慮
+        effective_size = sampled_size / max(1 - sampled_size / sampled_population, 1e-9)
+    lower, upper = _wilson_interval(rate, effective_size, confidence)
+
+    return tuple((census_passed + sampled_population * value) / population
+                 for value in (rate, lower, upper))
@@ -13,11 +13,12 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from rt_dicom_toolkit.anonymizer.core import RTDicomAnonymizer
-from rt_dicom_toolkit.config import DEFAULT_INPUT_DIR, DEFAULT_ANONYMOUS_DIR, DEFAULT_LOG_DIR
+from rt_dicom_toolkit.config import DEFAULT_INPUT_DIR, DEFAULT_ANONYMOUS_DIR, DEFAULT_LOG_DIR, ensure_default_directories
 
 def main():
     """匿名化処理を実行"""
     print("匿名化処理を開始します...")
+    ensure_default_directories()
     
     # 匿名化ツールのインスタンスを作成
     anonymizer = RTDicomAnonymizer()
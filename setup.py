@@ -14,6 +14,10 @@ setup(
         "matplotlib",
         "pandas",
     ],
+    extras_require={
+        # DICOM受信（C-STORE SCP）
+        'network': ["pynetdicom"],
+    },
     entry_points={
         'console_scripts': [
             'rt-anonymizer=rt_dicom_toolkit.cli:run_anonymizer_cli',